@@ -0,0 +1,159 @@
+import hashlib
+import math
+import time
+import zlib
+from collections import Counter
+from typing import Dict, List, Tuple
+
+
+class QueryStats:
+    """
+    Qidiruv so'rovlari statistikasi.
+    So'rovlar xotirada yig'iladi va bazaga to'plab (batch) yoziladi.
+    """
+
+    def __init__(self, max_pending: int = 1000):
+        self.max_pending = max_pending
+        # so'rov -> [soni, natijasiz soni, oxirgi natijalar soni, oxirgi vaqt]
+        self._pending: Dict[str, List[int]] = {}
+
+    def __len__(self) -> int:
+        return len(self._pending)
+
+    def record(self, query: str, results: int) -> bool:
+        """So'rovni hisobga olish; bazaga yozish vaqti kelgan bo'lsa True"""
+        if not query:
+            return False
+        item = self._pending.get(query)
+        if item is None:
+            item = self._pending[query] = [0, 0, 0, 0]
+        item[0] += 1
+        if not results:
+            item[1] += 1
+        item[2] = results
+        item[3] = int(time.time())
+        return len(self._pending) >= self.max_pending
+
+    def drain(self) -> List[Tuple[str, int, int, int, int]]:
+        """Yig'ilganlarni olish va tozalash: (so'rov, soni, natijasiz, natijalar, vaqt)"""
+        pending, self._pending = self._pending, {}
+        return [(query, *item) for query, item in pending.items()]
+
+
+def current_hour() -> int:
+    """Joriy soat raqami (epoch / 3600)"""
+    return int(time.time() // 3600)
+
+
+class ViewBuckets:
+    """
+    Kinolarning soatlik ko'rishlari (xotirada yig'iladi, bazaga to'plab yoziladi).
+    Trend hisoblash uchun.
+    """
+
+    def __init__(self):
+        # (kod, soat) -> ko'rishlar
+        self._pending: Dict[Tuple[str, int], int] = {}
+
+    def __len__(self) -> int:
+        return len(self._pending)
+
+    def record(self, code: str, hour: int = None):
+        key = (code, current_hour() if hour is None else hour)
+        self._pending[key] = self._pending.get(key, 0) + 1
+
+    def drain(self) -> List[Tuple[str, int, int]]:
+        """Yig'ilganlarni olish va tozalash: (kod, soat, ko'rishlar)"""
+        pending, self._pending = self._pending, {}
+        return [(code, hour, views) for (code, hour), views in pending.items()]
+
+
+def decayed_scores(buckets: List[Tuple[str, int, int]], now_hour: int, half_life: float) -> Dict[str, float]:
+    """
+    Trend balli: har bir soatlik ko'rish eksponensial so'nadi
+    (half_life soatdan keyin og'irligi yarmiga tushadi).
+    """
+    scores: Dict[str, float] = {}
+    for code, hour, views in buckets:
+        weight = 0.5 ** (max(0, now_hour - hour) / half_life)
+        scores[code] = scores.get(code, 0.0) + views * weight
+    return scores
+
+
+def current_day() -> int:
+    """Joriy kun raqami (epoch / 86400, UTC)"""
+    return int(time.time() // 86400)
+
+
+class HyperLogLog:
+    """
+    Noyob elementlar sonini taxminiy hisoblash (2^p bayt, xato ~1.04/sqrt(2^p)).
+    p=12 da 4 KB va ~1.6% xato. Sketchlar max bilan birlashtiriladi, shuning
+    uchun bir nechta bot nusxasi yozganda ham ma'lumot yo'qolmaydi.
+    """
+
+    def __init__(self, p: int = 12, registers: bytes = None):
+        self.p = p
+        self.m = 1 << p
+        self.registers = bytearray(registers) if registers is not None else bytearray(self.m)
+
+    def add(self, item) -> bool:
+        """Element qo'shish; sketch o'zgargan bo'lsa True"""
+        h = int.from_bytes(hashlib.blake2b(str(item).encode(), digest_size=8).digest(), 'big')
+        index = h >> (64 - self.p)
+        rest = h & ((1 << (64 - self.p)) - 1)
+        rank = (64 - self.p) - rest.bit_length() + 1
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+            return True
+        return False
+
+    def merge(self, other: 'HyperLogLog'):
+        self.registers = bytearray(map(max, self.registers, other.registers))
+
+    def count(self) -> int:
+        counts = Counter(self.registers)
+        total = sum(n * 2.0 ** -rank for rank, n in counts.items())
+        alpha = 0.7213 / (1 + 1.079 / self.m)
+        estimate = alpha * self.m * self.m / total
+        zeros = counts.get(0, 0)
+        # Kichik sonlarda chiziqli hisoblash aniqroq
+        if estimate <= 2.5 * self.m and zeros:
+            estimate = self.m * math.log(self.m / zeros)
+        return int(round(estimate))
+
+    def to_bytes(self) -> bytes:
+        """Bazaga yozish uchun (bo'sh registrlar yaxshi siqiladi)"""
+        return zlib.compress(bytes(self.registers))
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> 'HyperLogLog':
+        registers = zlib.decompress(data)
+        return cls(int(math.log2(len(registers))), registers)
+
+
+class ViewerSketches:
+    """
+    Kinolarning kunlik noyob tomoshabinlari (HyperLogLog).
+    Xotirada faqat oxirgi yozishdan keyingi o'zgarishlar turadi;
+    bazadagi sketch bilan yozish paytida birlashtiriladi.
+    """
+
+    def __init__(self, p: int = 12):
+        self.p = p
+        self._pending: Dict[Tuple[str, int], HyperLogLog] = {}
+
+    def __len__(self) -> int:
+        return len(self._pending)
+
+    def add(self, code: str, user_id: int, day: int = None):
+        key = (code, current_day() if day is None else day)
+        sketch = self._pending.get(key)
+        if sketch is None:
+            sketch = self._pending[key] = HyperLogLog(self.p)
+        sketch.add(user_id)
+
+    def drain(self) -> List[Tuple[str, int, HyperLogLog]]:
+        """Yig'ilganlarni olish va tozalash: (kod, kun, sketch)"""
+        pending, self._pending = self._pending, {}
+        return [(code, day, sketch) for (code, day), sketch in pending.items()]
@@ -0,0 +1,306 @@
+import asyncio
+import json
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Any, Optional, Tuple
+from urllib.parse import urlparse
+
+
+def token_bucket(value: Optional[str], now: float, rate: float, burst: int) -> Tuple[str, float]:
+    """
+    Token bucket qadami: saqlangan "tokenlar vaqt" qiymati bo'yicha bitta token olish.
+    Natija: (yangi qiymat, kutish vaqti - token olinsa 0)
+    """
+    tokens = float(burst)
+    parts = value.split() if value else ()
+    if len(parts) == 2:
+        tokens = min(burst, float(parts[0]) + (now - float(parts[1])) * rate)
+    delay = 0.0
+    if tokens >= 1:
+        tokens -= 1
+    else:
+        delay = (1 - tokens) / rate
+    return f'{tokens:.6f} {now:.6f}', delay
+
+
+# token_bucket ning Redisdagi varianti - o'qish va yozish bitta atomar skriptda
+TOKEN_BUCKET_LUA = '''
+local now = redis.call('TIME')
+now = tonumber(now[1]) + tonumber(now[2]) / 1000000
+local rate, burst = tonumber(ARGV[1]), tonumber(ARGV[2])
+local tokens = burst
+local value = redis.call('GET', KEYS[1])
+if value then
+    local saved, at = string.match(value, '^(%S+) (%S+)$')
+    if saved then
+        tokens = math.min(burst, tonumber(saved) + (now - tonumber(at)) * rate)
+    end
+end
+local delay = 0
+if tokens >= 1 then
+    tokens = tokens - 1
+else
+    delay = (1 - tokens) / rate
+end
+redis.call('SET', KEYS[1], string.format('%.6f %.6f', tokens, now), 'EX', ARGV[3])
+return tostring(delay)
+'''
+
+
+class StateBackend(ABC):
+    """
+    Umumiy holat saqlovchisi (FSM, keshlar, rate-limit).
+    Bir nechta bot nusxasi ishlaganda Redis backend orqali holat bo'lishiladi.
+    """
+
+    @abstractmethod
+    async def get(self, key: str) -> Optional[str]:
+        """Qiymatni olish"""
+
+    @abstractmethod
+    async def set(self, key: str, value: str, ttl: Optional[int] = None):
+        """Qiymatni yozish (ttl - soniyalarda)"""
+
+    @abstractmethod
+    async def add(self, key: str, value: str = '1', ttl: Optional[int] = None) -> bool:
+        """Kalit yo'q bo'lsa yozish; yozilgan bo'lsa True"""
+
+    @abstractmethod
+    async def delete(self, *keys: str):
+        """Kalitlarni o'chirish"""
+
+    @abstractmethod
+    async def incr(self, key: str, amount: int = 1, ttl: Optional[int] = None) -> int:
+        """Hisoblagichni oshirish"""
+
+    @abstractmethod
+    async def take_token(self, key: str, rate: float, burst: int, ttl: int) -> float:
+        """Token bucketdan atomar token olish; olinsa 0, aks holda kutish vaqti"""
+
+    async def close(self):
+        """Ulanishni yopish"""
+
+    async def purge_expired(self) -> int:
+        """Eskirgan kalitlarni tozalash (fon vazifasidan chaqiriladi; Redis o'zi tozalaydi)"""
+        return 0
+
+    async def get_json(self, key: str) -> Any:
+        value = await self.get(key)
+        return json.loads(value) if value is not None else None
+
+    async def set_json(self, key: str, value: Any, ttl: Optional[int] = None):
+        await self.set(key, json.dumps(value, ensure_ascii=False), ttl)
+
+
+class MemoryBackend(StateBackend):
+    """Jarayon ichidagi backend (cheklangan LRU + TTL)"""
+
+    def __init__(self, max_keys: int = 100000):
+        self.max_keys = max_keys
+        self._data: "OrderedDict[str, Tuple[str, Optional[float]]]" = OrderedDict()
+
+    def _alive(self, key: str) -> Optional[Tuple[str, Optional[float]]]:
+        item = self._data.get(key)
+        if item is None:
+            return None
+        if item[1] is not None and item[1] <= time.monotonic():
+            del self._data[key]
+            return None
+        return item
+
+    def _purge(self):
+        """Limitdan oshsa eng eski (LRU boshidagi) kalitlarni o'chirish - O(1)"""
+        while len(self._data) > self.max_keys:
+            self._data.popitem(last=False)
+
+    async def purge_expired(self) -> int:
+        now = time.monotonic()
+        expired = [k for k, (_, exp) in self._data.items() if exp is not None and exp <= now]
+        for key in expired:
+            del self._data[key]
+        return len(expired)
+
+    async def get(self, key: str) -> Optional[str]:
+        item = self._alive(key)
+        if item is None:
+            return None
+        self._data.move_to_end(key)
+        return item[0]
+
+    async def set(self, key: str, value: str, ttl: Optional[int] = None):
+        expires = time.monotonic() + ttl if ttl else None
+        self._data[key] = (value, expires)
+        self._data.move_to_end(key)
+        self._purge()
+
+    async def add(self, key: str, value: str = '1', ttl: Optional[int] = None) -> bool:
+        if self._alive(key) is not None:
+            return False
+        await self.set(key, value, ttl)
+        return True
+
+    async def delete(self, *keys: str):
+        for key in keys:
+            self._data.pop(key, None)
+
+    async def incr(self, key: str, amount: int = 1, ttl: Optional[int] = None) -> int:
+        item = self._alive(key)
+        if item is None:
+            value = amount
+            expires = time.monotonic() + ttl if ttl else None
+        else:
+            value = int(item[0]) + amount
+            expires = item[1]
+        self._data[key] = (str(value), expires)
+        self._data.move_to_end(key)
+        self._purge()
+        return value
+
+    async def take_token(self, key: str, rate: float, burst: int, ttl: int) -> float:
+        # O'qish va yozish orasida await yo'q - boshqa korutina aralasha olmaydi
+        item = self._alive(key)
+        value, delay = token_bucket(item[0] if item else None, time.monotonic(), rate, burst)
+        self._data[key] = (value, time.monotonic() + ttl)
+        self._data.move_to_end(key)
+        self._purge()
+        return delay
+
+
+class RedisError(Exception):
+    """Redis server xatosi"""
+
+
+class RedisBackend(StateBackend):
+    """
+    Redis protokoli (RESP) orqali ishlovchi backend.
+    Tashqi kutubxonasiz, bitta ulanish ustida ketma-ket buyruqlar.
+    """
+
+    def __init__(self, host: str = 'localhost', port: int = 6379, db: int = 0,
+                 password: Optional[str] = None, prefix: str = 'kino:'):
+        self.host = host
+        self.port = port
+        self.db = db
+        self.password = password
+        self.prefix = prefix
+        self._reader: Optional[asyncio.StreamReader] = None
+        self._writer: Optional[asyncio.StreamWriter] = None
+        self._lock = asyncio.Lock()
+
+    @classmethod
+    def from_url(cls, url: str, **kwargs) -> 'RedisBackend':
+        """redis://[:parol@]host:port/db"""
+        parsed = urlparse(url)
+        db_index = parsed.path.lstrip('/')
+        return cls(
+            host=parsed.hostname or 'localhost',
+            port=parsed.port or 6379,
+            db=int(db_index) if db_index else 0,
+            password=parsed.password,
+            **kwargs
+        )
+
+    @staticmethod
+    def _encode(*args) -> bytes:
+        parts = [f"*{len(args)}\r\n".encode()]
+        for arg in args:
+            data = arg if isinstance(arg, bytes) else str(arg).encode()
+            parts.append(f"${len(data)}\r\n".encode() + data + b"\r\n")
+        return b''.join(parts)
+
+    async def _read_reply(self) -> Any:
+        line = await self._reader.readline()
+        if not line:
+            raise ConnectionError("Redis ulanishi uzildi")
+        kind, payload = line[:1], line[1:-2]
+
+        if kind == b'+':
+            return payload.decode()
+        if kind == b'-':
+            raise RedisError(payload.decode())
+        if kind == b':':
+            return int(payload)
+        if kind == b'$':
+            length = int(payload)
+            if length == -1:
+                return None
+            data = await self._reader.readexactly(length + 2)
+            return data[:-2].decode()
+        if kind == b'*':
+            count = int(payload)
+            if count == -1:
+                return None
+            return [await self._read_reply() for _ in range(count)]
+        raise RedisError(f"Noma'lum javob: {line!r}")
+
+    async def _connect(self):
+        self._reader, self._writer = await asyncio.open_connection(self.host, self.port)
+        if self.password:
+            await self._send('AUTH', self.password)
+        if self.db:
+            await self._send('SELECT', self.db)
+
+    async def _send(self, *args) -> Any:
+        self._writer.write(self._encode(*args))
+        await self._writer.drain()
+        return await self._read_reply()
+
+    async def execute(self, *args) -> Any:
+        """Buyruqni bajarish (uzilsa bir marta qayta ulanadi)"""
+        async with self._lock:
+            for attempt in range(2):
+                try:
+                    if self._writer is None or self._writer.is_closing():
+                        await self._connect()
+                    return await self._send(*args)
+                except (ConnectionError, asyncio.IncompleteReadError, OSError):
+                    self._writer = None
+                    if attempt:
+                        raise
+
+    async def get(self, key: str) -> Optional[str]:
+        return await self.execute('GET', self.prefix + key)
+
+    async def set(self, key: str, value: str, ttl: Optional[int] = None):
+        if ttl:
+            await self.execute('SET', self.prefix + key, value, 'EX', int(ttl))
+        else:
+            await self.execute('SET', self.prefix + key, value)
+
+    async def add(self, key: str, value: str = '1', ttl: Optional[int] = None) -> bool:
+        if ttl:
+            reply = await self.execute('SET', self.prefix + key, value, 'NX', 'EX', int(ttl))
+        else:
+            reply = await self.execute('SET', self.prefix + key, value, 'NX')
+        return reply is not None
+
+    async def delete(self, *keys: str):
+        if keys:
+            await self.execute('DEL', *[self.prefix + k for k in keys])
+
+    async def incr(self, key: str, amount: int = 1, ttl: Optional[int] = None) -> int:
+        value = await self.execute('INCRBY', self.prefix + key, amount)
+        if ttl and value == amount:
+            await self.execute('EXPIRE', self.prefix + key, int(ttl))
+        return value
+
+    async def take_token(self, key: str, rate: float, burst: int, ttl: int) -> float:
+        reply = await self.execute('EVAL', TOKEN_BUCKET_LUA, 1, self.prefix + key, rate, burst, int(ttl))
+        return float(reply)
+
+    async def close(self):
+        if self._writer is not None:
+            self._writer.close()
+            try:
+                await self._writer.wait_closed()
+            except Exception:
+                pass
+            self._writer = None
+
+
+def create_backend(url: str = 'memory://', max_keys: int = 100000) -> StateBackend:
+    """URL bo'yicha backend yaratish: memory:// yoki redis://host:port/db"""
+    if url.startswith('redis://'):
+        return RedisBackend.from_url(url)
+    return MemoryBackend(max_keys=max_keys)
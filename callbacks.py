@@ -0,0 +1,117 @@
+import re
+from enum import Enum
+from typing import Optional
+
+from aiogram.filters.callback_data import CallbackData
+from aiogram.utils.deep_linking import decode_payload, encode_payload
+
+
+class MovieAction(str, Enum):
+    """Kino tugmalari amallari (callback ichida bitta harf)"""
+    DOWNLOAD = 'd'
+    FAV = 'f'
+    SHARE = 's'
+    RATE = 'r'
+    RATE_SET = 'v'
+    SHOW = 'm'
+    PART = 'p'
+    ALBUM = 'a'
+    BACK = 'b'
+
+
+# Kino yuboradigan (og'ir) amallar - anti-flood 'movie' sinfi bo'yicha cheklanadi
+DELIVERY_ACTIONS = {MovieAction.DOWNLOAD, MovieAction.SHOW, MovieAction.PART, MovieAction.ALBUM, MovieAction.BACK}
+
+
+class MovieCB(CallbackData, prefix='m'):
+    """Kino callback: m:<amal>:<kod>:<raqam>"""
+    action: MovieAction
+    code: str
+    num: int = 0
+
+
+class PageCB(CallbackData, prefix='p'):
+    """Sahifalash callback"""
+    page: int
+    query: str = ''
+
+
+class SearchCB(CallbackData, prefix='s'):
+    """Qidiruv sessiyasi sahifasi (natijalar serverda keshlanadi)"""
+    sid: str
+    page: int
+
+
+class TopCB(CallbackData, prefix='top'):
+    """Top kinolar turi: 'trend' - hozir trendda, 'all' - hamma vaqt, 'rating' - reyting"""
+    kind: str
+
+
+class ChannelTypeCB(CallbackData, prefix='ct'):
+    """Kanal turi callback"""
+    type: str
+
+
+class CheckSubCB(CallbackData, prefix='check_sub'):
+    """Obunani tekshirish (deep-link orqali kelgan kino kodi bilan)"""
+    payload: str = ''
+
+
+def fit_query(query: str, limit: int = 40) -> str:
+    """Qidiruv matnini callbackga sig'adigan holga keltirish"""
+    query = query.replace(':', ' ').strip()
+    return query.encode()[:limit].decode(errors='ignore')
+
+
+# Eski formatdagi tugmalar (fav_KOD, part_KOD_1, r_5_KOD ...) - yuborilgan xabarlarda qolgan
+_LEGACY_PREFIXES = [
+    ('back_to_movie_', MovieAction.BACK),
+    ('movie_', MovieAction.SHOW),
+    ('dl_', MovieAction.DOWNLOAD),
+    ('fav_', MovieAction.FAV),
+    ('share_', MovieAction.SHARE),
+    ('rate_', MovieAction.RATE),
+]
+
+
+def parse_legacy(data: str) -> Optional[MovieCB]:
+    """Eski callbackni MovieCB ga o'girish"""
+    try:
+        if data.startswith('part_'):
+            code, num = data[len('part_'):].rsplit('_', 1)
+            return MovieCB(action=MovieAction.PART, code=code, num=int(num))
+        if data.startswith('r_'):
+            _, num, code = data.split('_', 2)
+            return MovieCB(action=MovieAction.RATE_SET, code=code, num=int(num))
+    except ValueError:
+        return None
+
+    for prefix, action in _LEGACY_PREFIXES:
+        if data.startswith(prefix):
+            return MovieCB(action=action, code=data[len(prefix):])
+    return None
+
+
+# /start payload: faqat A-Z a-z 0-9 _ - va 64 belgigacha ruxsat.
+# '_' bilan boshlanadiganlari xizmat payloadlari (kino kodi emas)
+_PLAIN_PAYLOAD = re.compile(r'^[A-Za-z0-9][A-Za-z0-9_]{0,63}$')
+SUBSCRIBE_PAYLOAD = '_sub'
+
+
+def start_payload(code: str) -> str:
+    """Kino kodi -> /start payload (oddiy kod o'zicha, qolgani base64 bilan '-' prefiksida)"""
+    if _PLAIN_PAYLOAD.match(code):
+        return code
+    return '-' + encode_payload(code)
+
+
+def parse_start_payload(payload: Optional[str]) -> Optional[str]:
+    """/start payload -> kino kodi"""
+    if not payload:
+        return None
+    if payload.startswith('-'):
+        try:
+            return decode_payload(payload[1:]) or None
+        except (ValueError, UnicodeDecodeError):
+            return None
+    return payload if _PLAIN_PAYLOAD.match(payload) else None
@@ -0,0 +1,97 @@
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+from aiogram.types import InlineKeyboardMarkup
+
+from keyboards import movie_actions
+
+
+# Kino kartasidagi o'zgarmas maydonlar - ulardan biri o'zgarsa karta qayta quriladi
+STATIC_FIELDS = ('title_uz', 'description_uz', 'year', 'category')
+
+# O'xshash kinolar tugmalari sarlavhasi (faqat shu tugmalar bor xabarlarda)
+SIMILAR_HEADING = "\n\n💡 <b>Sizga yoqishi mumkin:</b>"
+
+
+class MovieCard:
+    """Bitta kinoning tayyor kartasi: caption qismlari va ikki xil klaviatura"""
+
+    __slots__ = ('signature', 'head', 'tail', 'keyboard', 'fav_keyboard', 'similar')
+
+    def __init__(self, signature: tuple, head: str, tail: str,
+                 keyboard: InlineKeyboardMarkup, fav_keyboard: InlineKeyboardMarkup, similar: tuple = ()):
+        self.signature = signature
+        self.head = head
+        self.tail = tail
+        self.keyboard = keyboard
+        self.fav_keyboard = fav_keyboard
+        self.similar = similar
+
+    def caption(self, movie: Dict, with_similar: bool = True) -> str:
+        """O'zgaruvchan hisoblagichlarni kartaga qo'yish (with_similar=False - o'xshashlar sarlavhasisiz)"""
+        return (
+            f"{self.head}"
+            f"⭐ Reyting: {movie.get('rating', 0):.1f}/5.0\n"
+            f"👁️ Ko'rishlar: {movie.get('views', 0):,}\n"
+            f"🔥 Yuklanganlar: {movie.get('downloads', 0):,}"
+            f"{self.tail}"
+            f"{SIMILAR_HEADING if with_similar and self.similar else ''}"
+        )
+
+
+class MovieCardRenderer:
+    """
+    Kino kartalari keshi (kod bo'yicha, cheklangan LRU).
+    Sarlavha, tavsif va tugmalar bir marta quriladi, har yuborishda
+    faqat reyting/ko'rishlar/yuklanganlar qo'yiladi.
+    """
+
+    def __init__(self, max_cards: int = 5000):
+        self.max_cards = max_cards
+        self._cards: "OrderedDict[str, MovieCard]" = OrderedDict()
+
+    def _build(self, movie: Dict, bot_user: str, signature: tuple, similar: tuple) -> MovieCard:
+        code = movie['code']
+        title = movie.get('title_uz', 'Noma\'lum')
+        year = movie.get('year', '')
+        head = f"🎬 <b>{title}</b> {f'({year})' if year else ''}\n\n"
+        tail = (
+            f"\n\n📖 {movie.get('description_uz', '')}\n\n"
+            f"🏷️ Kategoriya: {movie.get('category', '')}\n"
+            f"🔑 Kod: <code>{code}</code>\n\n"
+            f"🤖 {'@' + bot_user if bot_user else ''}"
+        ).rstrip()
+        return MovieCard(
+            signature, head, tail,
+            keyboard=movie_actions(code, bot_user, False, similar),
+            fav_keyboard=movie_actions(code, bot_user, True, similar),
+            similar=similar
+        )
+
+    def card(self, movie: Dict, bot_user: str, similar: Optional[tuple] = None) -> MovieCard:
+        """Kino kartasini olish (kerak bo'lsa qurish); similar=None - kartadagisi qoladi"""
+        code = movie['code']
+        signature = (bot_user,) + tuple(movie.get(f) for f in STATIC_FIELDS)
+        card = self._cards.get(code)
+        if card is None or card.signature != signature or (similar is not None and card.similar != similar):
+            if similar is None:
+                similar = card.similar if card is not None else ()
+            card = self._cards[code] = self._build(movie, bot_user, signature, similar)
+            if len(self._cards) > self.max_cards:
+                self._cards.popitem(last=False)
+        self._cards.move_to_end(code)
+        return card
+
+    def render(self, movie: Dict, bot_user: str, is_fav: bool,
+               similar: Optional[tuple] = None) -> Tuple[str, InlineKeyboardMarkup]:
+        """Caption va klaviatura (similar - o'xshash kinolar: (kod, nom))"""
+        card = self.card(movie, bot_user, similar)
+        return card.caption(movie), card.fav_keyboard if is_fav else card.keyboard
+
+    def inline_caption(self, movie: Dict, bot_user: str) -> str:
+        """Inline natija uchun caption (u yerda o'xshash kinolar tugmalari yo'q)"""
+        return self.card(movie, bot_user).caption(movie, with_similar=False)
+
+    def invalidate(self, code: str):
+        """Kino o'zgarganda/o'chirilganda kartani tashlash"""
+        self._cards.pop(code, None)
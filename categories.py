@@ -0,0 +1,98 @@
+import re
+from typing import Dict, Optional
+
+from normalize import normalize
+
+
+DEFAULT_EMOJI = '🎬'
+
+# Kalit so'z -> emoji (tartib muhim: birinchi mos kelgan kalit yutadi)
+DEFAULT_EMOJI_MAP = {
+    'komediya': '😂',
+    'comedy': '😂',
+    'drama': '🎭',
+    'jangari': '⚔️',
+    'action': '⚔️',
+    'fantastika': '🔮',
+    'fantasy': '🔮',
+    'sci-fi': '🚀',
+    'romantika': '💕',
+    'romance': '💕',
+    'qoʻrqinchli': '👻',
+    'qorqinchli': '👻',
+    'horror': '👻',
+    'thriller': '😱',
+    'detektiv': '🔍',
+    'detective': '🔍',
+    'sarguzasht': '🗺️',
+    'adventure': '🗺️',
+    'multfilm': '🎨',
+    'cartoon': '🎨',
+    'anime': '🎌',
+    'serial': '📺',
+    'documentary': '📹',
+    'sport': '⚽',
+    'musical': '🎵',
+    'western': '🤠',
+    'war': '💣',
+    'biography': '📖',
+    'history': '📜',
+    'crime': '🚨',
+    'family': '👨‍👩‍👧‍👦',
+    'kids': '👶',
+    'bollywood': '🇮🇳',
+    'turkish': '🇹🇷',
+    'korean': '🇰🇷'
+}
+
+
+class CategoryEmoji:
+    """
+    Kategoriya nomidan emoji aniqlash.
+    Barcha kalitlar bitta regexga yig'iladi, natija har bir kategoriya uchun eslab qolinadi.
+    Admin qo'shgan kalitlar standartlardan ustun turadi.
+    """
+
+    def __init__(self, overrides: Optional[Dict[str, str]] = None):
+        self.overrides: Dict[str, str] = {}
+        self._cache: Dict[str, str] = {}
+        self.load(overrides or {})
+
+    def load(self, overrides: Dict[str, str]):
+        """Admin kalitlarini o'rnatish va matcherni qayta qurish"""
+        self.overrides = {k.lower(): v for k, v in overrides.items() if normalize(k)}
+        # Kalitlar va kategoriya bir xil normallashtiriladi (Qoʻrqinchli = Qo'rqinchli = Қўрқинчли)
+        emojis = {}
+        for key, emoji in list(self.overrides.items()) + list(DEFAULT_EMOJI_MAP.items()):
+            emojis.setdefault(normalize(key), emoji)
+        self._emojis = list(emojis.items())
+        # Ustma-ust tushadigan mosliklarni ham topish uchun lookahead;
+        # bir pozitsiyada esa tartibda birinchi kalit tanlanadi
+        self._pattern = re.compile(
+            '(?=' + '|'.join(f'(?P<k{i}>{re.escape(key)})' for i, (key, _) in enumerate(self._emojis)) + ')'
+        ) if self._emojis else None
+        self._cache.clear()
+
+    def _match(self, category: str) -> str:
+        if self._pattern is None:
+            return DEFAULT_EMOJI
+        best = None
+        for m in self._pattern.finditer(normalize(category)):
+            index = int(m.lastgroup[1:])
+            if best is None or index < best:
+                best = index
+                if index == 0:
+                    break
+        return self._emojis[best][1] if best is not None else DEFAULT_EMOJI
+
+    def get(self, category: str) -> str:
+        """Kategoriya emojisi"""
+        emoji = self._cache.get(category)
+        if emoji is None:
+            emoji = self._cache[category] = self._match(category)
+        return emoji
+
+    def warm(self, categories):
+        """Kategoriyalar ro'yxati uchun oldindan hisoblash"""
+        for cat in categories:
+            self.get(cat)
@@ -1,9 +1,11 @@
 import sqlite3
 from datetime import datetime
-from typing import Optional, List, Dict, Any, Tuple
+from typing import Optional, List, Dict, Any, Tuple, Callable
 from contextlib import contextmanager
 import threading
 
+from normalize import normalize, normalize_code
+
 
 class Database:
     _instance = None
@@ -20,6 +22,8 @@ class Database:
         if not hasattr(self, 'initialized'):
             self.db_file = db_file
             self.local = threading.local()
+            # Katalog o'zgarganda chaqiriladi: listener(event, code), event - 'add' / 'delete' / 'part'
+            self.catalog_listeners: List[Callable[[str, str], None]] = []
             self.create_tables()
             self.init_default_data()
             self.initialized = True
@@ -37,6 +41,24 @@ class Database:
             self.local.connection.rollback()
             raise e
 
+    def add_catalog_listener(self, listener: Callable[[str, str], None]):
+        """Katalog (kinolar, qismlar) o'zgarishlarini kuzatish"""
+        self.catalog_listeners.append(listener)
+
+    def _catalog_changed(self, event: str, code: str):
+        for listener in self.catalog_listeners:
+            try:
+                listener(event, code)
+            except Exception as e:
+                print(f"Catalog listener error: {e}")
+
+    def close(self):
+        """Joriy thread ulanishini yopish (tugallanmagan yozuvlar saqlanadi)"""
+        if hasattr(self.local, 'connection'):
+            self.local.connection.commit()
+            self.local.connection.close()
+            del self.local.connection
+
     def create_tables(self):
         """Barcha jadvallarni yaratish"""
         with self.get_connection() as conn:
@@ -85,6 +107,19 @@ class Database:
             cursor.execute('CREATE INDEX IF NOT EXISTS idx_movies_views ON movies(views DESC)')
             cursor.execute('CREATE INDEX IF NOT EXISTS idx_movies_title ON movies(title_uz)')
 
+            # Qidiruv kalitlari (normalize.py): yozilishidan qat'i nazar topish uchun
+            columns = {row[1] for row in cursor.execute('PRAGMA table_info(movies)')}
+            if 'search_key' not in columns:
+                cursor.execute('ALTER TABLE movies ADD COLUMN search_key TEXT')
+            if 'code_key' not in columns:
+                cursor.execute('ALTER TABLE movies ADD COLUMN code_key TEXT')
+            rows = cursor.execute('SELECT code, title_uz FROM movies WHERE search_key IS NULL OR code_key IS NULL').fetchall()
+            cursor.executemany('UPDATE movies SET search_key = ?, code_key = ? WHERE code = ?', [
+                (self.movie_search_key(row[0], row[1]), normalize_code(row[0]), row[0]) for row in rows
+            ])
+            cursor.execute('CREATE INDEX IF NOT EXISTS idx_movies_search_key ON movies(search_key)')
+            cursor.execute('CREATE INDEX IF NOT EXISTS idx_movies_code_key ON movies(code_key)')
+
             # Movie parts
             cursor.execute('''
                 CREATE TABLE IF NOT EXISTS movie_parts (
@@ -97,7 +132,14 @@ class Database:
                     FOREIGN KEY (movie_code) REFERENCES movies(code) ON DELETE CASCADE
                 )
             ''')
-            cursor.execute('CREATE INDEX IF NOT EXISTS idx_parts_movie ON movie_parts(movie_code, part_number)')
+            # Bitta kodda bitta qism raqami - eski dublikatlardan oxirgisi qoladi
+            cursor.execute('''
+                DELETE FROM movie_parts WHERE id NOT IN (
+                    SELECT MAX(id) FROM movie_parts GROUP BY movie_code, part_number
+                )
+            ''')
+            cursor.execute('DROP INDEX IF EXISTS idx_parts_movie')
+            cursor.execute('CREATE UNIQUE INDEX IF NOT EXISTS idx_parts_unique ON movie_parts(movie_code, part_number)')
 
             # Channels
             cursor.execute('''
@@ -145,6 +187,67 @@ class Database:
                 )
             ''')
 
+            # FSM holatlari
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS fsm_states (
+                    key TEXT PRIMARY KEY,
+                    state TEXT,
+                    data TEXT,
+                    updated_at INTEGER
+                )
+            ''')
+            cursor.execute('CREATE INDEX IF NOT EXISTS idx_fsm_updated ON fsm_states(updated_at)')
+
+            # Qidiruv so'rovlari statistikasi (normallashtirilgan so'rov bo'yicha)
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS search_queries (
+                    query TEXT PRIMARY KEY,
+                    count INTEGER DEFAULT 0,
+                    zero_count INTEGER DEFAULT 0,
+                    results INTEGER DEFAULT 0,
+                    last_seen INTEGER
+                )
+            ''')
+            cursor.execute('CREATE INDEX IF NOT EXISTS idx_search_count ON search_queries(count DESC)')
+
+            # O'xshash kinolar (recommend.py fon jarayonida hisoblanadi)
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS movie_similar (
+                    movie_code TEXT,
+                    rank INTEGER,
+                    similar_code TEXT,
+                    score REAL,
+                    PRIMARY KEY (movie_code, rank),
+                    FOREIGN KEY (movie_code) REFERENCES movies(code) ON DELETE CASCADE,
+                    FOREIGN KEY (similar_code) REFERENCES movies(code) ON DELETE CASCADE
+                ) WITHOUT ROWID
+            ''')
+            cursor.execute('CREATE INDEX IF NOT EXISTS idx_similar_code ON movie_similar(similar_code)')
+
+            # Soatlik ko'rishlar (trend uchun)
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS movie_views_hourly (
+                    movie_code TEXT,
+                    hour INTEGER,
+                    views INTEGER DEFAULT 0,
+                    PRIMARY KEY (movie_code, hour),
+                    FOREIGN KEY (movie_code) REFERENCES movies(code) ON DELETE CASCADE
+                ) WITHOUT ROWID
+            ''')
+            cursor.execute('CREATE INDEX IF NOT EXISTS idx_views_hour ON movie_views_hourly(hour)')
+
+            # Kunlik noyob tomoshabinlar (HyperLogLog sketch)
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS movie_viewers (
+                    movie_code TEXT,
+                    day INTEGER,
+                    sketch BLOB,
+                    PRIMARY KEY (movie_code, day),
+                    FOREIGN KEY (movie_code) REFERENCES movies(code) ON DELETE CASCADE
+                ) WITHOUT ROWID
+            ''')
+            cursor.execute('CREATE INDEX IF NOT EXISTS idx_viewers_day ON movie_viewers(day)')
+
             conn.commit()
 
     def init_default_data(self):
@@ -189,6 +292,26 @@ class Database:
             print(f"Add user error: {e}")
             return False
 
+    def touch_user(self, user_id: int, username: str = None, full_name: str = None) -> Optional[Dict]:
+        """Userni qo'shish/yangilash va faollikni belgilash (bitta so'rov)"""
+        try:
+            with self.get_connection() as conn:
+                now = int(datetime.now().timestamp())
+                row = conn.execute('''
+                    INSERT INTO users (user_id, username, full_name, join_date, last_active)
+                    VALUES (?, ?, ?, ?, ?)
+                    ON CONFLICT(user_id) DO UPDATE SET
+                        username = excluded.username,
+                        full_name = excluded.full_name,
+                        last_active = excluded.last_active
+                    RETURNING *
+                ''', (user_id, username, full_name, now, now)).fetchone()
+                conn.commit()
+                return dict(row) if row else None
+        except Exception as e:
+            print(f"Touch user error: {e}")
+            return None
+
     def get_user(self, user_id: int) -> Optional[Dict]:
         """Foydalanuvchi ma'lumotlarini olish"""
         with self.get_connection() as conn:
@@ -265,44 +388,66 @@ class Database:
 
                 conn.execute('''
                     INSERT INTO movies (code, title_uz, description_uz, file_id, category, 
-                                      year, duration, thumbnail_id, file_type, added_by, added_date)
-                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                                      year, duration, thumbnail_id, file_type, added_by, added_date,
+                                      search_key, code_key)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
                 ''', (code, title, description, file_id, category,
                       kwargs.get('year'), kwargs.get('duration'), thumbnail,
-                      file_type, kwargs.get('added_by'), now))
+                      file_type, kwargs.get('added_by'), now,
+                      self.movie_search_key(code, title), normalize_code(code)))
                 conn.commit()
-                return True
         except Exception as e:
             print(f"Add movie error: {e}")
             return False
+        self._catalog_changed('add', code)
+        return True
 
     def get_movie(self, code: str) -> Optional[Dict]:
         """Kino ma'lumotlarini olish"""
         with self.get_connection() as conn:
-            row = conn.execute('SELECT * FROM movies WHERE code = ? AND is_active = 1', (code,)).fetchone()
+            # Aniq kod, bo'lmasa normallashtirilgan kod (к12, K-12, k 12 -> K12)
+            row = conn.execute('''
+                SELECT * FROM movies WHERE (code = ? OR code_key = ?) AND is_active = 1
+                ORDER BY code = ? DESC LIMIT 1
+            ''', (code, normalize_code(code), code)).fetchone()
             return dict(row) if row else None
 
     def search_movies(self, query: str, limit: int = 20, offset: int = 0) -> Tuple[List[Dict], int]:
         """Kinolarni qidirish"""
+        key = normalize(query)
+        if not key:
+            return [], 0
+
         with self.get_connection() as conn:
-            search = f'%{query}%'
+            search = f'%{key}%'
 
             # Total count
             count_row = conn.execute('''
                 SELECT COUNT(*) FROM movies 
-                WHERE (title_uz LIKE ? OR code LIKE ?) AND is_active = 1
-            ''', (search, search)).fetchone()
+                WHERE search_key LIKE ? AND is_active = 1
+            ''', (search,)).fetchone()
             total = count_row[0] if count_row else 0
 
             # Results
             rows = conn.execute('''
                 SELECT * FROM movies 
-                WHERE (title_uz LIKE ? OR code LIKE ?) AND is_active = 1
+                WHERE search_key LIKE ? AND is_active = 1
                 ORDER BY views DESC LIMIT ? OFFSET ?
-            ''', (search, search, limit, offset)).fetchall()
+            ''', (search, limit, offset)).fetchall()
 
             return [dict(row) for row in rows], total
 
+    @staticmethod
+    def movie_search_key(code: str, title: str) -> str:
+        """Kino qidiruv kaliti (nom + kod)"""
+        return f"{normalize(title)} {normalize(code)}".strip()
+
+    def get_search_catalog(self) -> List[Dict]:
+        """Qidiruv indeksi uchun barcha faol kinolar (kod, nom, ko'rishlar)"""
+        with self.get_connection() as conn:
+            rows = conn.execute('SELECT code, title_uz, views FROM movies WHERE is_active = 1').fetchall()
+            return [dict(row) for row in rows]
+
     def get_all_movies(self, limit: int = 20, offset: int = 0) -> Tuple[List[Dict], int]:
         """Barcha kinolarni olish"""
         with self.get_connection() as conn:
@@ -336,15 +481,37 @@ class Database:
             ''', (limit,)).fetchall()
             return [dict(row) for row in rows]
 
+    def get_leaderboard_movies(self) -> List[Dict]:
+        """Toplar uchun faol kinolarning qisqa ma'lumoti"""
+        with self.get_connection() as conn:
+            rows = conn.execute('''
+                SELECT code, title_uz, category, views, downloads, rating, rating_count
+                FROM movies WHERE is_active = 1
+            ''').fetchall()
+            return [dict(row) for row in rows]
+
+    def get_movies_by_codes(self, codes: List[str]) -> List[Dict]:
+        """Kodlar bo'yicha faol kinolar (berilgan tartibda)"""
+        if not codes:
+            return []
+        with self.get_connection() as conn:
+            rows = conn.execute(f'''
+                SELECT * FROM movies
+                WHERE code IN ({','.join('?' * len(codes))}) AND is_active = 1
+            ''', codes).fetchall()
+        found = {row['code']: dict(row) for row in rows}
+        return [found[code] for code in codes if code in found]
+
     def delete_movie(self, code: str) -> bool:
         """Kinoni o'chirish"""
         try:
             with self.get_connection() as conn:
                 conn.execute('DELETE FROM movies WHERE code = ?', (code,))
                 conn.commit()
-                return True
         except:
             return False
+        self._catalog_changed('delete', code)
+        return True
 
     def increment_views(self, code: str):
         """Ko'rishlarni oshirish"""
@@ -399,11 +566,16 @@ class Database:
                 conn.execute('''
                     INSERT INTO movie_parts (movie_code, part_number, title, file_id, added_date)
                     VALUES (?, ?, ?, ?, ?)
+                    ON CONFLICT(movie_code, part_number) DO UPDATE SET
+                        title = excluded.title,
+                        file_id = excluded.file_id,
+                        added_date = excluded.added_date
                 ''', (movie_code, part_number, title, file_id, now))
                 conn.commit()
-                return True
         except:
             return False
+        self._catalog_changed('part', movie_code)
+        return True
 
     def get_movie_parts(self, movie_code: str) -> List[Dict]:
         """Kino qismlarini olish"""
@@ -413,6 +585,30 @@ class Database:
             ''', (movie_code,)).fetchall()
             return [dict(row) for row in rows]
 
+    def get_part_codes(self) -> List[str]:
+        """Qismlari bor kino kodlari"""
+        with self.get_connection() as conn:
+            rows = conn.execute('SELECT DISTINCT movie_code FROM movie_parts').fetchall()
+            return [row[0] for row in rows]
+
+    def get_movie_part(self, movie_code: str, part_number: int) -> Optional[Dict]:
+        """Bitta qismni olish"""
+        with self.get_connection() as conn:
+            row = conn.execute('''
+                SELECT * FROM movie_parts WHERE movie_code = ? AND part_number = ?
+            ''', (movie_code, part_number)).fetchone()
+            return dict(row) if row else None
+
+    def get_movie_parts_from(self, movie_code: str, start: int, limit: int) -> List[Dict]:
+        """start raqamli qismdan boshlab limit tagacha qism"""
+        with self.get_connection() as conn:
+            rows = conn.execute('''
+                SELECT * FROM movie_parts
+                WHERE movie_code = ? AND part_number >= ?
+                ORDER BY part_number LIMIT ?
+            ''', (movie_code, start, limit)).fetchall()
+            return [dict(row) for row in rows]
+
     # ==================== FAVORITES ====================
 
     def add_favorite(self, user_id: int, movie_code: str) -> bool:
@@ -459,6 +655,19 @@ class Database:
             ''', (user_id, movie_code)).fetchone()
             return row is not None
 
+    # ==================== RECOMMENDATIONS ====================
+
+    def get_similar(self, code: str, limit: int = 4) -> List[Tuple[str, str]]:
+        """O'xshash kinolar: (kod, nom), eng o'xshashi birinchi"""
+        with self.get_connection() as conn:
+            rows = conn.execute('''
+                SELECT m.code, m.title_uz FROM movie_similar s
+                JOIN movies m ON m.code = s.similar_code
+                WHERE s.movie_code = ? AND m.is_active = 1
+                ORDER BY s.rank LIMIT ?
+            ''', (code, limit)).fetchall()
+            return [(row['code'], row['title_uz']) for row in rows]
+
     # ==================== CHANNELS ====================
 
     def add_channel(self, name: str, url: str, channel_type: str = 'telegram', **kwargs) -> bool:
@@ -596,6 +805,137 @@ class Database:
                     print(f"Remove admin error: {e}")
                     return False
 
+    # ==================== FSM ====================
+
+    def get_fsm(self, key: str) -> Optional[Dict]:
+        """FSM holatini olish"""
+        with self.get_connection() as conn:
+            row = conn.execute('SELECT state, data, updated_at FROM fsm_states WHERE key = ?', (key,)).fetchone()
+            return dict(row) if row else None
+
+    def save_fsm(self, key: str, state: Optional[str], data: str, updated_at: int):
+        """FSM holatini saqlash"""
+        with self.get_connection() as conn:
+            conn.execute('''
+                INSERT OR REPLACE INTO fsm_states (key, state, data, updated_at) VALUES (?, ?, ?, ?)
+            ''', (key, state, data, updated_at))
+            conn.commit()
+
+    def delete_fsm(self, key: str):
+        """FSM holatini o'chirish"""
+        with self.get_connection() as conn:
+            conn.execute('DELETE FROM fsm_states WHERE key = ?', (key,))
+            conn.commit()
+
+    def delete_expired_fsm(self, before: int) -> int:
+        """Eskirgan FSM holatlarini o'chirish"""
+        with self.get_connection() as conn:
+            cursor = conn.execute('DELETE FROM fsm_states WHERE updated_at < ?', (before,))
+            conn.commit()
+            return cursor.rowcount
+
+    # ==================== TRENDING ====================
+
+    def save_view_buckets(self, rows: List[Tuple[str, int, int]]):
+        """Soatlik ko'rishlarni to'plab yozish: (kod, soat, ko'rishlar)"""
+        try:
+            with self.get_connection() as conn:
+                # Yozishdan oldin o'chirilgan kinolar o'tkazib yuboriladi (FK xatosi butun to'plamni bekor qilmasin)
+                conn.executemany('''
+                    INSERT INTO movie_views_hourly (movie_code, hour, views)
+                    SELECT ?, ?, ? WHERE EXISTS (SELECT 1 FROM movies WHERE code = ?)
+                    ON CONFLICT(movie_code, hour) DO UPDATE SET views = views + excluded.views
+                ''', [(code, hour, views, code) for code, hour, views in rows])
+                conn.commit()
+        except Exception as e:
+            print(f"Save view buckets error: {e}")
+
+    def get_view_buckets(self, since_hour: int) -> List[Tuple[str, int, int]]:
+        """Shu soatdan keyingi ko'rishlar: (kod, soat, ko'rishlar)"""
+        with self.get_connection() as conn:
+            rows = conn.execute('''
+                SELECT movie_code, hour, views FROM movie_views_hourly WHERE hour >= ?
+            ''', (since_hour,)).fetchall()
+            return [tuple(row) for row in rows]
+
+    def delete_view_buckets(self, before_hour: int) -> int:
+        """Eski soatlik ko'rishlarni o'chirish"""
+        with self.get_connection() as conn:
+            cursor = conn.execute('DELETE FROM movie_views_hourly WHERE hour < ?', (before_hour,))
+            conn.commit()
+            return cursor.rowcount
+
+    # ==================== UNIQUE VIEWERS ====================
+
+    def get_viewer_sketch(self, code: str, day: int) -> Optional[bytes]:
+        """Kinoning bir kunlik tomoshabinlar sketchi"""
+        with self.get_connection() as conn:
+            row = conn.execute('''
+                SELECT sketch FROM movie_viewers WHERE movie_code = ? AND day = ?
+            ''', (code, day)).fetchone()
+            return row['sketch'] if row else None
+
+    def get_viewer_sketches(self, code: str, since_day: int) -> List[bytes]:
+        """Shu kundan keyingi barcha kunlik sketchlar"""
+        with self.get_connection() as conn:
+            rows = conn.execute('''
+                SELECT sketch FROM movie_viewers WHERE movie_code = ? AND day >= ?
+            ''', (code, since_day)).fetchall()
+            return [row['sketch'] for row in rows]
+
+    def save_viewer_sketches(self, rows: List[Tuple[str, int, bytes]]):
+        """Sketchlarni to'plab yozish: (kod, kun, sketch)"""
+        try:
+            with self.get_connection() as conn:
+                # O'chirilgan kinolar o'tkazib yuboriladi (FK xatosi butun to'plamni bekor qilmasin)
+                conn.executemany('''
+                    INSERT OR REPLACE INTO movie_viewers (movie_code, day, sketch)
+                    SELECT ?, ?, ? WHERE EXISTS (SELECT 1 FROM movies WHERE code = ?)
+                ''', [(code, day, sketch, code) for code, day, sketch in rows])
+                conn.commit()
+        except Exception as e:
+            print(f"Save viewer sketches error: {e}")
+
+    def delete_viewer_sketches(self, before_day: int) -> int:
+        """Eski sketchlarni o'chirish"""
+        with self.get_connection() as conn:
+            cursor = conn.execute('DELETE FROM movie_viewers WHERE day < ?', (before_day,))
+            conn.commit()
+            return cursor.rowcount
+
+    # ==================== SEARCH STATS ====================
+
+    def save_search_queries(self, rows: List[Tuple[str, int, int, int, int]]):
+        """So'rovlar statistikasini to'plab yozish: (so'rov, soni, natijasiz, natijalar, vaqt)"""
+        with self.get_connection() as conn:
+            conn.executemany('''
+                INSERT INTO search_queries (query, count, zero_count, results, last_seen)
+                VALUES (?, ?, ?, ?, ?)
+                ON CONFLICT(query) DO UPDATE SET
+                    count = count + excluded.count,
+                    zero_count = zero_count + excluded.zero_count,
+                    results = excluded.results,
+                    last_seen = excluded.last_seen
+            ''', rows)
+            conn.commit()
+
+    def get_top_searches(self, limit: int = 20) -> List[Dict]:
+        """Eng ko'p qidirilgan so'rovlar"""
+        with self.get_connection() as conn:
+            rows = conn.execute('''
+                SELECT * FROM search_queries ORDER BY count DESC LIMIT ?
+            ''', (limit,)).fetchall()
+            return [dict(row) for row in rows]
+
+    def get_zero_searches(self, limit: int = 20) -> List[Dict]:
+        """Natija bermagan eng ko'p so'rovlar"""
+        with self.get_connection() as conn:
+            rows = conn.execute('''
+                SELECT * FROM search_queries WHERE results = 0
+                ORDER BY zero_count DESC LIMIT ?
+            ''', (limit,)).fetchall()
+            return [dict(row) for row in rows]
+
 
 # Singleton instance
 db = Database()
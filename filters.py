@@ -0,0 +1,43 @@
+from typing import Any, Dict, List, Optional, Tuple, Union
+
+from aiogram.filters import CommandObject, Filter
+from aiogram.types import TelegramObject
+
+from callbacks import parse_start_payload
+
+
+class IsAdmin(Filter):
+    """Admin tekshirish (user middleware natijasi bo'yicha)"""
+
+    def __init__(self, admin_ids: List[int]):
+        self.admin_ids = admin_ids
+
+    async def __call__(self, event: TelegramObject, user: Optional[Dict[str, Any]] = None) -> bool:
+        if not user:
+            return False
+        return user['user_id'] in self.admin_ids or user.get('is_admin', 0) == 1
+
+
+class Button(Filter):
+    """Reply tugma amali bo'yicha (ButtonMiddleware natijasi)"""
+
+    def __init__(self, action: str):
+        self.action = action
+
+    async def __call__(self, event: TelegramObject,
+                       button: Optional[Tuple[str, Any]] = None) -> Union[bool, Dict[str, Any]]:
+        if button is None or button[0] != self.action:
+            return False
+        return {'button_arg': button[1]}
+
+
+class StartPayload(Filter):
+    """/start <payload> dan kino kodi (CommandStart dan keyin)"""
+
+    async def __call__(self, event: TelegramObject,
+                       command: Optional[CommandObject] = None) -> Union[bool, Dict[str, Any]]:
+        payload = command.args if command else None
+        code = parse_start_payload(payload)
+        if not code:
+            return False
+        return {'start_code': code, 'start_payload': payload}
@@ -1,6 +1,12 @@
 from aiogram.types import ReplyKeyboardMarkup, KeyboardButton, InlineKeyboardMarkup, InlineKeyboardButton
 from aiogram.utils.keyboard import ReplyKeyboardBuilder, InlineKeyboardBuilder
-from typing import List, Dict
+from collections import OrderedDict
+from functools import lru_cache
+from typing import Any, Callable, Hashable, List, Dict, Optional, Tuple
+
+from urllib.parse import quote
+
+from callbacks import MovieAction, MovieCB, PageCB, SearchCB, TopCB, ChannelTypeCB, CheckSubCB, fit_query, start_payload
 
 
 # ============= EMOJI =============
@@ -14,106 +20,290 @@ class E:
     CHAN, SET, INFO, CONT, MSG = "📢", "⚙️", "ℹ️", "📞", "📨"
 
 
+# ============= REPLY TUGMALAR =============
+
+class B:
+    """Reply tugma matnlari"""
+    # Asosiy menyu
+    CODE = f"{E.MOVIE} Kino Kodini Yuboring"
+    SEARCH = f"{E.SEARCH} Qidirish"
+    TOP = f"{E.TOP} Top Kinolar"
+    CATEGORIES = f"{E.CAT} Kategoriyalar"
+    FAVORITES = f"{E.FAV} Sevimlilarim"
+    DOWNLOADS = f"{E.DOWN} Yuklaganlarim"
+    PROFILE = f"{E.PROF} Profil"
+    INFO = f"{E.INFO} Ma'lumot"
+    # Umumiy
+    CANCEL = f"{E.CANCEL} Bekor Qilish"
+    BACK = f"{E.BACK} Orqaga"
+    # Admin panel
+    ADD_MOVIE = f"{E.ADD} Kino Qo'shish"
+    DEL_MOVIE = f"{E.DEL} Kino O'chirish"
+    MOVIES = f"{E.LIST} Kinolar"
+    STATS = f"{E.STATS} Statistika"
+    USERS = f"{E.USERS} Userlar"
+    CHANNELS = f"{E.CHAN} Kanallar"
+    BROADCAST = f"{E.MSG} Reklama"
+    ADMINS = "👑 Adminlar"
+    EXIT = f"{E.HOME} Chiqish"
+    # Userlar
+    BLOCK = "🚫 Bloklash"
+    UNBLOCK = "🔓 Blokdan Chiqarish"
+    USER_SEARCH = f"{E.SEARCH} User Qidirish"
+    ALL_USERS = f"{E.LIST} Barcha Userlar"
+    # Kanallar
+    ADD_CHANNEL = f"{E.ADD} Kanal Qo'shish"
+    DEL_CHANNEL = f"{E.DEL} Kanal O'chirish"
+    CHANNEL_LIST = f"{E.LIST} Kanallar"
+    # Adminlar
+    ADD_ADMIN = "➕ Admin Qo'shish"
+    DEL_ADMIN = "🗑️ Admin O'chirish"
+
+
+class ButtonRegistry:
+    """
+    Ko'rsatiladigan har bir reply tugma matni -> (amal, argument).
+    Xabar matni bitta lug'at qidiruvida aniqlanadi.
+    """
+
+    def __init__(self, static: Dict[str, str]):
+        self._static = {text: (action, None) for text, action in static.items()}
+        self._categories: Tuple[str, ...] = ()
+        self._lookup: Dict[str, Tuple[str, Any]] = dict(self._static)
+
+    def set_categories(self, categories: List[str]):
+        """Kategoriya tugmalarini qayta qurish (kategoriyalar o'zgarganda)"""
+        categories = tuple(categories)
+        if categories == self._categories:
+            return
+        lookup = dict(self._static)
+        for cat in categories:
+            lookup.setdefault(f"{E.CAT} {cat}", ('category', cat))
+        self._categories = categories
+        self._lookup = lookup
+
+    def resolve(self, text: Optional[str]) -> Optional[Tuple[str, Any]]:
+        """Tugma matnidan (amal, argument)"""
+        return self._lookup.get(text) if text else None
+
+
+buttons = ButtonRegistry({
+    B.CODE: 'code',
+    B.SEARCH: 'search',
+    B.TOP: 'top',
+    B.CATEGORIES: 'categories',
+    B.FAVORITES: 'favorites',
+    B.DOWNLOADS: 'downloads',
+    B.PROFILE: 'profile',
+    B.INFO: 'info',
+    B.CANCEL: 'cancel',
+    B.BACK: 'back',
+    B.ADD_MOVIE: 'add_movie',
+    B.DEL_MOVIE: 'del_movie',
+    B.MOVIES: 'movies',
+    B.STATS: 'stats',
+    B.USERS: 'users',
+    B.CHANNELS: 'channels',
+    B.BROADCAST: 'broadcast',
+    B.ADMINS: 'admins',
+    B.EXIT: 'exit',
+    B.BLOCK: 'block',
+    B.UNBLOCK: 'unblock',
+    B.USER_SEARCH: 'user_search',
+    B.ALL_USERS: 'all_users',
+    B.ADD_CHANNEL: 'add_channel',
+    B.DEL_CHANNEL: 'del_channel',
+    B.CHANNEL_LIST: 'channel_list',
+    B.ADD_ADMIN: 'add_admin',
+    B.DEL_ADMIN: 'del_admin',
+})
+
+
+# Telegram media guruhidagi eng ko'p element soni
+ALBUM_SIZE = 10
+
+
+# ============= KESH =============
+# Statik klaviaturalar @lru_cache bilan bir marta quriladi. Markup obyektlari
+# (aiogram TelegramObject) frozen - bitta nusxa barcha javoblarda ishlatiladi.
+
+class KeyboardCache:
+    """Dinamik klaviaturalar keshi: kirish ma'lumotlari bo'yicha (o'zgarsa yangisi quriladi)"""
+
+    def __init__(self, max_size: int = 64):
+        self.max_size = max_size
+        self._items: "OrderedDict[Hashable, Any]" = OrderedDict()
+
+    def get(self, key: Hashable, build: Callable[[], Any]) -> Any:
+        markup = self._items.get(key)
+        if markup is None:
+            markup = self._items[key] = build()
+            if len(self._items) > self.max_size:
+                self._items.popitem(last=False)
+        else:
+            self._items.move_to_end(key)
+        return markup
+
+    def clear(self):
+        self._items.clear()
+
+
+keyboard_cache = KeyboardCache()
+
+
 # ============= REPLY KEYBOARDS =============
 
+@lru_cache(maxsize=None)
 def main_menu() -> ReplyKeyboardMarkup:
     """Asosiy menyu"""
     kb = ReplyKeyboardBuilder()
-    kb.button(text=f"{E.MOVIE} Kino Kodini Yuboring")
-    kb.button(text=f"{E.SEARCH} Qidirish")
-    kb.button(text=f"{E.TOP} Top Kinolar")
-    kb.button(text=f"{E.CAT} Kategoriyalar")
-    kb.button(text=f"{E.FAV} Sevimlilarim")
-    kb.button(text=f"{E.DOWN} Yuklaganlarim")
-    kb.button(text=f"{E.PROF} Profil")
-    kb.button(text=f"{E.INFO} Ma'lumot")
+    kb.button(text=B.CODE)
+    kb.button(text=B.SEARCH)
+    kb.button(text=B.TOP)
+    kb.button(text=B.CATEGORIES)
+    kb.button(text=B.FAVORITES)
+    kb.button(text=B.DOWNLOADS)
+    kb.button(text=B.PROFILE)
+    kb.button(text=B.INFO)
     kb.adjust(1, 2, 2, 2, 1)
     return kb.as_markup(resize_keyboard=True, input_field_placeholder="Tanlang...")
 
 
 def categories_menu(categories: List[str]) -> ReplyKeyboardMarkup:
     """Kategoriyalar"""
+    categories = tuple(categories)
+    return keyboard_cache.get(('categories', categories), lambda: _categories_menu(categories))
+
+
+def _categories_menu(categories: Tuple[str, ...]) -> ReplyKeyboardMarkup:
     kb = ReplyKeyboardBuilder()
     for cat in categories:
         kb.button(text=f"{E.CAT} {cat}")
-    kb.button(text=f"{E.BACK} Orqaga")
+    kb.button(text=B.BACK)
     kb.adjust(2)
     return kb.as_markup(resize_keyboard=True)
 
 
+@lru_cache(maxsize=None)
 def admin_panel() -> ReplyKeyboardMarkup:
     """Admin panel"""
     kb = ReplyKeyboardBuilder()
-    kb.button(text=f"{E.ADD} Kino Qo'shish")
-    kb.button(text=f"{E.DEL} Kino O'chirish")
-    kb.button(text=f"{E.LIST} Kinolar")
-    kb.button(text=f"{E.STATS} Statistika")
-    kb.button(text=f"{E.USERS} Userlar")
-    kb.button(text=f"{E.CHAN} Kanallar")
-    kb.button(text=f"{E.MSG} Reklama")
-    kb.button(text="👑 Adminlar")
-    kb.button(text=f"{E.HOME} Chiqish")
+    kb.button(text=B.ADD_MOVIE)
+    kb.button(text=B.DEL_MOVIE)
+    kb.button(text=B.MOVIES)
+    kb.button(text=B.STATS)
+    kb.button(text=B.USERS)
+    kb.button(text=B.CHANNELS)
+    kb.button(text=B.BROADCAST)
+    kb.button(text=B.ADMINS)
+    kb.button(text=B.EXIT)
     kb.adjust(2)
     return kb.as_markup(resize_keyboard=True)
 
 
+@lru_cache(maxsize=None)
 def user_management() -> ReplyKeyboardMarkup:
     """User boshqaruv"""
     kb = ReplyKeyboardBuilder()
-    kb.button(text="🚫 Bloklash")
-    kb.button(text="🔓 Blokdan Chiqarish")
-    kb.button(text=f"{E.SEARCH} User Qidirish")
-    kb.button(text=f"{E.LIST} Barcha Userlar")
-    kb.button(text=f"{E.BACK} Orqaga")
+    kb.button(text=B.BLOCK)
+    kb.button(text=B.UNBLOCK)
+    kb.button(text=B.USER_SEARCH)
+    kb.button(text=B.ALL_USERS)
+    kb.button(text=B.BACK)
     kb.adjust(2, 2, 1)
     return kb.as_markup(resize_keyboard=True)
 
 
+@lru_cache(maxsize=None)
 def channels_management() -> ReplyKeyboardMarkup:
     """Kanallar boshqaruv"""
     kb = ReplyKeyboardBuilder()
-    kb.button(text=f"{E.ADD} Kanal Qo'shish")
-    kb.button(text=f"{E.DEL} Kanal O'chirish")
-    kb.button(text=f"{E.LIST} Kanallar")
-    kb.button(text=f"{E.BACK} Orqaga")
+    kb.button(text=B.ADD_CHANNEL)
+    kb.button(text=B.DEL_CHANNEL)
+    kb.button(text=B.CHANNEL_LIST)
+    kb.button(text=B.BACK)
     kb.adjust(2, 2)
     return kb.as_markup(resize_keyboard=True)
 
 
+@lru_cache(maxsize=None)
 def cancel() -> ReplyKeyboardMarkup:
     """Bekor qilish"""
     kb = ReplyKeyboardBuilder()
-    kb.button(text=f"{E.CANCEL} Bekor Qilish")
+    kb.button(text=B.CANCEL)
     return kb.as_markup(resize_keyboard=True)
 
 
+@lru_cache(maxsize=None)
 def back_only() -> ReplyKeyboardMarkup:
     """Faqat orqaga tugmasi"""
     kb = ReplyKeyboardBuilder()
-    kb.button(text=f"{E.BACK} Orqaga")
+    kb.button(text=B.BACK)
     return kb.as_markup(resize_keyboard=True)
 
 
 # ============= INLINE KEYBOARDS =============
 
-def movie_actions(code: str, bot_user: str = "", is_fav: bool = False) -> InlineKeyboardMarkup:
-    """Kino amallar"""
+def movie_actions(code: str, bot_user: str = "", is_fav: bool = False,
+                  similar: Tuple[Tuple[str, str], ...] = ()) -> InlineKeyboardMarkup:
+    """Kino amallar (+ o'xshash kinolar: (kod, nom))"""
     kb = InlineKeyboardBuilder()
 
     fav_text = f"{E.FAV} Olib Tashlash" if is_fav else f"{E.FAV} Sevimli"
-    kb.button(text=f"{E.DOWN} Yuklab Olish", callback_data=f"dl_{code}")
-    kb.button(text=fav_text, callback_data=f"fav_{code}")
-    kb.button(text=f"{E.SHARE} Ulashish", callback_data=f"share_{code}")
-    kb.button(text=f"{E.STAR} Reyting", callback_data=f"rate_{code}")
+    kb.button(text=f"{E.DOWN} Yuklab Olish", callback_data=MovieCB(action=MovieAction.DOWNLOAD, code=code))
+    kb.button(text=fav_text, callback_data=MovieCB(action=MovieAction.FAV, code=code))
+    kb.button(text=f"{E.SHARE} Ulashish", callback_data=MovieCB(action=MovieAction.SHARE, code=code))
+    kb.button(text=f"{E.STAR} Reyting", callback_data=MovieCB(action=MovieAction.RATE, code=code))
 
     if bot_user:
-        share_url = f"https://t.me/share/url?url=t.me/{bot_user}&text=🎬 Kod: {code}"
-        kb.button(text=f"📲 Ulashing", url=share_url)
+        kb.button(text=f"📲 Ulashing", url=share_url(bot_user, code))
 
     kb.adjust(2, 2, 1)
+    if similar:
+        for other, title in similar:
+            kb.row(InlineKeyboardButton(
+                text=f"💡 {title[:30]}",
+                callback_data=MovieCB(action=MovieAction.SHOW, code=other).pack()
+            ))
+    return kb.as_markup()
+
+
+@lru_cache(maxsize=None)
+def top_tabs(active: str) -> InlineKeyboardMarkup:
+    """Top kinolar: trend / hamma vaqt / reyting"""
+    kb = InlineKeyboardBuilder()
+    for kind, text in (('trend', "🔥 Trend"), ('all', f"{E.TOP} Hamma Vaqt"), ('rating', f"{E.STAR} Reyting")):
+        kb.button(text=f"• {text} •" if kind == active else text, callback_data=TopCB(kind=kind))
+    kb.adjust(3)
+    return kb.as_markup()
+
+
+@lru_cache(maxsize=1024)
+def movie_inline(code: str, bot_user: str) -> InlineKeyboardMarkup:
+    """
+    Inline rejimda yuborilgan kino tugmalari - faqat havolalar.
+    Bunday xabarlardan kelgan callbacklarda call.message bo'lmaydi.
+    """
+    kb = InlineKeyboardBuilder()
+    kb.button(text=f"{E.MOVIE} Botda Ochish", url=movie_link(bot_user, code))
+    kb.button(text=f"📲 Ulashing", url=share_url(bot_user, code))
+    kb.adjust(2)
     return kb.as_markup()
 
 
+def share_url(bot_user: str, code: str) -> str:
+    """Telegram ulashish oynasi havolasi"""
+    return (
+        f"https://t.me/share/url?url={quote(movie_link(bot_user, code), safe='')}"
+        f"&text={quote(f'🎬 Kod: {code}')}"
+    )
+
+
+def movie_link(bot_user: str, code: str) -> str:
+    """Kinoni bitta bosishda ochadigan deep-link"""
+    return f"https://t.me/{bot_user}?start={start_payload(code)}"
+
+
 def format_channel_url(url: str) -> str:
     """Kanal URL ni to'g'ri formatga keltirish"""
     if not url:
@@ -136,15 +326,19 @@ def format_channel_url(url: str) -> str:
     return f"https://t.me/{url}"
 
 
-def channels_sub(channels: List[Dict]) -> InlineKeyboardMarkup:
-    """Majburiy obuna"""
-    kb = InlineKeyboardBuilder()
+def channels_sub(channels: List[Dict], payload: str = '') -> InlineKeyboardMarkup:
+    """Majburiy obuna (payload - obunadan keyin yuboriladigan kino)"""
+    items = tuple(
+        (ch.get('channel_name', 'Kanal'), ch.get('channel_url', ''), ch.get('channel_type', 'telegram'))
+        for ch in channels
+    )
+    return keyboard_cache.get(('channels_sub', items, payload), lambda: _channels_sub(items, payload))
 
-    for ch in channels:
-        name = ch.get('channel_name', 'Kanal')
-        url = ch.get('channel_url', '')
-        ch_type = ch.get('channel_type', 'telegram')
 
+def _channels_sub(items: Tuple[Tuple[str, str, str], ...], payload: str) -> InlineKeyboardMarkup:
+    kb = InlineKeyboardBuilder()
+
+    for name, url, ch_type in items:
         # URL ni to'g'ri formatga keltirish
         formatted_url = format_channel_url(url)
 
@@ -154,7 +348,9 @@ def channels_sub(channels: List[Dict]) -> InlineKeyboardMarkup:
         # Tugma qo'shish
         kb.button(text=f"{icon} {name}", url=formatted_url)
 
-    kb.button(text=f"{E.CHECK} Obunani Tekshirish", callback_data="check_sub")
+    # callback_data 64 baytdan oshmasligi kerak
+    check_data = CheckSubCB(payload=payload).pack() if 0 < len(payload) <= 54 else "check_sub"
+    kb.button(text=f"{E.CHECK} Obunani Tekshirish", callback_data=check_data)
     kb.adjust(1)
     return kb.as_markup()
 
@@ -166,10 +362,24 @@ def movie_parts(code: str, parts: List[Dict]) -> InlineKeyboardMarkup:
     for p in parts:
         num = p.get('part_number', 1)
         title = p.get('title', f'Qism {num}')
-        kb.button(text=f"📺 {num}: {title}", callback_data=f"part_{code}_{num}")
-
-    kb.button(text=f"{E.BACK} Orqaga", callback_data=f"back_to_movie_{code}")
-    kb.adjust(1)
+        kb.button(text=f"📺 {num}: {title}", callback_data=MovieCB(action=MovieAction.PART, code=code, num=num))
+
+    sizes = [1] * len(parts)
+
+    # Albom: 10 tadan oraliqlar (num - boshlang'ich qism) va hammasi (num=0)
+    if len(parts) > 1:
+        numbers = [p.get('part_number', 1) for p in parts]
+        if len(numbers) > ALBUM_SIZE:
+            chunks = [numbers[i:i + ALBUM_SIZE] for i in range(0, len(numbers), ALBUM_SIZE)]
+            for chunk in chunks:
+                kb.button(text=f"📦 {chunk[0]}-{chunk[-1]}",
+                          callback_data=MovieCB(action=MovieAction.ALBUM, code=code, num=chunk[0]))
+            sizes += [3] * (len(chunks) // 3) + ([len(chunks) % 3] if len(chunks) % 3 else [])
+        kb.button(text="📦 Hammasini Yuborish", callback_data=MovieCB(action=MovieAction.ALBUM, code=code, num=0))
+        sizes.append(1)
+
+    kb.button(text=f"{E.BACK} Orqaga", callback_data=MovieCB(action=MovieAction.BACK, code=code))
+    kb.adjust(*sizes, 1)
     return kb.as_markup()
 
 
@@ -178,33 +388,39 @@ def rating(code: str) -> InlineKeyboardMarkup:
     kb = InlineKeyboardBuilder()
 
     for i in range(1, 6):
-        kb.button(text=f"{i} {E.STAR}", callback_data=f"r_{i}_{code}")
+        kb.button(text=f"{i} {E.STAR}", callback_data=MovieCB(action=MovieAction.RATE_SET, code=code, num=i))
 
     kb.button(text=f"{E.CANCEL} Bekor", callback_data=f"cancel_rate")
     kb.adjust(5, 1)
     return kb.as_markup()
 
 
-def movie_list(movies: List[Dict], page: int = 1, total_pages: int = 1, query: str = "") -> InlineKeyboardMarkup:
-    """Kino ro'yxati"""
+def movie_list(movies: List[Dict], page: int = 1, total_pages: int = 1, query: str = "",
+               session: str = "") -> InlineKeyboardMarkup:
+    """Kino ro'yxati (session - qidiruv sessiyasi, bo'lsa sahifalar undan olinadi)"""
     kb = InlineKeyboardBuilder()
 
     for m in movies:
         code = m.get('code', '')
         title = m.get('title_uz', 'Kino')[:25]
         views = m.get('views', 0)
-        kb.button(text=f"🎬 {title} ({views}👁️)", callback_data=f"movie_{code}")
+        kb.button(text=f"🎬 {title} ({views}👁️)", callback_data=MovieCB(action=MovieAction.SHOW, code=code))
 
     # Pagination
     if total_pages > 1:
+        query = fit_query(query)
+
+        def page_cb(number: int):
+            return SearchCB(sid=session, page=number) if session else PageCB(page=number, query=query)
+
         pagination = []
         if page > 1:
-            pagination.append(("◀️ Oldingi", f"page_{page - 1}_{query}"))
+            pagination.append(("◀️ Oldingi", page_cb(page - 1)))
 
         pagination.append((f"{page}/{total_pages}", "current_page"))
 
         if page < total_pages:
-            pagination.append(("Keyingi ▶️", f"page_{page + 1}_{query}"))
+            pagination.append(("Keyingi ▶️", page_cb(page + 1)))
 
         for text, data in pagination:
             kb.button(text=text, callback_data=data)
@@ -214,6 +430,7 @@ def movie_list(movies: List[Dict], page: int = 1, total_pages: int = 1, query: s
     return kb.as_markup()
 
 
+@lru_cache(maxsize=None)
 def channel_types() -> InlineKeyboardMarkup:
     """Kanal turlari"""
     kb = InlineKeyboardBuilder()
@@ -224,11 +441,21 @@ def channel_types() -> InlineKeyboardMarkup:
         ("🌐 Boshqa", "website")
     ]
     for text, data in types:
-        kb.button(text=text, callback_data=f"ct_{data}")
+        kb.button(text=text, callback_data=ChannelTypeCB(type=data))
     kb.adjust(2)
     return kb.as_markup()
 
 
+def suggestions(items: List[Tuple[str, str]]) -> InlineKeyboardMarkup:
+    """Kod topilmaganda takliflar: (kod, nom)"""
+    kb = InlineKeyboardBuilder()
+    for code, title in items:
+        kb.button(text=f"🎬 {title[:30]} ({code})", callback_data=MovieCB(action=MovieAction.SHOW, code=code))
+    kb.adjust(1)
+    return kb.as_markup()
+
+
+@lru_cache(maxsize=None)
 def close_msg() -> InlineKeyboardMarkup:
     """Yopish"""
     kb = InlineKeyboardBuilder()
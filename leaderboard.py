@@ -0,0 +1,172 @@
+import heapq
+from typing import Callable, Dict, List, Optional, Tuple
+
+
+# Reyting topiga kirish uchun kamida shuncha baho kerak
+MIN_RATINGS = 1
+
+
+def views_score(movie: dict) -> Tuple:
+    return movie['views'] or 0, movie['downloads'] or 0
+
+
+def rating_score(movie: dict) -> Optional[Tuple]:
+    if (movie['rating_count'] or 0) < MIN_RATINGS:
+        return None
+    return movie['rating'] or 0, movie['rating_count'] or 0
+
+
+METRICS: Dict[str, Callable[[dict], Optional[Tuple]]] = {
+    'views': views_score,
+    'rating': rating_score,
+}
+
+
+class Leaderboard:
+    """
+    Bitta top-N ro'yxat. Barcha ballar lug'atda, top esa alohida saqlanadi:
+    ball oshganda top o'rnida yangilanadi, kamayganda yoki a'zo chiqib
+    ketganda keyingi so'rovda heapq.nlargest bilan qayta hisoblanadi.
+    """
+
+    def __init__(self, size: int):
+        self.size = size
+        self._scores: Dict[str, Tuple] = {}
+        self._top: Optional[List[str]] = None
+        self.version = 0
+
+    def __len__(self) -> int:
+        return len(self._scores)
+
+    def _sort(self):
+        self._top.sort(key=lambda code: (self._scores[code], code), reverse=True)
+
+    def update(self, code: str, score: Optional[Tuple]):
+        """Kino ballini o'rnatish (None - ro'yxatdan chiqarish)"""
+        if score is None:
+            self.remove(code)
+            return
+        old = self._scores.get(code)
+        self._scores[code] = score
+        if self._top is None:
+            return
+        if code in self._top:
+            if old is not None and score < old:
+                self._top = None
+            elif score != old:
+                self._sort()
+            # Ball o'zgarmasa ham versiya oshadi: matnda boshqa maydonlar ham
+            # ko'rsatiladi (masalan, reyting topida ko'rishlar soni)
+            self.version += 1
+        elif len(self._top) < self.size or (score, code) > (self._scores[self._top[-1]], self._top[-1]):
+            self._top.append(code)
+            self._sort()
+            del self._top[self.size:]
+            self.version += 1
+
+    def remove(self, code: str):
+        if self._scores.pop(code, None) is not None and self._top is not None and code in self._top:
+            self._top = None
+            self.version += 1
+
+    def top(self) -> List[str]:
+        """Top-N kodlar (eng yuqorisi birinchi)"""
+        if self._top is None:
+            self._top = heapq.nlargest(self.size, self._scores, key=lambda code: (self._scores[code], code))
+        return self._top
+
+
+class Leaderboards:
+    """
+    Umumiy va kategoriyalar bo'yicha toplar (ko'rishlar / reyting).
+    Ko'rish va baho hodisalari bilan yangilanadi, bazadan vaqti-vaqti bilan
+    to'liq qayta yuklanadi. Tayyor matnlar top o'zgarmaguncha keshlanadi.
+    """
+
+    def __init__(self, size: int = 10):
+        self.size = size
+        self.movies: Dict[str, dict] = {}
+        self.categories: List[str] = []
+        self._boards: Dict[Tuple[str, str], Leaderboard] = {}
+        self._texts: Dict[Tuple[str, str], Tuple[int, str]] = {}
+
+    def load(self, movies: List[dict], categories: List[str]):
+        """Barcha toplarni noldan qurish (bazaga moslashtirish)"""
+        self.movies = {m['code']: m for m in movies}
+        self.categories = list(categories)
+        self._boards.clear()
+        self._texts.clear()
+
+    def set_categories(self, categories: List[str]):
+        """Kategoriyalar ro'yxati o'zgardi - kategoriya toplari qayta quriladi"""
+        self.load(list(self.movies.values()), categories)
+
+    def _in_category(self, movie: dict, category: str) -> bool:
+        # get_movies_by_category dagi LIKE '%cat%' bilan bir xil
+        return category.lower() in (movie.get('category') or '').lower()
+
+    def board(self, metric: str, category: str = '') -> Leaderboard:
+        """Top ro'yxat (birinchi so'ralganda quriladi)"""
+        key = (category, metric)
+        board = self._boards.get(key)
+        if board is None:
+            board = self._boards[key] = Leaderboard(self.size)
+            score = METRICS[metric]
+            for code, movie in self.movies.items():
+                if not category or self._in_category(movie, category):
+                    value = score(movie)
+                    if value is not None:
+                        board._scores[code] = value
+        return board
+
+    def _refresh(self, movie: dict):
+        # Kinoning har qanday ko'rsatiladigan maydoni o'zgarganda barcha mos
+        # toplar yangilanadi, shunda tayyor matnlar eskirib qolmaydi
+        for (category, metric), board in self._boards.items():
+            if not category or self._in_category(movie, category):
+                board.update(movie['code'], METRICS[metric](movie))
+
+    def view(self, code: str):
+        """Kino ko'rildi"""
+        movie = self.movies.get(code)
+        if movie is not None:
+            movie['views'] = (movie['views'] or 0) + 1
+            self._refresh(movie)
+
+    def rate(self, code: str, rating: float, rating_count: int):
+        """Kino reytingi o'zgardi"""
+        movie = self.movies.get(code)
+        if movie is not None:
+            movie['rating'], movie['rating_count'] = rating, rating_count
+            self._refresh(movie)
+
+    def add(self, movie: dict):
+        """Kino qo'shildi yoki yangilandi"""
+        self.remove(movie['code'])
+        self.movies[movie['code']] = movie
+        self._refresh(movie)
+
+    def remove(self, code: str):
+        """Kino o'chirildi"""
+        movie = self.movies.pop(code, None)
+        if movie is not None:
+            for board in self._boards.values():
+                board.remove(code)
+
+    def clear_texts(self):
+        """Tayyor matnlarni tashlash (masalan, emojilar o'zgarganda)"""
+        self._texts.clear()
+
+    def top(self, metric: str, category: str = '') -> List[dict]:
+        return [self.movies[code] for code in self.board(metric, category).top()]
+
+    def text(self, metric: str, category: str, render: Callable[[List[dict]], str]) -> str:
+        """Top matni; top o'zgarmagan bo'lsa oldingi tayyor matn qaytadi"""
+        board = self.board(metric, category)
+        codes = board.top()
+        cached = self._texts.get((category, metric))
+        if cached is not None and cached[0] == board.version:
+            return cached[1]
+        text = render([self.movies[code] for code in codes])
+        self._texts[(category, metric)] = (board.version, text)
+        return text
@@ -1,16 +1,23 @@
 # main.py
 import asyncio
+import heapq
+import json
 import logging
+import sys
+import time
+from html import escape
 from datetime import datetime
-from typing import Optional, List
+from typing import Optional, List, Tuple
 from aiogram.utils.keyboard import ReplyKeyboardBuilder
 
 from aiogram import Bot, Dispatcher, F, types
 from aiogram.filters import Command, CommandStart
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
-from aiogram.fsm.storage.memory import MemoryStorage
-from aiogram.types import Message, CallbackQuery
+from aiogram.types import (
+    Message, CallbackQuery, InlineQuery, ChosenInlineResult, InlineQueryResultsButton,
+    InlineQueryResultCachedPhoto, InlineQueryResultCachedVideo, InputMediaVideo
+)
 from aiogram.client.default import DefaultBotProperties
 from aiogram.enums import ParseMode
 
@@ -19,55 +26,33 @@ from dotenv import load_dotenv
 
 from database import db
 from keyboards import *
+from storage import SQLiteStorage
+from backend import create_backend
+from ratelimit import RateLimiter
+from middlewares import AdmissionMiddleware, UserMiddleware, ButtonMiddleware, SubscriptionMiddleware, ThrottlingMiddleware
+from filters import Button, IsAdmin, StartPayload
+from session import TunedAiohttpSession
+from categories import CategoryEmoji
+from cards import MovieCardRenderer
+from search import CodeFilter, PrefixIndex, TrigramIndex
+from normalize import normalize
+from analytics import (
+    HyperLogLog, QueryStats, ViewBuckets, ViewerSketches, current_day, current_hour, decayed_scores
+)
+from leaderboard import Leaderboards
+from callbacks import (
+    MovieAction, MovieCB, PageCB, SearchCB, TopCB, ChannelTypeCB, CheckSubCB, DELIVERY_ACTIONS, SUBSCRIBE_PAYLOAD,
+    parse_legacy, parse_start_payload
+)
 
 
-# Category emoji funksiyasini import qilamiz
-def get_category_emoji(category: str) -> str:
-    """Kategoriya uchun emoji tanlash"""
-    category_lower = category.lower()
-    emoji_map = {
-        'komediya': '😂',
-        'comedy': '😂',
-        'drama': '🎭',
-        'jangari': '⚔️',
-        'action': '⚔️',
-        'fantastika': '🔮',
-        'fantasy': '🔮',
-        'sci-fi': '🚀',
-        'romantika': '💕',
-        'romance': '💕',
-        'qoʻrqinchli': '👻',
-        'qorqinchli': '👻',
-        'horror': '👻',
-        'thriller': '😱',
-        'detektiv': '🔍',
-        'detective': '🔍',
-        'sarguzasht': '🗺️',
-        'adventure': '🗺️',
-        'multfilm': '🎨',
-        'cartoon': '🎨',
-        'anime': '🎌',
-        'serial': '📺',
-        'documentary': '📹',
-        'sport': '⚽',
-        'musical': '🎵',
-        'western': '🤠',
-        'war': '💣',
-        'biography': '📖',
-        'history': '📜',
-        'crime': '🚨',
-        'family': '👨‍👩‍👧‍👦',
-        'kids': '👶',
-        'bollywood': '🇮🇳',
-        'turkish': '🇹🇷',
-        'korean': '🇰🇷'
-    }
+# Kategoriya emojilari (admin sozlagan kalitlar bilan)
+category_emoji = CategoryEmoji()
 
-    for key, emoji in emoji_map.items():
-        if key in category_lower:
-            return emoji
 
-    return '🎬'
+def get_category_emoji(category: str) -> str:
+    """Kategoriya uchun emoji tanlash"""
+    return category_emoji.get(category)
 
 
 # Load .env
@@ -76,6 +61,74 @@ load_dotenv()
 BOT_TOKEN = os.getenv('BOT_TOKEN')
 ADMIN_PASSWORD = os.getenv('ADMIN_PASSWORD', '121314')
 ADMIN_IDS = list(map(int, os.getenv('ADMIN_IDS', '7748631320').split(',')))
+FSM_TTL = int(os.getenv('FSM_TTL', 24 * 3600))
+STATE_BACKEND_URL = os.getenv('STATE_BACKEND_URL', 'memory://')
+STATE_CACHE_SIZE = int(os.getenv('STATE_CACHE_SIZE', 100000))
+BACKEND_PURGE_INTERVAL = 60
+SUB_CACHE_TTL = int(os.getenv('SUB_CACHE_TTL', 300))
+MOVIE_CACHE_TTL = int(os.getenv('MOVIE_CACHE_TTL', 60))
+# Qidiruv sessiyalari: natijalar (kod ro'yxati) shu muddat saqlanadi, ko'pi bilan SEARCH_SESSION_MAX ta
+SEARCH_SESSION_TTL = int(os.getenv('SEARCH_SESSION_TTL', 900))
+SEARCH_SESSION_MAX = int(os.getenv('SEARCH_SESSION_MAX', 200))
+# Eng ko'p qidirilgan so'rovlar natijalari oldindan tayyorlab qo'yiladi
+SEARCH_WARMUP_TOP = int(os.getenv('SEARCH_WARMUP_TOP', 50))
+SEARCH_STATS_FLUSH = 60
+
+# O'xshash kinolar: har soatda o'zgarganlari, har kuni to'liq qayta hisoblanadi
+SIMILAR_TOP_K = int(os.getenv('SIMILAR_TOP_K', 10))
+SIMILAR_SHOW = int(os.getenv('SIMILAR_SHOW', 4))
+SIMILAR_INTERVAL = int(os.getenv('SIMILAR_INTERVAL', 3600))
+SIMILAR_FULL_INTERVAL = int(os.getenv('SIMILAR_FULL_INTERVAL', 24 * 3600))
+
+# Trend: soatlik ko'rishlar, yarim yemirilish davri (soat), hisobga olinadigan oyna (soat)
+TOP_SIZE = 10
+TRENDING_INTERVAL = int(os.getenv('TRENDING_INTERVAL', 300))
+TRENDING_HALF_LIFE = float(os.getenv('TRENDING_HALF_LIFE', 24))
+TRENDING_WINDOW = int(os.getenv('TRENDING_WINDOW', 7 * 24))
+# Xotiradagi toplar bazadan to'liq qayta yuklanadigan oraliq
+LEADERBOARD_RECONCILE = int(os.getenv('LEADERBOARD_RECONCILE', 900))
+
+# Bir foydalanuvchining bir kinoni qayta ochishi shu oraliqda ko'rish hisoblanmaydi
+VIEW_WINDOW = int(os.getenv('VIEW_WINDOW', 24 * 3600))
+# Noyob tomoshabinlar sketchlari: bazaga yozish oralig'i, saqlanadigan kunlar
+VIEWERS_FLUSH = 60
+VIEWERS_RETENTION_DAYS = int(os.getenv('VIEWERS_RETENTION_DAYS', 90))
+CHANNELS_CACHE_TTL = 600
+
+# Anti-flood: sinf -> (soniyasiga token, maksimal burst)
+THROTTLE_LIMITS = {
+    'default': (2.0, 10),
+    'movie': (float(os.getenv('THROTTLE_MOVIE_RATE', 0.2)), int(os.getenv('THROTTLE_MOVIE_BURST', 3))),
+    'search': (float(os.getenv('THROTTLE_SEARCH_RATE', 0.5)), int(os.getenv('THROTTLE_SEARCH_BURST', 5))),
+    'inline': (float(os.getenv('THROTTLE_INLINE_RATE', 3.0)), int(os.getenv('THROTTLE_INLINE_BURST', 15))),
+}
+
+# Qismlarni albom qilib yuborish tezligi (har bir user uchun: albom/soniya, burst)
+ALBUM_RATE = float(os.getenv('ALBUM_RATE', 0.5))
+ALBUM_BURST = int(os.getenv('ALBUM_BURST', 1))
+
+# Inline rejim: Telegram tomonidagi kesh (soniya), bizdagi natija keshi va sahifa hajmi
+INLINE_CACHE_TIME = int(os.getenv('INLINE_CACHE_TIME', 300))
+INLINE_RESULT_TTL = int(os.getenv('INLINE_RESULT_TTL', 300))
+INLINE_PAGE_SIZE = 20
+
+# Yuklama: bir vaqtda ishlanadigan va navbatda turadigan updatelar soni
+MAX_IN_FLIGHT = int(os.getenv('MAX_IN_FLIGHT', 32))
+MAX_PENDING = int(os.getenv('MAX_PENDING', 256))
+
+# Bot API sessiyasi
+API_POOL_SIZE = int(os.getenv('API_POOL_SIZE', 100))
+API_TIMEOUT = float(os.getenv('API_TIMEOUT', 30))
+API_MEDIA_TIMEOUT = float(os.getenv('API_MEDIA_TIMEOUT', 120))
+API_FAST_TIMEOUT = float(os.getenv('API_FAST_TIMEOUT', 10))
+
+# To'xtashda ishlanayotgan updatelarni kutish muddati (soniya)
+SHUTDOWN_TIMEOUT = float(os.getenv('SHUTDOWN_TIMEOUT', 25))
+
+START_SUB_TEXT = (
+    "📢 <b>Botdan foydalanish uchun quyidagi kanallarga obuna bo'ling:</b>\n\n"
+    "Obuna bo'lgach, <b>'✅ Obunani Tekshirish'</b> tugmasini bosing."
+)
 
 # Logging
 logging.basicConfig(
@@ -85,9 +138,35 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 # Bot
-bot = Bot(token=BOT_TOKEN, default=DefaultBotProperties(parse_mode=ParseMode.HTML))
-dp = Dispatcher(storage=MemoryStorage())
+session = TunedAiohttpSession(
+    pool_size=API_POOL_SIZE,
+    timeout=API_TIMEOUT,
+    media_timeout=API_MEDIA_TIMEOUT,
+    fast_timeout=API_FAST_TIMEOUT,
+)
+bot = Bot(token=BOT_TOKEN, session=session, default=DefaultBotProperties(parse_mode=ParseMode.HTML))
+state_backend = create_backend(STATE_BACKEND_URL, max_keys=STATE_CACHE_SIZE)
+storage = SQLiteStorage(state_backend, ttl=FSM_TTL)
+dp = Dispatcher(storage=storage)
 bot_username = ""
+movie_cards = MovieCardRenderer()
+search_index = TrigramIndex()
+prefix_index = PrefixIndex()
+code_filter = CodeFilter()
+query_stats = QueryStats()
+view_buckets = ViewBuckets()
+# O'xshash kinolarni hisoblayotgan jarayon (bo'lmasa None)
+similar_process: Optional[asyncio.subprocess.Process] = None
+viewer_sketches = ViewerSketches()
+# Trend top (so'nuvchi ball bo'yicha) va ko'rishlar/reyting toplari xotirada
+top_lists = {'trend': []}
+leaderboards = Leaderboards(TOP_SIZE)
+catalog_changed = asyncio.Event()
+# Umumiy katalog versiyasi (state backendda) - xotiradagi indekslar shu versiyaga mos
+catalog_version = 0
+album_limiter = RateLimiter(state_backend, ALBUM_RATE, ALBUM_BURST, prefix='rl:album')
+background_tasks = set()
+shutting_down = asyncio.Event()
 
 
 # ============= STATES =============
@@ -202,12 +281,36 @@ async def check_telegram_sub(user_id: int, channel_url: str) -> bool:
         return True
 
 
+async def get_mandatory_channels() -> list:
+    """Majburiy kanallar (kesh orqali)"""
+    channels = await state_backend.get_json('channels:mandatory')
+    if channels is None:
+        channels = db.get_channels(is_mandatory=True)
+        await state_backend.set_json('channels:mandatory', channels, ttl=CHANNELS_CACHE_TTL)
+    return channels
+
+
+async def get_movie_cached(code: str) -> Optional[dict]:
+    """Kino ma'lumotlari (kesh orqali)"""
+    movie = await state_backend.get_json(f'movie:{code}')
+    if movie is None:
+        movie = db.get_movie(code)
+        if movie:
+            # Boshqacha yozilgan kod (k-12) bo'lsa ham asl kod bo'yicha keshlanadi
+            await state_backend.set_json(f"movie:{movie['code']}", movie, ttl=MOVIE_CACHE_TTL)
+    return movie
+
+
 async def check_sub(user_id: int) -> tuple[bool, list]:
     """
     Barcha majburiy kanallar uchun obunani tekshirish
     Returns: (is_subscribed, unsubscribed_channels)
     """
-    channels = db.get_channels(is_mandatory=True)
+    # Faqat muvaffaqiyatli tekshiruv keshlanadi - obuna bo'lgan user darhol o'tadi
+    if await state_backend.get(f'sub:{user_id}'):
+        return True, []
+
+    channels = await get_mandatory_channels()
     logger.info(f"Majburiy kanallar soni: {len(channels)}")
 
     if not channels:
@@ -231,15 +334,15 @@ async def check_sub(user_id: int) -> tuple[bool, list]:
         return False, unsubscribed
 
     logger.info(f"User {user_id} barcha kanallarga obuna")
+    await state_backend.set(f'sub:{user_id}', '1', ttl=SUB_CACHE_TTL)
     return True, []
 
 
-def is_admin(user_id: int) -> bool:
-    """Admin tekshirish"""
-    user = db.get_user(user_id)
+def is_admin(user: Optional[dict]) -> bool:
+    """Admin tekshirish (middleware bergan user bo'yicha)"""
     if not user:
         return False
-    return user_id in ADMIN_IDS or user.get('is_admin', 0) == 1
+    return user['user_id'] in ADMIN_IDS or user.get('is_admin', 0) == 1
 
 
 def get_categories():
@@ -253,6 +356,26 @@ def get_categories():
 def save_categories(categories):
     """Kategoriyalarni saqlash"""
     db.update_setting('movie_categories', ','.join(categories))
+    buttons.set_categories(categories)
+    leaderboards.set_categories(categories)
+    category_emoji.warm(categories)
+
+
+def load_category_emojis():
+    """Admin sozlagan emoji kalitlarini yuklash"""
+    try:
+        overrides = json.loads(db.get_setting('category_emojis', '{}'))
+    except ValueError:
+        overrides = {}
+    category_emoji.load(overrides)
+    category_emoji.warm(get_categories())
+
+
+def save_category_emojis(overrides: dict):
+    """Emoji kalitlarini saqlash"""
+    db.update_setting('category_emojis', json.dumps(overrides, ensure_ascii=False))
+    load_category_emojis()
+    leaderboards.clear_texts()
 
 
 def admin_categories_menu(categories: List[str]) -> ReplyKeyboardMarkup:
@@ -260,49 +383,40 @@ def admin_categories_menu(categories: List[str]) -> ReplyKeyboardMarkup:
     kb = ReplyKeyboardBuilder()
     for cat in categories:
         kb.button(text=f"📂 {cat}")
-    kb.button(text=f"{E.CANCEL} Bekor Qilish")
+    kb.button(text=B.CANCEL)
     kb.adjust(2)
     return kb.as_markup(resize_keyboard=True)
 
 
+async def record_view(code: str, user_id: int):
+    """
+    Ko'rishni hisobga olish: noyob tomoshabinlar sketchiga har doim,
+    hisoblagich, trend va toplarga esa oynada faqat birinchi marta
+    (qayta yuborish, takroriy bosishlar va spam ko'rishlarni oshirmaydi)
+    """
+    viewer_sketches.add(code, user_id)
+    if await state_backend.add(f'viewed:{code}:{user_id}', ttl=VIEW_WINDOW):
+        db.increment_views(code)
+        view_buckets.record(code)
+        leaderboards.view(code)
+
+
 async def send_movie(user_id: int, code: str) -> bool:
     """Kinoni yuborish"""
-    movie = db.get_movie(code)
+    movie = await get_movie_cached(code)
     if not movie:
         return False
 
     try:
-        db.increment_views(code)
+        await record_view(code, user_id)
     except:
         pass
 
-    title = movie.get('title_uz', 'Noma\'lum')
-    desc = movie.get('description_uz', '')
-    year = movie.get('year', '')
-    views = movie.get('views', 0)
-    downloads = movie.get('downloads', 0)
-    rating = movie.get('rating', 0)
-    category = movie.get('category', '')
-
-    caption = f"""
-🎬 <b>{title}</b> {f"({year})" if year else ""}
-
-⭐ Reyting: {rating:.1f}/5.0
-👁️ Ko'rishlar: {views:,}
-🔥 Yuklanganlar: {downloads:,}
-
-📖 {desc}
-
-🏷️ Kategoriya: {category}
-🔑 Kod: <code>{code}</code>
-
-🤖 {bot_username}
-    """.strip()
-
     try:
         file_id = movie.get('file_id')
         is_fav = db.is_favorite(user_id, code)
-        kb = movie_actions(code, bot_username.replace('@', ''), is_fav)
+        similar = tuple(db.get_similar(code, SIMILAR_SHOW))
+        caption, kb = movie_cards.render(movie, bot_username.replace('@', ''), is_fav, similar)
 
         file_type = movie.get('file_type', 'video')
 
@@ -327,49 +441,334 @@ async def send_movie(user_id: int, code: str) -> bool:
         return False
 
 
-async def broadcast(user_ids: list, msg: Message):
-    """Reklama yuborish"""
-    success = failed = 0
+async def deliver_code(msg: Message, user_id: int, code: str) -> bool:
+    """Kod bo'yicha kino yoki qismlar ro'yxatini yuborish; kod topilmasa False"""
+    # Mavjud kodlar to'plamidan: noto'g'ri kod bazaga tegmasdan rad etiladi
+    movie_code, parts_code = code_filter.lookup(code)
+    if not movie_code and not parts_code and await sync_catalog():
+        movie_code, parts_code = code_filter.lookup(code)
+    movie = await get_movie_cached(movie_code) if movie_code else None
 
-    status = await msg.answer(f"📤 Yuborilmoqda...\n✅ {success} | ❌ {failed}")
+    if not movie:
+        parts = db.get_movie_parts(parts_code) if parts_code else []
+        if not parts:
+            return False
+        await msg.answer(
+            f"🎬 Bu kodda {len(parts)} ta qism mavjud:",
+            reply_markup=movie_parts(parts_code, parts)
+        )
+        return True
 
-    for uid in user_ids:
-        try:
-            if msg.text:
-                await bot.send_message(uid, msg.text)
-            elif msg.photo:
-                await bot.send_photo(uid, msg.photo[-1].file_id, caption=msg.caption)
-            elif msg.video:
-                await bot.send_video(uid, msg.video.file_id, caption=msg.caption)
+    if not await send_movie(user_id, movie['code']):
+        await msg.answer("❌ Kino yuborishda xato yuz berdi.")
+    return True
+
+
+def on_catalog_change(event: str, code: str):
+    """Kino qo'shilganda/o'chirilganda xotiradagi indekslarni yangilash"""
+    if event == 'add':
+        movie = db.get_movie(code)
+        if movie:
+            search_index.add(movie)
+            prefix_index.add(movie)
+            code_filter.add_movie(movie['code'])
+            leaderboards.add(movie)
+    elif event == 'part':
+        code_filter.add_parts(code)
+    elif event == 'delete':
+        search_index.remove(code)
+        prefix_index.remove(code)
+        code_filter.remove(code)
+        top_lists['trend'] = [m for m in top_lists['trend'] if m['code'] != code]
+        leaderboards.remove(code)
+    catalog_changed.set()
+    start_background(publish_catalog_change())
+
+
+async def publish_catalog_change():
+    """Boshqa bot nusxalariga katalog o'zgarganini bildirish (umumiy versiya hisoblagichi)"""
+    global catalog_version
+    try:
+        version = await state_backend.incr('catalog:version')
+    except Exception as e:
+        logger.error(f"Catalog version error: {e}")
+        return
+    # Oraliqda boshqa nusxa ham o'zgartirgan bo'lsa - versiya farq qilib qoladi va qayta quriladi
+    if version == catalog_version + 1:
+        catalog_version = version
+
+
+async def sync_catalog() -> bool:
+    """
+    Kod filtrda topilmaganda: boshqa nusxa katalogni o'zgartirgan bo'lsa
+    indekslarni bazadan qayta qurish. Qayta qurilgan bo'lsa True
+    """
+    global catalog_version
+    version = int(await state_backend.get('catalog:version') or 0)
+    if version == catalog_version:
+        return False
+    build_catalog_indexes()
+    catalog_version = version
+    return True
+
+
+async def search_session(query: str, refresh: bool = False) -> Tuple[Optional[str], List[dict]]:
+    """
+    Qidiruv natijalari sessiyasi: (sessiya ID, natijalar).
+    Bir xil (normallashtirilgan) so'rov uchun sessiya qayta ishlatiladi,
+    sahifalar esa bazaga murojaatsiz shu ro'yxatdan kesib olinadi.
+    refresh=True - keshga qaramasdan qayta qurish (warm-up uchun)
+    """
+    key = normalize(query)
+    if not key:
+        return None, []
+
+    sid = None if refresh else await state_backend.get(f'search:q:{key}')
+    if sid:
+        movies = await state_backend.get_json(f'search:s:{sid}')
+        if movies is not None:
+            return sid, movies
+
+    rows, _ = db.search_movies(query, limit=SEARCH_SESSION_MAX, offset=0)
+    movies = [{'code': m['code'], 'title_uz': m['title_uz'], 'views': m['views']} for m in rows]
+    sid = to_base36(await state_backend.incr('search:seq'))
+    await state_backend.set_json(f'search:s:{sid}', movies, ttl=SEARCH_SESSION_TTL)
+    await state_backend.set(f'search:q:{key}', sid, ttl=SEARCH_SESSION_TTL)
+    return sid, movies
+
+
+def flush_query_stats():
+    """Yig'ilgan qidiruv statistikasini bazaga yozish"""
+    rows = query_stats.drain()
+    if rows:
+        db.save_search_queries(rows)
+
+
+def flush_viewer_sketches():
+    """Tomoshabinlar sketchlarini bazadagilari bilan birlashtirib yozish"""
+    rows = []
+    for code, day, sketch in viewer_sketches.drain():
+        stored = db.get_viewer_sketch(code, day)
+        if stored:
+            sketch.merge(HyperLogLog.from_bytes(stored))
+        rows.append((code, day, sketch.to_bytes()))
+    if rows:
+        db.save_viewer_sketches(rows)
+
+
+def unique_viewers(code: str, days: int = 1) -> int:
+    """Oxirgi `days` kundagi noyob tomoshabinlar soni (taxminiy)"""
+    flush_viewer_sketches()
+    total = None
+    for data in db.get_viewer_sketches(code, current_day() - days + 1):
+        sketch = HyperLogLog.from_bytes(data)
+        if total is None:
+            total = sketch
+        else:
+            total.merge(sketch)
+    return total.count() if total is not None else 0
+
+
+def to_base36(number: int) -> str:
+    """Qisqa ID uchun"""
+    digits = '0123456789abcdefghijklmnopqrstuvwxyz'
+    result = ''
+    while True:
+        number, rem = divmod(number, 36)
+        result = digits[rem] + result
+        if not number:
+            return result
+
+
+def search_page_text(movies: List[dict], page: int, total_pages: int) -> str:
+    """Qidiruv natijalari sahifasi matni"""
+    text = f"🔍 <b>QIDIRUV NATIJALARI</b> ({len(movies)} ta)"
+    if total_pages > 1:
+        text += f" - {page}/{total_pages}"
+    text += "\n\n"
+    start = (page - 1) * 10
+    for i, m in enumerate(movies[start:start + 10], start + 1):
+        text += f"{i}. <b>{m['title_uz']}</b>\n"
+        text += f"   🔑 <code>{m['code']}</code> | 👁️ {m['views']:,}\n\n"
+    return text
+
+
+def not_found_text(code: str, suggested: list) -> str:
+    """Kod topilmadi xabari (takliflar bo'lsa - ular haqida)"""
+    text = f"❌ <code>{escape(code)}</code> kodli kino topilmadi."
+    if suggested:
+        text += "\n\n🤔 Balki shulardan birini nazarda tutgandirsiz:"
+    return text
 
-            success += 1
-            if success % 10 == 0:
-                await status.edit_text(f"📤 Yuborilmoqda...\n✅ {success} | ❌ {failed}")
+
+db.add_catalog_listener(on_catalog_change)
+
+
+def build_catalog_indexes():
+    """Xotiradagi katalog indekslarini bazadan qurish"""
+    catalog = db.get_search_catalog()
+    search_index.build(catalog)
+    prefix_index.build(catalog)
+    code_filter.build([m['code'] for m in catalog], db.get_part_codes())
+
+
+def part_caption(code: str, num: int) -> str:
+    """Qism captioni"""
+    return f"🎬 {code} - Qism {num}\n\n🤖 {bot_username}"
+
+
+async def send_parts_album(user_id: int, code: str, parts: List[dict]) -> int:
+    """
+    Qismlarni 10 tadan media guruh qilib yuborish.
+    Guruhlar rate limiter orqali bir tekis yuboriladi. Yuborilgan qismlar soni qaytadi
+    """
+    sent = 0
+    for i in range(0, len(parts), ALBUM_SIZE):
+        if shutting_down.is_set():
+            break
+        chunk = parts[i:i + ALBUM_SIZE]
+        await album_limiter.wait(str(user_id))
+        if len(chunk) == 1:
+            await bot.send_video(user_id, chunk[0]['file_id'], caption=part_caption(code, chunk[0]['part_number']))
+        else:
+            await bot.send_media_group(user_id, [
+                InputMediaVideo(media=p['file_id'], caption=part_caption(code, p['part_number']))
+                for p in chunk
+            ])
+        sent += len(chunk)
+    return sent
+
+
+def save_broadcast(job: Optional[dict], recipients: bool = False):
+    """
+    Reklama holatini saqlash (bot to'xtasa shu joydan davom etadi).
+    Qabul qiluvchilar ro'yxati faqat boshida (recipients=True) bir marta yoziladi,
+    keyingi nazorat nuqtalarida faqat offset va hisoblagichlar saqlanadi.
+    """
+    if not job:
+        db.update_setting('broadcast_checkpoint', '')
+        db.update_setting('broadcast_recipients', '')
+        return
+    if recipients:
+        db.update_setting('broadcast_recipients', json.dumps(job['user_ids']))
+    checkpoint = {k: v for k, v in job.items() if k != 'user_ids'}
+    db.update_setting('broadcast_checkpoint', json.dumps(checkpoint))
+
+
+def load_broadcast() -> Optional[dict]:
+    """Tugallanmagan reklamani olish"""
+    raw = db.get_setting('broadcast_checkpoint', '')
+    if not raw:
+        return None
+    job = json.loads(raw)
+    # Eski formatdagi nazorat nuqtasida ro'yxat ichida saqlangan
+    if 'user_ids' not in job:
+        job['user_ids'] = json.loads(db.get_setting('broadcast_recipients', '') or '[]')
+    return job
+
+
+async def broadcast(job: dict, status: Optional[Message] = None) -> bool:
+    """
+    Reklama yuborish.
+    Bot to'xtatilayotganda to'xtaydi va holatni saqlaydi. True - to'liq yuborildi
+    """
+    user_ids = job['user_ids']
+
+    while job['offset'] < len(user_ids):
+        if shutting_down.is_set():
+            save_broadcast(job)
+            return False
+
+        uid = user_ids[job['offset']]
+        try:
+            await bot.copy_message(uid, job['from_chat_id'], job['message_id'])
+            job['success'] += 1
+            if status and job['success'] % 10 == 0:
+                await status.edit_text(f"📤 Yuborilmoqda...\n✅ {job['success']} | ❌ {job['failed']}")
 
             await asyncio.sleep(0.05)
         except:
-            failed += 1
+            job['failed'] += 1
 
-    return success, failed
+        job['offset'] += 1
+        if job['offset'] % 100 == 0:
+            save_broadcast(job)
+
+    save_broadcast(None)
+    return True
+
+
+async def resume_broadcast():
+    """Oldingi ishga tushishda to'xtagan reklamani davom ettirish"""
+    job = load_broadcast()
+    if not job:
+        return
+
+    logger.info(f"📤 Reklama davom ettirilmoqda: {job['offset']}/{len(job['user_ids'])}")
+    if await broadcast(job):
+        try:
+            await bot.send_message(
+                job['admin_id'],
+                f"✅ Reklama yuborib tugatildi!\n\n"
+                f"📊 Jami: {len(job['user_ids'])}\n"
+                f"✅ Yuborildi: {job['success']}\n"
+                f"❌ Xato: {job['failed']}"
+            )
+        except:
+            pass
+
+
+# ============= MIDDLEWARES =============
+
+# Yuklama oshganda birinchi bo'lib tashlanadigan (arzon, shoshilinch bo'lmagan) so'rovlar
+LOW_PRIORITY_BUTTONS = {'stats', 'all_users', 'movies', 'channel_list', 'profile', 'info', 'downloads'}
+LOW_PRIORITY_COMMANDS = {"/help", "/channels"}
+LOW_PRIORITY_CALLBACKS = {"close", "back_main", "cancel_rate", "current_page"}
+
+
+def is_low_priority(update: types.Update) -> bool:
+    """Update past ustuvorlikdami"""
+    if update.message:
+        text = update.message.text
+        if text in LOW_PRIORITY_COMMANDS:
+            return True
+        button = buttons.resolve(text)
+        return button is not None and button[0] in LOW_PRIORITY_BUTTONS
+    if update.callback_query:
+        return update.callback_query.data in LOW_PRIORITY_CALLBACKS
+    return False
+
+
+admission = AdmissionMiddleware(is_low_priority, max_in_flight=MAX_IN_FLIGHT, max_pending=MAX_PENDING)
+throttling = ThrottlingMiddleware(state_backend, THROTTLE_LIMITS)
+
+dp.update.outer_middleware(admission)
+dp.update.outer_middleware(UserMiddleware(ADMIN_IDS))
+dp.message.outer_middleware(ButtonMiddleware(buttons))
+dp.message.middleware(throttling)
+dp.callback_query.middleware(throttling)
+dp.inline_query.middleware(throttling)
+dp.message.middleware(SubscriptionMiddleware(check_sub, get_mandatory_channels))
+dp.callback_query.middleware(SubscriptionMiddleware(check_sub, get_mandatory_channels))
 
 
 # ============= UNIVERSAL HANDLERS =============
 
-@dp.message(F.text == f"{E.CANCEL} Bekor Qilish")
-async def cancel_handler(msg: Message, state: FSMContext):
+@dp.message(Button('cancel'))
+async def cancel_handler(msg: Message, state: FSMContext, user: Optional[dict] = None):
     """Bekor qilish handleri"""
     await state.clear()
-    if is_admin(msg.from_user.id):
+    if is_admin(user):
         await msg.answer("❌ Bekor qilindi", reply_markup=admin_panel())
     else:
         await msg.answer("❌ Bekor qilindi", reply_markup=main_menu())
 
 
-@dp.message(F.text == f"{E.BACK} Orqaga")
-async def back_handler(msg: Message, state: FSMContext):
+@dp.message(Button('back'))
+async def back_handler(msg: Message, state: FSMContext, user: Optional[dict] = None):
     """Orqaga handleri"""
     await state.clear()
-    if is_admin(msg.from_user.id):
+    if is_admin(user):
         await msg.answer("📊 Admin panelga qaytdingiz", reply_markup=admin_panel())
     else:
         await msg.answer("🏠 Asosiy menyuga qaytdingiz", reply_markup=main_menu())
@@ -377,25 +776,26 @@ async def back_handler(msg: Message, state: FSMContext):
 
 # ============= BASIC HANDLERS =============
 
-@dp.message(CommandStart())
-async def cmd_start(msg: Message):
-    """Start"""
-    uid = msg.from_user.id
-    db.add_user(uid, msg.from_user.username, msg.from_user.full_name)
-    db.update_user_active(uid)
-
-    # Majburiy kanallarni tekshirish
-    is_subscribed, unsubscribed_channels = await check_sub(uid)
-
-    if not is_subscribed and unsubscribed_channels:
-        all_channels = db.get_channels(is_mandatory=True)
+@dp.message(CommandStart(deep_link=True), StartPayload(),
+            flags={'subscription': START_SUB_TEXT, 'throttle': 'movie'})
+async def cmd_start_movie(msg: Message, state: FSMContext, start_code: str):
+    """Deep-link: /start <kod> - kino bitta updateda yuboriladi"""
+    await state.clear()
+    if not await deliver_code(msg, msg.from_user.id, start_code):
+        suggested = prefix_index.suggest(start_code)
+        if suggested:
+            await msg.answer(not_found_text(start_code, suggested), reply_markup=suggestions(suggested))
+            return
         await msg.answer(
-            "📢 <b>Botdan foydalanish uchun quyidagi kanallarga obuna bo'ling:</b>\n\n"
-            "Obuna bo'lgach, <b>'✅ Obunani Tekshirish'</b> tugmasini bosing.",
-            reply_markup=channels_sub(all_channels)
+            f"{not_found_text(start_code, suggested)}\n\n"
+            f"Kino kodini yuboring yoki menyudan tanlang.",
+            reply_markup=main_menu()
         )
-        return
 
+
+@dp.message(CommandStart(), flags={'subscription': START_SUB_TEXT})
+async def cmd_start(msg: Message):
+    """Start"""
     await msg.answer(
         f"🎬 <b>Cinema Botga xush kelibsiz!</b>\n\n"
         f"Kino kodini yuboring yoki menyudan tanlang.",
@@ -404,17 +804,13 @@ async def cmd_start(msg: Message):
 
 
 @dp.message(Command("admin"))
-async def cmd_admin(msg: Message, state: FSMContext):
+async def cmd_admin(msg: Message, state: FSMContext, user: Optional[dict] = None):
     """Admin panel"""
-    uid = msg.from_user.id
-    db.update_user_active(uid)
-
-    if not is_admin(uid):
+    if not is_admin(user):
         await msg.answer("❌ Siz admin emassiz!")
         return
 
-    user = db.get_user(uid)
-    if user and user.get('is_admin'):
+    if user.get('is_admin'):
         stats = db.get_statistics()
         await msg.answer(
             f"📊 <b>ADMIN PANEL</b>\n\n"
@@ -433,8 +829,6 @@ async def cmd_admin(msg: Message, state: FSMContext):
 @dp.message(Command("help"))
 async def cmd_help(msg: Message):
     """Yordam"""
-    uid = msg.from_user.id
-    db.update_user_active(uid)
     await msg.answer(
         f"🤖 <b>CINEMA BOT YORDAM</b>\n\n"
         f"🔑 Kino kodini yuboring va kinoni oling\n"
@@ -450,9 +844,6 @@ async def cmd_help(msg: Message):
 @dp.message(Command("channels"))
 async def check_channels_list(msg: Message):
     """Kanallar ro'yxatini ko'rish"""
-    uid = msg.from_user.id
-    db.update_user_active(uid)
-
     channels = db.get_channels(is_mandatory=True)
     if not channels:
         await msg.answer("❌ Majburiy kanallar yo'q.")
@@ -470,137 +861,80 @@ async def check_channels_list(msg: Message):
 
 # ============= USER HANDLERS =============
 
-@dp.message(F.text == f"{E.MOVIE} Kino Kodini Yuboring")
+@dp.message(Button('code'), flags={'subscription': True})
 async def request_code(msg: Message, state: FSMContext):
     """Kod so'rash"""
-    uid = msg.from_user.id
-    db.update_user_active(uid)
-
-    # Obunani tekshirish
-    is_subscribed, unsubscribed_channels = await check_sub(uid)
-    if not is_subscribed:
-        all_channels = db.get_channels(is_mandatory=True)
-        await msg.answer(
-            "❌ <b>Avval kanallarga obuna bo'ling!</b>",
-            reply_markup=channels_sub(all_channels)
-        )
-        return
-
     await msg.answer("🎬 Kino kodini yuboring:", reply_markup=cancel())
     await state.set_state(UserState.waiting_code)
 
 
-@dp.message(UserState.waiting_code)
+@dp.message(UserState.waiting_code, flags={'subscription': True, 'throttle': 'movie'})
 async def handle_code(msg: Message, state: FSMContext):
     """Kodni qabul qilish"""
-    uid = msg.from_user.id
-    db.update_user_active(uid)
-
-    # Obunani tekshirish
-    is_subscribed, unsubscribed_channels = await check_sub(uid)
-    if not is_subscribed:
-        all_channels = db.get_channels(is_mandatory=True)
-        await msg.answer(
-            "❌ <b>Avval kanallarga obuna bo'ling!</b>",
-            reply_markup=channels_sub(all_channels)
-        )
-        await state.clear()
-        return
-
-    code = msg.text.strip().upper()
-    movie = db.get_movie(code)
-
-    if not movie:
-        parts = db.get_movie_parts(code)
-        if parts:
-            await msg.answer(
-                f"🎬 Bu kodda {len(parts)} ta qism mavjud:",
-                reply_markup=movie_parts(code, parts)
-            )
+    if not await deliver_code(msg, msg.from_user.id, msg.text):
+        suggested = prefix_index.suggest(msg.text)
+        if suggested:
+            await msg.answer(not_found_text(msg.text.strip(), suggested), reply_markup=suggestions(suggested))
         else:
             await msg.answer("❌ Kod topilmadi. Qaytadan kiriting.")
-        await state.clear()
-        return
-
-    if await send_movie(uid, code):
-        await state.clear()
-    else:
-        await msg.answer("❌ Kino yuborishda xato yuz berdi.")
-        await state.clear()
+    await state.clear()
 
 
-@dp.message(F.text == f"{E.SEARCH} Qidirish")
+@dp.message(Button('search'), flags={'subscription': True})
 async def search_menu(msg: Message, state: FSMContext):
     """Qidiruv"""
-    uid = msg.from_user.id
-    db.update_user_active(uid)
-
-    # Obunani tekshirish
-    is_subscribed, unsubscribed_channels = await check_sub(uid)
-    if not is_subscribed:
-        all_channels = db.get_channels(is_mandatory=True)
-        await msg.answer(
-            "❌ <b>Avval kanallarga obuna bo'ling!</b>",
-            reply_markup=channels_sub(all_channels)
-        )
-        return
-
     await msg.answer("🔍 Kino nomini kiriting:", reply_markup=cancel())
     await state.set_state(UserState.waiting_search)
 
 
-@dp.message(UserState.waiting_search)
+@dp.message(UserState.waiting_search, flags={'throttle': 'search'})
 async def handle_search(msg: Message, state: FSMContext):
     """Qidiruvni bajarish"""
-    uid = msg.from_user.id
-    db.update_user_active(uid)
-
     query = msg.text
-    movies, total = db.search_movies(query, limit=10, offset=0)
+    sid, movies = await search_session(query)
+    if query_stats.record(normalize(query), len(movies)):
+        flush_query_stats()
 
     if not movies:
-        await msg.answer("❌ Hech narsa topilmadi")
+        # Aniq moslik yo'q - xatoga chidamli indeksdan o'xshash nomlar
+        similar = search_index.search(query, limit=10)
+        if not similar:
+            await msg.answer("❌ Hech narsa topilmadi")
+        else:
+            text = "🤔 <b>Aniq topilmadi. Balki shulardir:</b>\n\n"
+            for i, m in enumerate(similar, 1):
+                text += f"{i}. <b>{m['title_uz']}</b>\n"
+                text += f"   🔑 <code>{m['code']}</code> | 👁️ {m['views']:,}\n\n"
+            await msg.answer(text, reply_markup=movie_list(similar))
         await state.clear()
         return
 
-    total_pages = max(1, (total + 9) // 10)
-
-    text = f"🔍 <b>QIDIRUV NATIJALARI</b> ({total} ta)\n\n"
-    for i, m in enumerate(movies, 1):
-        text += f"{i}. <b>{m['title_uz']}</b>\n"
-        text += f"   🔑 <code>{m['code']}</code> | 👁️ {m['views']:,}\n\n"
-
-    await msg.answer(text, reply_markup=movie_list(movies, page=1, total_pages=total_pages, query=query))
+    total_pages = max(1, (len(movies) + 9) // 10)
+    await msg.answer(
+        search_page_text(movies, 1, total_pages),
+        reply_markup=movie_list(movies[:10], page=1, total_pages=total_pages, session=sid)
+    )
     await state.clear()
 
 
-@dp.message(F.text == f"{E.TOP} Top Kinolar")
-async def top_movies(msg: Message):
-    """Top kinolar"""
-    uid = msg.from_user.id
-    db.update_user_active(uid)
+TOP_TITLES = {
+    'trend': "🔥 <b>HOZIR TRENDDA</b>",
+    'all': f"🏆 <b>TOP {TOP_SIZE} ENG MASHHUR KINOLAR</b>",
+    'rating': f"⭐ <b>TOP {TOP_SIZE} ENG YUQORI BAHOLANGAN</b>",
+}
+TOP_METRICS = {'all': 'views', 'rating': 'rating'}
 
-    # Obunani tekshirish
-    is_subscribed, unsubscribed_channels = await check_sub(uid)
-    if not is_subscribed:
-        all_channels = db.get_channels(is_mandatory=True)
-        await msg.answer(
-            "❌ <b>Avval kanallarga obuna bo'ling!</b>",
-            reply_markup=channels_sub(all_channels)
-        )
-        return
 
-    movies = db.get_top_movies(10)
+def top_movies_list(kind: str) -> List[dict]:
+    """Top kinolar (xotiradan)"""
+    if kind == 'trend':
+        return top_lists['trend']
+    return leaderboards.top(TOP_METRICS[kind])
 
-    if not movies:
-        await msg.answer(
-            "🎬 <b>Kinolar hali mavjud emas</b>\n\n"
-            "Admin tez orada kinolar qo'shadi.",
-            reply_markup=main_menu()
-        )
-        return
 
-    text = "🏆 <b>TOP 10 ENG MASHHUR KINOLAR</b>\n\n"
+def render_top(kind: str, movies: List[dict]) -> str:
+    """Top kinolar matni"""
+    text = f"{TOP_TITLES[kind]}\n\n"
     text += "━━━━━━━━━━━━━━━━━━━\n\n"
 
     medals = ["🥇", "🥈", "🥉"]
@@ -612,27 +946,50 @@ async def top_movies(msg: Message):
 
     text += "━━━━━━━━━━━━━━━━━━━\n"
     text += f"📊 Jami: {len(movies)} ta kino"
+    return text
 
-    await msg.answer(text)
 
+def top_text(kind: str) -> str:
+    """Top matni (ko'rishlar/reyting toplari tayyor matndan)"""
+    if kind == 'trend':
+        return render_top(kind, top_lists['trend'])
+    return leaderboards.text(TOP_METRICS[kind], '', lambda movies: render_top(kind, movies))
 
-@dp.message(F.text == f"{E.CAT} Kategoriyalar")
-async def categories(msg: Message):
-    """Kategoriyalar"""
-    uid = msg.from_user.id
-    db.update_user_active(uid)
 
-    # Obunani tekshirish
-    is_subscribed, unsubscribed_channels = await check_sub(uid)
-    if not is_subscribed:
-        all_channels = db.get_channels(is_mandatory=True)
+@dp.message(Button('top'), flags={'subscription': True})
+async def top_movies(msg: Message):
+    """Top kinolar (trend bo'lmasa - hamma vaqt)"""
+    kind = 'trend' if top_lists['trend'] else 'all'
+    if not top_movies_list(kind):
         await msg.answer(
-            "❌ <b>Avval kanallarga obuna bo'ling!</b>",
-            reply_markup=channels_sub(all_channels)
+            "🎬 <b>Kinolar hali mavjud emas</b>\n\n"
+            "Admin tez orada kinolar qo'shadi.",
+            reply_markup=main_menu()
         )
         return
 
+    await msg.answer(top_text(kind), reply_markup=top_tabs(kind))
+
+
+@dp.callback_query(TopCB.filter())
+async def top_switch(call: CallbackQuery, callback_data: TopCB):
+    """Trend / hamma vaqt almashtirish"""
+    kind = callback_data.kind
+    if kind not in TOP_TITLES or not top_movies_list(kind):
+        await call.answer("❌ Hozircha ma'lumot yo'q", show_alert=True)
+        return
+    try:
+        await call.message.edit_text(top_text(kind), reply_markup=top_tabs(kind))
+    except:
+        pass
+    await call.answer()
+
+
+@dp.message(Button('categories'), flags={'subscription': True})
+async def categories(msg: Message):
+    """Kategoriyalar"""
     cats = get_categories()
+    buttons.set_categories(cats)
 
     if not cats:
         await msg.answer(
@@ -649,18 +1006,11 @@ async def categories(msg: Message):
     )
 
 
-@dp.message(F.text.regexp(r'^(😂|🎭|⚔️|🔮|💕|👻|😱|🔍|🗺️|🎨|🎌|📺|🎬)'))
-async def category_movies(msg: Message):
+@dp.message(Button('category'))
+async def category_movies(msg: Message, button_arg: str):
     """Kategoriya kinolari"""
-    uid = msg.from_user.id
-    db.update_user_active(uid)
-
-    # Emojilarni olib tashlash
-    cat = msg.text
-    for emoji in ['😂', '🎭', '⚔️', '🔮', '💕', '👻', '😱', '🔍', '🗺️', '🎨', '🎌', '📺', '🎬', '🏷️']:
-        cat = cat.replace(emoji, '').strip()
-
-    movies = db.get_movies_by_category(cat, 10)
+    cat = button_arg
+    movies = leaderboards.top('views', cat)
 
     if not movies:
         # Kategoriya bo'yicha chiroyli xabar
@@ -673,6 +1023,14 @@ async def category_movies(msg: Message):
         )
         return
 
+    await msg.answer(
+        leaderboards.text('views', cat, lambda movies: render_category(cat, movies)),
+        reply_markup=movie_list(movies)
+    )
+
+
+def render_category(cat: str, movies: List[dict]) -> str:
+    """Kategoriya kinolari matni"""
     emoji = get_category_emoji(cat)
     text = f"{emoji} <b>{cat.upper()}</b>\n\n"
     text += f"📊 Jami: {len(movies)} ta kino\n\n"
@@ -681,15 +1039,13 @@ async def category_movies(msg: Message):
         text += f"{i}. 🎬 <b>{m['title_uz']}</b>\n"
         text += f"   🔑 <code>{m['code']}</code>\n"
         text += f"   ⭐ {m['rating']:.1f} | 👁️ {m['views']:,}\n\n"
+    return text
 
-    await msg.answer(text, reply_markup=movie_list(movies))
 
-
-@dp.message(F.text == f"{E.FAV} Sevimlilarim")
+@dp.message(Button('favorites'))
 async def favorites(msg: Message):
     """Sevimlilar"""
     uid = msg.from_user.id
-    db.update_user_active(uid)
     favs = db.get_favorites(uid)
 
     if not favs:
@@ -715,22 +1071,17 @@ async def favorites(msg: Message):
     await msg.answer(text, reply_markup=movie_list(favs[:10]))
 
 
-@dp.message(F.text == f"{E.DOWN} Yuklaganlarim")
-async def downloads(msg: Message):
+@dp.message(Button('downloads'))
+async def downloads(msg: Message, user: Optional[dict] = None):
     """Yuklaganlar"""
-    uid = msg.from_user.id
-    db.update_user_active(uid)
-    user = db.get_user(uid)
     count = user.get('total_downloads', 0) if user else 0
     await msg.answer(f"🔥 Siz <b>{count}</b> ta kino yuklagansiz")
 
 
-@dp.message(F.text == f"{E.PROF} Profil")
-async def profile(msg: Message):
+@dp.message(Button('profile'))
+async def profile(msg: Message, user: Optional[dict] = None):
     """Profil"""
     uid = msg.from_user.id
-    db.update_user_active(uid)
-    user = db.get_user(uid)
     if not user:
         await msg.answer("❌ Profil topilmadi")
         return
@@ -775,11 +1126,9 @@ async def profile(msg: Message):
     await msg.answer(text)
 
 
-@dp.message(F.text == f"{E.INFO} Ma'lumot")
+@dp.message(Button('info'))
 async def info(msg: Message):
     """Ma'lumot"""
-    uid = msg.from_user.id
-    db.update_user_active(uid)
     await msg.answer(
         f"🎬 <b>CINEMA BOT</b>\n\n"
         f"✨ Kinolarni kodlar orqali yuklab oling\n"
@@ -793,15 +1142,20 @@ async def info(msg: Message):
 # ============= CALLBACK HANDLERS =============
 
 @dp.callback_query(F.data == "check_sub")
-async def check_sub_callback(call: CallbackQuery):
+@dp.callback_query(CheckSubCB.filter())
+async def check_sub_callback(call: CallbackQuery, callback_data: Optional[CheckSubCB] = None):
     """Obunani tekshirish"""
     uid = call.from_user.id
-    db.update_user_active(uid)
 
     is_subscribed, unsubscribed_channels = await check_sub(uid)
 
     if is_subscribed:
         await call.message.delete()
+        # Deep-link orqali kelgan bo'lsa - kinoni darhol yuborish
+        code = parse_start_payload(callback_data.payload) if callback_data else None
+        if code and await deliver_code(call.message, uid, code):
+            await call.answer()
+            return
         await call.message.answer(
             "✅ <b>Obuna tasdiqlandi!</b>\n\n"
             "🎬 Botdan foydalanishingiz mumkin!\n"
@@ -818,70 +1172,92 @@ async def check_sub_callback(call: CallbackQuery):
         )
 
 
-@dp.callback_query(F.data.startswith("fav_"))
-async def toggle_fav(call: CallbackQuery):
+# Kino callbacklari: amal -> handler (bitta lug'atdan O(1) yo'naltirish)
+MOVIE_ACTIONS = {}
+
+
+def movie_action(action: MovieAction):
+    """Kino callback amalini ro'yxatdan o'tkazish"""
+    def register(func):
+        MOVIE_ACTIONS[action] = func
+        return func
+    return register
+
+
+def movie_throttle(data: dict) -> str:
+    """Kino yuboradigan amallar qattiqroq cheklanadi"""
+    callback_data = data.get('callback_data')
+    return 'movie' if callback_data and callback_data.action in DELIVERY_ACTIONS else 'default'
+
+
+@dp.callback_query(MovieCB.filter(), flags={'throttle': movie_throttle})
+async def movie_callback(call: CallbackQuery, callback_data: MovieCB):
+    """Kino callbacklari"""
+    await MOVIE_ACTIONS[callback_data.action](call, callback_data)
+
+
+@movie_action(MovieAction.FAV)
+async def toggle_fav(call: CallbackQuery, callback_data: MovieCB):
     """Sevimli qo'shish/o'chirish"""
     uid = call.from_user.id
-    db.update_user_active(uid)
-
-    code = call.data.split("_")[1]
+    code = callback_data.code
 
-    if db.is_favorite(uid, code):
-        db.remove_favorite(uid, code)
-        await call.answer("❤️ Sevimlilardan o'chirildi")
-    else:
+    is_fav = not db.is_favorite(uid, code)
+    if is_fav:
         db.add_favorite(uid, code)
         await call.answer("❤️ Sevimlilarga qo'shildi")
+    else:
+        db.remove_favorite(uid, code)
+        await call.answer("❤️ Sevimlilardan o'chirildi")
 
-    is_fav = db.is_favorite(uid, code)
-    kb = movie_actions(code, bot_username.replace('@', ''), is_fav)
+    movie = await get_movie_cached(code)
+    if movie:
+        similar = tuple(db.get_similar(code, SIMILAR_SHOW))
+        kb = movie_cards.render(movie, bot_username.replace('@', ''), is_fav, similar)[1]
+    else:
+        kb = movie_actions(code, bot_username.replace('@', ''), is_fav)
     try:
         await call.message.edit_reply_markup(reply_markup=kb)
     except:
         pass
 
 
-@dp.callback_query(F.data.startswith("dl_"))
-async def download_movie(call: CallbackQuery):
+@movie_action(MovieAction.DOWNLOAD)
+async def download_movie(call: CallbackQuery, callback_data: MovieCB):
     """Kino yuklab olish"""
-    uid = call.from_user.id
-    db.update_user_active(uid)
-
-    code = call.data.split("_")[1]
-    await send_movie(uid, code)
+    await send_movie(call.from_user.id, callback_data.code)
     await call.answer("🔥 Kino yuborildi!")
 
 
-@dp.callback_query(F.data.startswith("share_"))
-async def share_movie(call: CallbackQuery):
+@movie_action(MovieAction.SHARE)
+async def share_movie(call: CallbackQuery, callback_data: MovieCB):
     """Kino ulashish"""
-    uid = call.from_user.id
-    db.update_user_active(uid)
-
-    code = call.data.split("_")[1]
-    share_text = f"🎬 Kino kodi: {code}\n🤖 {bot_username}"
+    share_text = f"🎬 Kino kodi: {callback_data.code}\n🤖 {bot_username}"
+    if bot_username:
+        share_text += f"\n🔗 {movie_link(bot_username.replace('@', ''), callback_data.code)}"
     await call.answer(f"Ulashish matni:\n\n{share_text}", show_alert=True)
 
 
-@dp.callback_query(F.data.startswith("rate_"))
-async def rate_movie(call: CallbackQuery):
+@movie_action(MovieAction.RATE)
+async def rate_movie(call: CallbackQuery, callback_data: MovieCB):
     """Reyting berish"""
-    uid = call.from_user.id
-    db.update_user_active(uid)
-
-    code = call.data.split("_")[1]
-    await call.message.answer("⭐ Reytingni tanlang:", reply_markup=rating(code))
+    # Inline xabarlarda call.message yo'q - baho so'rovi shaxsiy chatga yuboriladi
+    await bot.send_message(call.from_user.id, "⭐ Reytingni tanlang:", reply_markup=rating(callback_data.code))
+    await call.answer()
 
 
-@dp.callback_query(F.data.startswith("r_"))
-async def handle_rating(call: CallbackQuery):
+@movie_action(MovieAction.RATE_SET)
+async def handle_rating(call: CallbackQuery, callback_data: MovieCB):
     """Reytingni qabul qilish"""
-    uid = call.from_user.id
-    db.update_user_active(uid)
-
-    _, rate, code = call.data.split("_")
+    rate = callback_data.num
+    if not 1 <= rate <= 5:
+        await call.answer("❌ Xato yuz berdi", show_alert=True)
+        return
 
-    if db.add_rating(uid, code, int(rate)):
+    if db.add_rating(call.from_user.id, callback_data.code, rate):
+        movie = db.get_movie(callback_data.code)
+        if movie:
+            leaderboards.rate(movie['code'], movie['rating'], movie['rating_count'])
         await call.message.delete()
         await call.answer(f"✅ {rate} ⭐ reyting berildi!", show_alert=True)
     else:
@@ -891,68 +1267,65 @@ async def handle_rating(call: CallbackQuery):
 @dp.callback_query(F.data == "cancel_rate")
 async def cancel_rating(call: CallbackQuery):
     """Reytingni bekor qilish"""
-    uid = call.from_user.id
-    db.update_user_active(uid)
-
     await call.message.delete()
     await call.answer("❌ Reyting bekor qilindi")
 
 
-@dp.callback_query(F.data.startswith("movie_"))
-async def send_movie_callback(call: CallbackQuery):
+@movie_action(MovieAction.SHOW)
+async def send_movie_callback(call: CallbackQuery, callback_data: MovieCB):
     """Kino callback"""
-    uid = call.from_user.id
-    db.update_user_active(uid)
-
-    code = call.data.split("_")[1]
-    await send_movie(uid, code)
+    await send_movie(call.from_user.id, callback_data.code)
     await call.answer()
 
 
-@dp.callback_query(F.data.startswith("part_"))
-async def send_part(call: CallbackQuery):
+@movie_action(MovieAction.PART)
+async def send_part(call: CallbackQuery, callback_data: MovieCB):
     """Kino qismini yuborish"""
-    uid = call.from_user.id
-    db.update_user_active(uid)
-
-    _, code, num = call.data.split("_")
-    parts = db.get_movie_parts(code)
-
-    part = next((p for p in parts if p['part_number'] == int(num)), None)
+    code, num = callback_data.code, callback_data.num
+    part = db.get_movie_part(code, num)
     if not part:
         await call.answer("❌ Qism topilmadi")
         return
 
     try:
-        await bot.send_video(
-            uid,
-            part['file_id'],
-            caption=f"🎬 {code} - Qism {num}\n\n🤖 {bot_username}"
-        )
+        await bot.send_video(call.from_user.id, part['file_id'], caption=part_caption(code, num))
         await call.answer("✅ Yuborildi")
     except Exception as e:
         await call.answer("❌ Yuborishda xato", show_alert=True)
         logger.error(f"Send part error: {e}")
 
 
-@dp.callback_query(F.data.startswith("back_to_movie_"))
-async def back_to_movie(call: CallbackQuery):
-    """Kinoga qaytish"""
-    uid = call.from_user.id
-    db.update_user_active(uid)
+@movie_action(MovieAction.ALBUM)
+async def send_album(call: CallbackQuery, callback_data: MovieCB):
+    """Qismlarni albom qilib yuborish (num=0 - hammasi, aks holda shu qismdan 10 ta)"""
+    code, num = callback_data.code, callback_data.num
+    if num:
+        parts = db.get_movie_parts_from(code, num, ALBUM_SIZE)
+    else:
+        parts = db.get_movie_parts(code)
+    if not parts:
+        await call.answer("❌ Qism topilmadi")
+        return
 
-    code = call.data.split("_")[3]
-    await send_movie(uid, code)
+    await call.answer(f"📦 {len(parts)} ta qism yuborilmoqda...")
+    try:
+        await send_parts_album(call.from_user.id, code, parts)
+    except Exception as e:
+        await call.message.answer("❌ Yuborishda xato")
+        logger.error(f"Send album error: {e}")
 
 
-@dp.callback_query(F.data.startswith("page_"))
-async def pagination_handler(call: CallbackQuery):
-    """Sahifalash"""
-    uid = call.from_user.id
-    db.update_user_active(uid)
+@movie_action(MovieAction.BACK)
+async def back_to_movie(call: CallbackQuery, callback_data: MovieCB):
+    """Kinoga qaytish"""
+    await send_movie(call.from_user.id, callback_data.code)
+    await call.answer()
+
 
-    _, page, query = call.data.split("_")
-    page = int(page)
+@dp.callback_query(PageCB.filter(), flags={'throttle': 'search'})
+async def pagination_handler(call: CallbackQuery, callback_data: PageCB):
+    """Sahifalash"""
+    page, query = callback_data.page, callback_data.query
 
     if query == "":
         movies, total = db.get_all_movies(limit=10, offset=(page - 1) * 10)
@@ -977,12 +1350,30 @@ async def pagination_handler(call: CallbackQuery):
         await call.answer("✅ Yangilandi")
 
 
+@dp.callback_query(SearchCB.filter(), flags={'throttle': 'search'})
+async def search_page_handler(call: CallbackQuery, callback_data: SearchCB):
+    """Qidiruv sahifalari (sessiyadan, bazaga murojaatsiz)"""
+    movies = await state_backend.get_json(f'search:s:{callback_data.sid}')
+    if not movies:
+        await call.answer("⌛ Qidiruv eskirdi. Qaytadan qidiring.", show_alert=True)
+        return
+
+    total_pages = max(1, (len(movies) + 9) // 10)
+    page = min(max(1, callback_data.page), total_pages)
+    start = (page - 1) * 10
+    try:
+        await call.message.edit_text(
+            search_page_text(movies, page, total_pages),
+            reply_markup=movie_list(movies[start:start + 10], page=page, total_pages=total_pages,
+                                    session=callback_data.sid)
+        )
+    except:
+        await call.answer("✅ Yangilandi")
+
+
 @dp.callback_query(F.data == "back_main")
 async def back_to_main(call: CallbackQuery):
     """Asosiy menyuga qaytish"""
-    uid = call.from_user.id
-    db.update_user_active(uid)
-
     await call.message.delete()
     await call.message.answer("🏠 Asosiy menyu:", reply_markup=main_menu())
 
@@ -990,19 +1381,100 @@ async def back_to_main(call: CallbackQuery):
 @dp.callback_query(F.data == "close")
 async def close_message(call: CallbackQuery):
     """Xabarni yopish"""
-    uid = call.from_user.id
-    db.update_user_active(uid)
-
     await call.message.delete()
 
 
+@dp.callback_query(F.data.func(parse_legacy).as_('callback_data'), flags={'throttle': movie_throttle})
+async def legacy_movie_callback(call: CallbackQuery, callback_data: MovieCB):
+    """Eski formatdagi tugmalar (oldin yuborilgan xabarlarda)"""
+    await MOVIE_ACTIONS[callback_data.action](call, callback_data)
+
+
+# ============= INLINE REJIM =============
+
+async def inline_movies(query: str, offset: int) -> list:
+    """
+    Inline qidiruv natijalari: oddiy qidiruv sessiyasi (topilmasa xatoga chidamli indeks),
+    sahifa kinolari esa kodlar bo'yicha bitta so'rov bilan. Normallashtirilgan so'rov bo'yicha keshlanadi.
+    """
+    key = f'inline:{offset}:{normalize(query)}'
+    movies = await state_backend.get_json(key)
+    if movies is None:
+        if query:
+            _, hits = await search_session(query)
+            if not hits:
+                hits = search_index.search(query, limit=INLINE_PAGE_SIZE) if offset == 0 else []
+        else:
+            hits = leaderboards.top('views') if offset == 0 else []
+        codes = [m['code'] for m in hits[offset:offset + INLINE_PAGE_SIZE]]
+        movies = [
+            {k: m.get(k) for k in ('code', 'title_uz', 'description_uz', 'year', 'category',
+                                   'views', 'downloads', 'rating', 'file_id', 'file_type')}
+            for m in db.get_movies_by_codes(codes)
+        ]
+        await state_backend.set_json(key, movies, ttl=INLINE_RESULT_TTL)
+    return movies
+
+
+def inline_result(movie: dict):
+    """Kino -> saqlangan media natijasi (file_id bo'yicha)"""
+    bot_user = bot_username.replace('@', '')
+    caption = movie_cards.inline_caption(movie, bot_user)
+    kb = movie_inline(movie['code'], bot_user)
+    title = movie['title_uz'] or movie['code']
+    description = f"🔑 {movie['code']} | 👁️ {movie['views'] or 0:,}"
+    if movie['file_type'] == 'photo':
+        return InlineQueryResultCachedPhoto(
+            id=movie['code'], photo_file_id=movie['file_id'], title=title, description=description,
+            caption=caption, parse_mode=ParseMode.HTML, reply_markup=kb
+        )
+    return InlineQueryResultCachedVideo(
+        id=movie['code'], video_file_id=movie['file_id'], title=title, description=description,
+        caption=caption, parse_mode=ParseMode.HTML, reply_markup=kb
+    )
+
+
+@dp.inline_query(flags={'throttle': 'inline'})
+async def inline_search(query: InlineQuery):
+    """@bot so'rov - kinolarni inline qidirish"""
+    # Majburiy kanal bo'lsa natijalar shaxsiy keshlanadi (obunasiz user boshqaning keshini olmasin)
+    personal = bool(await get_mandatory_channels())
+    if personal:
+        is_subscribed, _ = await check_sub(query.from_user.id)
+        if not is_subscribed:
+            await query.answer(
+                [], cache_time=0, is_personal=True,
+                button=InlineQueryResultsButton(text="📢 Kanallarga obuna bo'ling", start_parameter=SUBSCRIBE_PAYLOAD)
+            )
+            return
+
+    text = query.query.strip()[:64]
+    offset = int(query.offset) if query.offset.isdigit() else 0
+    movies = await inline_movies(text, offset)
+
+    next_offset = str(offset + INLINE_PAGE_SIZE) if text and len(movies) == INLINE_PAGE_SIZE else ''
+    await query.answer(
+        [inline_result(m) for m in movies if m['file_id']],
+        cache_time=INLINE_CACHE_TIME, is_personal=personal, next_offset=next_offset
+    )
+
+
+@dp.chosen_inline_result()
+async def inline_chosen(result: ChosenInlineResult):
+    """Inline orqali yuborilgan kino statistikasi (BotFather /setinlinefeedback)"""
+    try:
+        await record_view(result.result_id, result.from_user.id)
+        db.increment_downloads(result.result_id)
+    except:
+        pass
+
+
 # ============= ADMIN HANDLERS =============
 
 @dp.message(AdminState.waiting_password)
 async def admin_password(msg: Message, state: FSMContext):
     """Admin paroli"""
     uid = msg.from_user.id
-    db.update_user_active(uid)
 
     if msg.text == ADMIN_PASSWORD:
         with db.get_connection() as conn:
@@ -1022,15 +1494,9 @@ async def admin_password(msg: Message, state: FSMContext):
         await msg.answer("❌ Noto'g'ri parol!")
 
 
-@dp.message(F.text == "👑 Adminlar")
+@dp.message(Button('admins'), IsAdmin(ADMIN_IDS))
 async def admin_management(msg: Message):
     """Admin boshqaruv"""
-    if not is_admin(msg.from_user.id):
-        return
-
-    uid = msg.from_user.id
-    db.update_user_active(uid)
-
     with db.get_connection() as conn:
         rows = conn.execute('''
             SELECT user_id, username, full_name 
@@ -1053,24 +1519,18 @@ async def admin_management(msg: Message):
     text += "Tanlang:"
 
     kb = ReplyKeyboardBuilder()
-    kb.button(text="➕ Admin Qo'shish")
+    kb.button(text=B.ADD_ADMIN)
     if admins and len(admins) > 1:
-        kb.button(text="🗑️ Admin O'chirish")
-    kb.button(text=f"{E.BACK} Orqaga")
+        kb.button(text=B.DEL_ADMIN)
+    kb.button(text=B.BACK)
     kb.adjust(2, 1)
 
     await msg.answer(text, reply_markup=kb.as_markup(resize_keyboard=True))
 
 
-@dp.message(F.text == "➕ Admin Qo'shish")
+@dp.message(Button('add_admin'), IsAdmin(ADMIN_IDS))
 async def add_admin_start(msg: Message, state: FSMContext):
     """Yangi admin qo'shish"""
-    if not is_admin(msg.from_user.id):
-        return
-
-    uid = msg.from_user.id
-    db.update_user_active(uid)
-
     await msg.answer(
         "➕ <b>YANGI ADMIN QO'SHISH</b>\n\n"
         "Yangi admin qo'shmoqchi bo'lgan userning:\n"
@@ -1086,9 +1546,6 @@ async def add_admin_start(msg: Message, state: FSMContext):
 @dp.message(AdminState.waiting_add_admin)
 async def add_admin_handler(msg: Message, state: FSMContext):
     """Admin qo'shishni qayta ishlash"""
-    uid = msg.from_user.id
-    db.update_user_active(uid)
-
     query = msg.text.strip()
 
     if query.isdigit():
@@ -1171,36 +1628,13 @@ async def add_admin_handler(msg: Message, state: FSMContext):
     await state.clear()
 
 
-# Admin panel keyboardini yangilash
-def admin_panel() -> ReplyKeyboardMarkup:
-    """Admin panel"""
-    kb = ReplyKeyboardBuilder()
-    kb.button(text=f"{E.ADD} Kino Qo'shish")
-    kb.button(text=f"{E.DEL} Kino O'chirish")
-    kb.button(text=f"{E.LIST} Kinolar")
-    kb.button(text=f"{E.STATS} Statistika")
-    kb.button(text=f"{E.USERS} Userlar")
-    kb.button(text=f"{E.CHAN} Kanallar")
-    kb.button(text=f"{E.MSG} Reklama")
-    kb.button(text="👑 Adminlar")
-    kb.button(text=f"{E.HOME} Chiqish")
-    kb.adjust(2)
-    return kb.as_markup(resize_keyboard=True)
-
-
 # Qolgan admin handlerlar davom etadi...
 # [Previous admin handlers continue here - kino qo'shish, o'chirish, va hokazo]
 # ============= QOLGAN ADMIN HANDLERS =============
 
-@dp.message(F.text == f"{E.ADD} Kino Qo'shish")
+@dp.message(Button('add_movie'), IsAdmin(ADMIN_IDS))
 async def add_movie_start(msg: Message, state: FSMContext):
     """Kino qo'shish"""
-    if not is_admin(msg.from_user.id):
-        return
-
-    uid = msg.from_user.id
-    db.update_user_active(uid)
-
     cats = get_categories()
     if not cats:
         await msg.answer("❌ Avval kategoriya qo'shing!", reply_markup=admin_panel())
@@ -1213,14 +1647,18 @@ async def add_movie_start(msg: Message, state: FSMContext):
 @dp.message(AdminState.waiting_movie_code)
 async def movie_code_input(msg: Message, state: FSMContext):
     """Kino kodi"""
-    uid = msg.from_user.id
-    db.update_user_active(uid)
-
     code = msg.text.strip().upper()
     if db.get_movie(code):
         await msg.answer("❌ Bu kod mavjud!")
         return
 
+    # Kod callback ichiga (64 bayt) sig'ishi va ajratuvchi belgisiz bo'lishi kerak
+    try:
+        MovieCB(action=MovieAction.PART, code=code, num=999).pack()
+    except ValueError:
+        await msg.answer("❌ Kod juda uzun yoki ':' belgisi bor. Boshqa kod kiriting:")
+        return
+
     await state.update_data(code=code)
     await msg.answer("📝 Kino nomini kiriting:")
     await state.set_state(AdminState.waiting_movie_title)
@@ -1229,9 +1667,6 @@ async def movie_code_input(msg: Message, state: FSMContext):
 @dp.message(AdminState.waiting_movie_title)
 async def movie_title_input(msg: Message, state: FSMContext):
     """Kino nomi"""
-    uid = msg.from_user.id
-    db.update_user_active(uid)
-
     await state.update_data(title=msg.text)
     await msg.answer("📖 Tavsifini kiriting:")
     await state.set_state(AdminState.waiting_movie_desc)
@@ -1240,9 +1675,6 @@ async def movie_title_input(msg: Message, state: FSMContext):
 @dp.message(AdminState.waiting_movie_desc)
 async def movie_desc_input(msg: Message, state: FSMContext):
     """Tavsif"""
-    uid = msg.from_user.id
-    db.update_user_active(uid)
-
     await state.update_data(desc=msg.text)
 
     cats = get_categories()
@@ -1253,10 +1685,7 @@ async def movie_desc_input(msg: Message, state: FSMContext):
 @dp.message(AdminState.waiting_movie_category)
 async def movie_cat_input(msg: Message, state: FSMContext):
     """Kino qo'shishda kategoriya tanlash"""
-    uid = msg.from_user.id
-    db.update_user_active(uid)
-
-    if msg.text == f"{E.CANCEL} Bekor Qilish":
+    if msg.text == B.CANCEL:
         await state.clear()
         await msg.answer("❌ Bekor qilindi", reply_markup=admin_panel())
         return
@@ -1281,7 +1710,6 @@ async def movie_cat_input(msg: Message, state: FSMContext):
 async def movie_file_input(msg: Message, state: FSMContext):
     """Kino fayli"""
     uid = msg.from_user.id
-    db.update_user_active(uid)
 
     data = await state.get_data()
     category = data.get('category')
@@ -1345,15 +1773,9 @@ async def movie_file_input(msg: Message, state: FSMContext):
     await state.clear()
 
 
-@dp.message(F.text == f"{E.DEL} Kino O'chirish")
+@dp.message(Button('del_movie'), IsAdmin(ADMIN_IDS))
 async def delete_movie_start(msg: Message, state: FSMContext):
     """Kino o'chirish"""
-    if not is_admin(msg.from_user.id):
-        return
-
-    uid = msg.from_user.id
-    db.update_user_active(uid)
-
     await msg.answer("🗑️ O'chirish uchun kodni kiriting:", reply_markup=cancel())
     await state.set_state(AdminState.waiting_delete_code)
 
@@ -1361,12 +1783,13 @@ async def delete_movie_start(msg: Message, state: FSMContext):
 @dp.message(AdminState.waiting_delete_code)
 async def delete_movie_code(msg: Message, state: FSMContext):
     """Kino o'chirish kodi"""
-    uid = msg.from_user.id
-    db.update_user_active(uid)
-
-    code = msg.text.strip().upper()
-    if db.get_movie(code):
+    movie = db.get_movie(msg.text.strip().upper())
+    if movie:
+        # Kiritilgan kod normallashtirilgan kalit orqali topilgan bo'lishi mumkin
+        code = movie['code']
         db.delete_movie(code)
+        await state_backend.delete(f'movie:{code}')
+        movie_cards.invalidate(code)
         await msg.answer(f"✅ Kino o'chirildi: <code>{code}</code>", reply_markup=admin_panel())
     else:
         await msg.answer("❌ Kod topilmadi!", reply_markup=admin_panel())
@@ -1374,15 +1797,9 @@ async def delete_movie_code(msg: Message, state: FSMContext):
     await state.clear()
 
 
-@dp.message(F.text == f"{E.LIST} Kinolar")
+@dp.message(Button('movies'), IsAdmin(ADMIN_IDS))
 async def list_movies(msg: Message):
     """Kinolar ro'yxati"""
-    if not is_admin(msg.from_user.id):
-        return
-
-    uid = msg.from_user.id
-    db.update_user_active(uid)
-
     movies, total = db.get_all_movies(limit=10)
     total_pages = max(1, (total + 9) // 10)
 
@@ -1398,16 +1815,12 @@ async def list_movies(msg: Message):
     await msg.answer(text, reply_markup=movie_list(movies, page=1, total_pages=total_pages))
 
 
-@dp.message(F.text == f"{E.STATS} Statistika")
+@dp.message(Button('stats'), IsAdmin(ADMIN_IDS))
 async def statistics(msg: Message):
     """Statistika"""
-    if not is_admin(msg.from_user.id):
-        return
-
-    uid = msg.from_user.id
-    db.update_user_active(uid)
-
     stats = db.get_statistics()
+    load = admission.stats()
+    api = session.stats()
     text = f"""
 📊 <b>STATISTIKA</b>
 
@@ -1426,32 +1839,31 @@ async def statistics(msg: Message):
 📈 BUGUN:
 ├── Yangi userlar: {stats['today_new_users']:,}
 └── Faol userlar: {stats['today_active_users']:,}
+
+⚙️ YUKLAMA:
+├── Ishlanmoqda: {load['in_flight']:,}
+├── Navbatda: {load['pending']:,} (eng ko'p: {load['peak_pending']:,})
+├── Bajarilgan: {load['processed']:,}
+└── Tashlangan: {load['shed_low']:,} past / {load['shed_high']:,} yuqori
+
+🌐 TELEGRAM API:
+├── Pool: {api['pool_size']} (faol so'rovlar: {api['active']}, eng ko'p: {api['peak_active']})
+├── So'rovlar: {api['requests']:,} (o'rtacha {api['avg_latency_ms']} ms)
+└── Tarmoq xatolari: {api['network_errors']:,}
     """.strip()
 
     await msg.answer(text)
 
 
-@dp.message(F.text == f"{E.USERS} Userlar")
+@dp.message(Button('users'), IsAdmin(ADMIN_IDS))
 async def users_menu(msg: Message):
     """User boshqaruv"""
-    if not is_admin(msg.from_user.id):
-        return
-
-    uid = msg.from_user.id
-    db.update_user_active(uid)
-
     await msg.answer("👥 User boshqaruv:", reply_markup=user_management())
 
 
-@dp.message(F.text == "🚫 Bloklash")
+@dp.message(Button('block'), IsAdmin(ADMIN_IDS))
 async def block_user_start(msg: Message, state: FSMContext):
     """User bloklash"""
-    if not is_admin(msg.from_user.id):
-        return
-
-    uid = msg.from_user.id
-    db.update_user_active(uid)
-
     await msg.answer("🚫 Bloklash uchun user ID kiriting:", reply_markup=cancel())
     await state.set_state(AdminState.waiting_user_id_block)
 
@@ -1459,9 +1871,6 @@ async def block_user_start(msg: Message, state: FSMContext):
 @dp.message(AdminState.waiting_user_id_block)
 async def block_user_id(msg: Message, state: FSMContext):
     """User ID bloklash"""
-    uid = msg.from_user.id
-    db.update_user_active(uid)
-
     try:
         target_uid = int(msg.text)
         if db.get_user(target_uid):
@@ -1479,15 +1888,9 @@ async def block_user_id(msg: Message, state: FSMContext):
     await state.clear()
 
 
-@dp.message(F.text == "🔓 Blokdan Chiqarish")
+@dp.message(Button('unblock'), IsAdmin(ADMIN_IDS))
 async def unblock_user_start(msg: Message, state: FSMContext):
     """Blokdan chiqarish"""
-    if not is_admin(msg.from_user.id):
-        return
-
-    uid = msg.from_user.id
-    db.update_user_active(uid)
-
     await msg.answer("🔓 Blokdan chiqarish uchun user ID:", reply_markup=cancel())
     await state.set_state(AdminState.waiting_user_id_unblock)
 
@@ -1495,9 +1898,6 @@ async def unblock_user_start(msg: Message, state: FSMContext):
 @dp.message(AdminState.waiting_user_id_unblock)
 async def unblock_user_id(msg: Message, state: FSMContext):
     """User ID blokdan chiqarish"""
-    uid = msg.from_user.id
-    db.update_user_active(uid)
-
     try:
         target_uid = int(msg.text)
         if db.get_user(target_uid):
@@ -1515,15 +1915,9 @@ async def unblock_user_id(msg: Message, state: FSMContext):
     await state.clear()
 
 
-@dp.message(F.text == f"{E.SEARCH} User Qidirish")
+@dp.message(Button('user_search'), IsAdmin(ADMIN_IDS))
 async def search_user_start(msg: Message, state: FSMContext):
     """User qidirish"""
-    if not is_admin(msg.from_user.id):
-        return
-
-    uid = msg.from_user.id
-    db.update_user_active(uid)
-
     await msg.answer("🔍 User ID, username yoki ismini kiriting:", reply_markup=cancel())
     await state.set_state(AdminState.waiting_user_search)
 
@@ -1531,9 +1925,6 @@ async def search_user_start(msg: Message, state: FSMContext):
 @dp.message(AdminState.waiting_user_search)
 async def search_user_handler(msg: Message, state: FSMContext):
     """User qidiruv"""
-    uid = msg.from_user.id
-    db.update_user_active(uid)
-
     users = db.search_users(msg.text)
 
     if not users:
@@ -1556,15 +1947,9 @@ async def search_user_handler(msg: Message, state: FSMContext):
     await state.clear()
 
 
-@dp.message(F.text == f"{E.LIST} Barcha Userlar")
+@dp.message(Button('all_users'), IsAdmin(ADMIN_IDS))
 async def all_users(msg: Message):
     """Barcha userlar"""
-    if not is_admin(msg.from_user.id):
-        return
-
-    uid = msg.from_user.id
-    db.update_user_active(uid)
-
     users = db.get_users_list(limit=20)
 
     if not users:
@@ -1583,27 +1968,15 @@ async def all_users(msg: Message):
     await msg.answer(text)
 
 
-@dp.message(F.text == f"{E.CHAN} Kanallar")
+@dp.message(Button('channels'), IsAdmin(ADMIN_IDS))
 async def channels_menu(msg: Message):
     """Kanallar menyusi"""
-    if not is_admin(msg.from_user.id):
-        return
-
-    uid = msg.from_user.id
-    db.update_user_active(uid)
-
     await msg.answer("📢 Kanallar boshqaruv:", reply_markup=channels_management())
 
 
-@dp.message(F.text == f"{E.ADD} Kanal Qo'shish")
+@dp.message(Button('add_channel'), IsAdmin(ADMIN_IDS))
 async def add_channel_start(msg: Message, state: FSMContext):
     """Kanal qo'shish"""
-    if not is_admin(msg.from_user.id):
-        return
-
-    uid = msg.from_user.id
-    db.update_user_active(uid)
-
     await msg.answer("📝 Kanal nomini kiriting:", reply_markup=cancel())
     await state.set_state(AdminState.waiting_channel_name)
 
@@ -1611,9 +1984,6 @@ async def add_channel_start(msg: Message, state: FSMContext):
 @dp.message(AdminState.waiting_channel_name)
 async def channel_name_input(msg: Message, state: FSMContext):
     """Kanal nomi"""
-    uid = msg.from_user.id
-    db.update_user_active(uid)
-
     await state.update_data(ch_name=msg.text)
     await msg.answer("🔗 Kanal havolasini kiriting:")
     await state.set_state(AdminState.waiting_channel_url)
@@ -1622,9 +1992,6 @@ async def channel_name_input(msg: Message, state: FSMContext):
 @dp.message(AdminState.waiting_channel_url)
 async def channel_url_input(msg: Message, state: FSMContext):
     """Kanal havolasi"""
-    uid = msg.from_user.id
-    db.update_user_active(uid)
-
     url = msg.text.strip()
 
     # Formatni to'g'rilash
@@ -1651,13 +2018,12 @@ async def channel_url_input(msg: Message, state: FSMContext):
     await state.set_state(AdminState.waiting_channel_type)
 
 
-@dp.callback_query(F.data.startswith("ct_"))
-async def channel_type_select(call: CallbackQuery, state: FSMContext):
+@dp.callback_query(ChannelTypeCB.filter())
+async def channel_type_select(call: CallbackQuery, state: FSMContext, callback_data: ChannelTypeCB):
     """Kanal turi"""
     uid = call.from_user.id
-    db.update_user_active(uid)
 
-    ch_type = call.data.replace("ct_", "")
+    ch_type = callback_data.type
     data = await state.get_data()
 
     if db.add_channel(
@@ -1666,6 +2032,7 @@ async def channel_type_select(call: CallbackQuery, state: FSMContext):
             channel_type=ch_type,
             added_by=uid
     ):
+        await state_backend.delete('channels:mandatory')
         await call.message.delete()
         await call.message.answer(f"✅ Kanal qo'shildi!\n\n📝 {data['ch_name']}")
         await call.message.answer("📢 Kanallar boshqaruv:", reply_markup=channels_management())
@@ -1675,15 +2042,9 @@ async def channel_type_select(call: CallbackQuery, state: FSMContext):
     await state.clear()
 
 
-@dp.message(F.text == f"{E.DEL} Kanal O'chirish")
+@dp.message(Button('del_channel'), IsAdmin(ADMIN_IDS))
 async def delete_channel_start(msg: Message, state: FSMContext):
     """Kanal o'chirish"""
-    if not is_admin(msg.from_user.id):
-        return
-
-    uid = msg.from_user.id
-    db.update_user_active(uid)
-
     channels = db.get_channels()
     if not channels:
         await msg.answer("📋 Kanallar yo'q")
@@ -1702,12 +2063,10 @@ async def delete_channel_start(msg: Message, state: FSMContext):
 @dp.message(AdminState.waiting_delete_channel)
 async def delete_channel_id(msg: Message, state: FSMContext):
     """Kanal o'chirish ID"""
-    uid = msg.from_user.id
-    db.update_user_active(uid)
-
     try:
         ch_id = int(msg.text)
         if db.delete_channel(ch_id):
+            await state_backend.delete('channels:mandatory')
             await msg.answer(f"✅ Kanal o'chirildi: {ch_id}", reply_markup=channels_management())
         else:
             await msg.answer("❌ Kanal topilmadi!", reply_markup=channels_management())
@@ -1717,15 +2076,9 @@ async def delete_channel_id(msg: Message, state: FSMContext):
     await state.clear()
 
 
-@dp.message(F.text == f"{E.LIST} Kanallar")
+@dp.message(Button('channel_list'), IsAdmin(ADMIN_IDS))
 async def list_channels(msg: Message):
     """Kanallar ro'yxati"""
-    if not is_admin(msg.from_user.id):
-        return
-
-    uid = msg.from_user.id
-    db.update_user_active(uid)
-
     channels = db.get_channels()
     if not channels:
         await msg.answer("📋 Kanallar yo'q")
@@ -1740,15 +2093,9 @@ async def list_channels(msg: Message):
     await msg.answer(text)
 
 
-@dp.message(F.text == f"{E.MSG} Reklama")
+@dp.message(Button('broadcast'), IsAdmin(ADMIN_IDS))
 async def broadcast_start(msg: Message, state: FSMContext):
     """Reklama yuborish"""
-    if not is_admin(msg.from_user.id):
-        return
-
-    uid = msg.from_user.id
-    db.update_user_active(uid)
-
     await msg.answer("📢 Reklama xabarini yuboring:", reply_markup=cancel())
     await state.set_state(AdminState.waiting_broadcast)
 
@@ -1756,40 +2103,296 @@ async def broadcast_start(msg: Message, state: FSMContext):
 @dp.message(AdminState.waiting_broadcast)
 async def broadcast_message(msg: Message, state: FSMContext):
     """Reklama xabari"""
-    uid = msg.from_user.id
-    db.update_user_active(uid)
-
     users = db.get_all_users()
     if not users:
         await msg.answer("❌ Userlar yo'q!")
         await state.clear()
         return
 
-    success, failed = await broadcast(users, msg)
+    job = {
+        'user_ids': users,
+        'from_chat_id': msg.chat.id,
+        'message_id': msg.message_id,
+        'admin_id': msg.from_user.id,
+        'offset': 0,
+        'success': 0,
+        'failed': 0,
+    }
+    save_broadcast(job, recipients=True)
+    await state.clear()
+
+    status = await msg.answer("📤 Yuborilmoqda...\n✅ 0 | ❌ 0")
+    if not await broadcast(job, status):
+        await msg.answer("⏸ Bot qayta ishga tushirilmoqda. Reklama keyin davom ettiriladi.")
+        return
 
     await msg.answer(
         f"✅ Reklama yuborildi!\n\n"
         f"📊 Jami: {len(users)}\n"
-        f"✅ Yuborildi: {success}\n"
-        f"❌ Xato: {failed}",
+        f"✅ Yuborildi: {job['success']}\n"
+        f"❌ Xato: {job['failed']}",
         reply_markup=admin_panel()
     )
-    await state.clear()
 
 
-@dp.message(F.text == f"{E.HOME} Chiqish")
+@dp.message(Command("emoji"), IsAdmin(ADMIN_IDS))
+async def category_emoji_settings(msg: Message):
+    """Kategoriya emojilarini sozlash: /emoji kalit 🎭 | /emoji kalit -"""
+    args = (msg.text or '').split(maxsplit=2)[1:]
+    overrides = dict(category_emoji.overrides)
+
+    if len(args) == 2:
+        key, emoji = args[0].lower(), args[1].strip()
+        if emoji == '-':
+            if overrides.pop(key, None) is None:
+                await msg.answer(f"❌ <b>{key}</b> kaliti topilmadi")
+                return
+            save_category_emojis(overrides)
+            await msg.answer(f"🗑️ <b>{key}</b> kaliti o'chirildi")
+            return
+        overrides[key] = emoji
+        save_category_emojis(overrides)
+        await msg.answer(f"✅ {emoji} <b>{key}</b> saqlandi")
+        return
+
+    text = "🏷️ <b>KATEGORIYA EMOJILARI</b>\n\n"
+    for cat in get_categories():
+        text += f"{get_category_emoji(cat)} {cat}\n"
+    if overrides:
+        text += "\n⚙️ <b>Sozlangan kalitlar:</b>\n"
+        for key, emoji in overrides.items():
+            text += f"{emoji} <code>{key}</code>\n"
+    text += (
+        "\n💡 Qo'shish: <code>/emoji kalit 🎭</code>\n"
+        "🗑️ O'chirish: <code>/emoji kalit -</code>"
+    )
+    await msg.answer(text)
+
+
+@dp.message(Command("searches"), IsAdmin(ADMIN_IDS))
+async def search_report(msg: Message):
+    """Qidiruv hisoboti: eng ko'p va natijasiz so'rovlar"""
+    flush_query_stats()
+    top = db.get_top_searches(15)
+    zero = db.get_zero_searches(10)
+
+    text = "🔍 <b>ENG KO'P QIDIRILGANLAR</b>\n\n"
+    if top:
+        for i, row in enumerate(top, 1):
+            text += f"{i}. {escape(row['query'])} — {row['count']:,} marta ({row['results']} ta natija)\n"
+    else:
+        text += "Hali qidiruvlar yo'q\n"
+
+    if zero:
+        text += "\n❌ <b>NATIJASIZ QIDIRUVLAR</b>\n\n"
+        for i, row in enumerate(zero, 1):
+            text += f"{i}. {escape(row['query'])} — {row['zero_count']:,} marta\n"
+        text += "\n💡 Bu kinolarni qo'shishni o'ylab ko'ring."
+
+    await msg.answer(text)
+
+
+@dp.message(Command("viewers"), IsAdmin(ADMIN_IDS))
+async def viewers_report(msg: Message):
+    """Kinoning noyob tomoshabinlari: /viewers KOD"""
+    args = (msg.text or '').split(maxsplit=1)[1:]
+    movie = await get_movie_cached(args[0].strip()) if args else None
+    if not movie:
+        await msg.answer("ℹ️ Foydalanish: <code>/viewers KOD</code>")
+        return
+
+    code = movie['code']
+    text = f"👥 <b>NOYOB TOMOSHABINLAR</b>\n\n🎬 {movie['title_uz']} (<code>{code}</code>)\n\n"
+    for days, label in ((1, "Bugun"), (7, "7 kun"), (30, "30 kun"), (VIEWERS_RETENTION_DAYS, f"{VIEWERS_RETENTION_DAYS} kun")):
+        text += f"• {label}: ~{unique_viewers(code, days):,}\n"
+    text += f"\n👁️ Ko'rishlar (jami): {movie.get('views', 0):,}"
+    await msg.answer(text)
+
+
+@dp.message(Button('exit'))
 async def exit_admin(msg: Message):
     """Admin paneldan chiqish"""
-    uid = msg.from_user.id
-    db.update_user_active(uid)
     await msg.answer("👋 Asosiy menyuga qaytdingiz", reply_markup=main_menu())
 
 
 # ============= STARTUP/SHUTDOWN =============
 
+async def wait_or_shutdown(seconds: float) -> bool:
+    """Kutish; bot to'xtatilayotgan bo'lsa darhol True qaytaradi"""
+    try:
+        await asyncio.wait_for(shutting_down.wait(), timeout=seconds)
+        return True
+    except asyncio.TimeoutError:
+        return False
+
+
+def start_background(coro):
+    """Fon vazifasini ishga tushirish"""
+    task = asyncio.create_task(coro)
+    background_tasks.add(task)
+    task.add_done_callback(background_tasks.discard)
+
+
+async def fsm_cleanup():
+    """Eskirgan FSM holatlarini vaqti-vaqti bilan tozalash"""
+    while not await wait_or_shutdown(max(60, FSM_TTL // 4)):
+        try:
+            removed = await storage.evict_expired()
+            if removed:
+                logger.info(f"🧹 {removed} ta eskirgan FSM holati o'chirildi")
+        except Exception as e:
+            logger.error(f"FSM cleanup error: {e}")
+
+
+async def backend_cleanup():
+    """Xotira backendidagi eskirgan kalitlarni tozalash (yozishlar LRU boshidan o'chiradi)"""
+    while not await wait_or_shutdown(BACKEND_PURGE_INTERVAL):
+        try:
+            await state_backend.purge_expired()
+        except Exception as e:
+            logger.error(f"Backend cleanup error: {e}")
+
+
+async def query_stats_flush():
+    """Qidiruv statistikasini muntazam bazaga yozish (to'xtashda ham)"""
+    while not await wait_or_shutdown(SEARCH_STATS_FLUSH):
+        try:
+            flush_query_stats()
+        except Exception as e:
+            logger.error(f"Search stats flush error: {e}")
+    flush_query_stats()
+
+
+async def search_warmup():
+    """
+    Eng ko'p qidirilgan so'rovlar natijalarini oldindan tayyorlash:
+    katalog o'zgargach va sessiyalar eskirishidan oldin muntazam
+    """
+    last_run = 0.0
+    while not await wait_or_shutdown(10):
+        if not catalog_changed.is_set() and time.monotonic() - last_run < SEARCH_SESSION_TTL / 2:
+            continue
+        catalog_changed.clear()
+        last_run = time.monotonic()
+        try:
+            flush_query_stats()
+            for row in db.get_top_searches(SEARCH_WARMUP_TOP):
+                await search_session(row['query'], refresh=True)
+        except Exception as e:
+            logger.error(f"Search warmup error: {e}")
+
+
+async def rebuild_similar_process(since: int) -> Tuple[int, int]:
+    """
+    recommend.rebuild_similar ni alohida jarayonda bajarish (python -m recommend).
+    Har safar yangi jarayon: main.py qayta bajarilmaydi, jarayon o'lsa keyingisi
+    toza boshlanadi, to'xtatishda esa shu jarayonning o'zi tugatiladi.
+    """
+    global similar_process
+    similar_process = await asyncio.create_subprocess_exec(
+        sys.executable, '-m', 'recommend', os.path.abspath(db.db_file), str(since), str(SIMILAR_TOP_K),
+        stdout=asyncio.subprocess.PIPE, cwd=os.path.dirname(os.path.abspath(__file__))
+    )
+    try:
+        out, _ = await similar_process.communicate()
+    finally:
+        code, similar_process = similar_process.returncode, None
+    if code != 0:
+        raise RuntimeError(f"recommend jarayoni {code} kodi bilan tugadi")
+    built_at, updated = map(int, out.split())
+    return built_at, updated
+
+
+def stop_similar_process():
+    """Ishlayotgan hisobni to'xtatish (natija bitta tranzaksiyada yoziladi - yarimi saqlanmaydi)"""
+    if similar_process is not None and similar_process.returncode is None:
+        try:
+            similar_process.terminate()
+        except ProcessLookupError:
+            pass
+
+
+async def similar_refresh():
+    """
+    O'xshash kinolarni alohida jarayonda qayta hisoblash (event loop bloklanmaydi).
+    Oraliq yangilanishlar faqat yangi sevimli/reytinglar ta'sir qilgan kinolarni qayta hisoblaydi.
+    """
+    delay = 0
+    while not await wait_or_shutdown(delay):
+        delay = SIMILAR_INTERVAL
+        built_at = int(db.get_setting('similar_built_at', '0'))
+        full_at = int(db.get_setting('similar_full_at', '0'))
+        full = datetime.now().timestamp() - full_at >= SIMILAR_FULL_INTERVAL
+        try:
+            built_at, updated = await rebuild_similar_process(0 if full else built_at)
+        except Exception as e:
+            if not shutting_down.is_set():
+                logger.error(f"Similar movies error: {e}")
+            continue
+        db.update_setting('similar_built_at', str(built_at))
+        if full:
+            db.update_setting('similar_full_at', str(built_at))
+        if updated:
+            logger.info(f"💡 O'xshash kinolar yangilandi: {updated} ta kino")
+
+
+def refresh_top_lists():
+    """Trend topini qayta hisoblash (ko'rishlar bazaga yozilgach)"""
+    rows = view_buckets.drain()
+    if rows:
+        db.save_view_buckets(rows)
+
+    now = current_hour()
+    scores = decayed_scores(db.get_view_buckets(now - TRENDING_WINDOW), now, TRENDING_HALF_LIFE)
+    # O'chirilgan/nofaol kinolar tushib qolishi mumkin - zaxira bilan olinadi
+    codes = heapq.nlargest(TOP_SIZE * 2, scores, key=scores.get)
+    top_lists['trend'] = db.get_movies_by_codes(codes)[:TOP_SIZE]
+
+
+async def trending_refresh():
+    """Toplarni muntazam yangilash, eski soatlik ko'rishlarni tozalash"""
+    while not await wait_or_shutdown(TRENDING_INTERVAL):
+        try:
+            refresh_top_lists()
+            db.delete_view_buckets(current_hour() - TRENDING_WINDOW)
+        except Exception as e:
+            logger.error(f"Trending refresh error: {e}")
+    rows = view_buckets.drain()
+    if rows:
+        db.save_view_buckets(rows)
+
+
+def load_leaderboards():
+    """Ko'rishlar/reyting toplarini bazadan to'liq qayta yuklash"""
+    leaderboards.load(db.get_leaderboard_movies(), get_categories())
+
+
+async def leaderboard_reconcile():
+    """Xotiradagi toplarni vaqti-vaqti bilan bazaga moslashtirish"""
+    while not await wait_or_shutdown(LEADERBOARD_RECONCILE):
+        try:
+            load_leaderboards()
+        except Exception as e:
+            logger.error(f"Leaderboard reconcile error: {e}")
+
+
+async def viewers_flush():
+    """Tomoshabinlar sketchlarini muntazam yozish, eskilarini tozalash"""
+    pruned_day = 0
+    while not await wait_or_shutdown(VIEWERS_FLUSH):
+        try:
+            flush_viewer_sketches()
+            if pruned_day != current_day():
+                pruned_day = current_day()
+                db.delete_viewer_sketches(pruned_day - VIEWERS_RETENTION_DAYS)
+        except Exception as e:
+            logger.error(f"Viewers flush error: {e}")
+    flush_viewer_sketches()
+
+
 async def on_startup():
     """Bot ishga tushganda"""
-    global bot_username
+    global bot_username, catalog_version
     try:
         me = await bot.get_me()
         bot_username = f"@{me.username}"
@@ -1797,9 +2400,56 @@ async def on_startup():
     except Exception as e:
         logger.error(f"Startup error: {e}")
 
+    buttons.set_categories(get_categories())
+    load_category_emojis()
+    catalog_version = int(await state_backend.get('catalog:version') or 0)
+    build_catalog_indexes()
+    refresh_top_lists()
+    load_leaderboards()
+    logger.info(f"🔍 Qidiruv indeksi: {len(search_index)} ta kino")
+    await storage.evict_expired()
+    start_background(fsm_cleanup())
+    start_background(backend_cleanup())
+    start_background(query_stats_flush())
+    start_background(search_warmup())
+    start_background(similar_refresh())
+    start_background(trending_refresh())
+    start_background(leaderboard_reconcile())
+    start_background(viewers_flush())
+    start_background(resume_broadcast())
+
 
 async def on_shutdown():
-    """Bot to'xtaganda"""
+    """
+    Bot to'xtaganda (polling allaqachon to'xtagan):
+    ishlanayotgan updatelarni tugatish, reklamani saqlash, ulanishlarni yopish
+    """
+    logger.info("⏳ Bot to'xtatilmoqda...")
+    shutting_down.set()
+    # O'xshash kinolar hisobi kutilmaydi - jarayon darhol to'xtatiladi
+    stop_similar_process()
+
+    # 1. Ishlanayotgan handlerlar va fon vazifalarini kutish
+    cancelled = await admission.drain(SHUTDOWN_TIMEOUT)
+    if background_tasks:
+        _, pending = await asyncio.wait(list(background_tasks), timeout=SHUTDOWN_TIMEOUT)
+        for task in pending:
+            task.cancel()
+        cancelled += len(pending)
+    if cancelled:
+        logger.warning(f"⚠️ {cancelled} ta vazifa muddat tugagani uchun bekor qilindi")
+
+    # 2. Ishlangan updatelarni Telegramga tasdiqlash - qayta yuborilmasligi uchun
+    if admission.last_update_id:
+        try:
+            await bot.get_updates(offset=admission.last_update_id + 1, limit=1, timeout=0)
+        except Exception as e:
+            logger.error(f"Update offset error: {e}")
+
+    # 3. Ulanishlarni yopish
+    await state_backend.close()
+    await bot.session.close()
+    db.close()
     logger.info("🛑 Bot to'xtadi")
 
 
@@ -1807,7 +2457,7 @@ async def main():
     """Asosiy funksiya"""
     await on_startup()
     try:
-        await dp.start_polling(bot)
+        await dp.start_polling(bot, close_bot_session=False)
     finally:
         await on_shutdown()
 
@@ -0,0 +1,243 @@
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, List, Set, Tuple
+
+from aiogram import BaseMiddleware
+from aiogram.dispatcher.flags import get_flag
+from aiogram.types import CallbackQuery, Message, TelegramObject, Update
+
+from backend import StateBackend
+from database import db
+from keyboards import ButtonRegistry, channels_sub
+from ratelimit import RateLimiter
+
+SUB_REQUIRED_TEXT = "❌ <b>Avval kanallarga obuna bo'ling!</b>"
+
+
+class AdmissionMiddleware(BaseMiddleware):
+    """
+    Yuklamani boshqarish: bir vaqtda ishlanayotgan updatelar soni cheklanadi,
+    navbat to'lganda avval past ustuvorlikdagi updatelar tashlab yuboriladi.
+    """
+
+    def __init__(
+            self,
+            is_low_priority: Callable[[Update], bool],
+            max_in_flight: int = 32,
+            max_pending: int = 256
+    ):
+        self.is_low_priority = is_low_priority
+        self.max_in_flight = max_in_flight
+        self.max_pending = max_pending
+        # Past ustuvorlikdagilar navbat yarmi to'lganda tashlanadi
+        self.low_watermark = max_pending // 2
+        self._semaphore = asyncio.Semaphore(max_in_flight)
+        self._tasks: Set[asyncio.Task] = set()
+        self.closed = False
+        self.last_update_id = 0
+
+        self.in_flight = 0
+        self.pending = 0
+        self.peak_pending = 0
+        self.processed = 0
+        self.shed_low = 0
+        self.shed_high = 0
+
+    def stats(self) -> Dict[str, int]:
+        """Yuklama ko'rsatkichlari"""
+        return {
+            'in_flight': self.in_flight,
+            'pending': self.pending,
+            'peak_pending': self.peak_pending,
+            'processed': self.processed,
+            'shed_low': self.shed_low,
+            'shed_high': self.shed_high,
+        }
+
+    async def __call__(
+            self,
+            handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+            event: Update,
+            data: Dict[str, Any]
+    ) -> Any:
+        self.last_update_id = max(self.last_update_id, event.update_id)
+        if self.closed:
+            return None
+
+        low = self.is_low_priority(event)
+        if self.pending >= (self.low_watermark if low else self.max_pending):
+            if low:
+                self.shed_low += 1
+            else:
+                self.shed_high += 1
+            return None
+
+        task = asyncio.current_task()
+        self._tasks.add(task)
+        self.pending += 1
+        self.peak_pending = max(self.peak_pending, self.pending)
+        waiting = True
+        try:
+            async with self._semaphore:
+                self.pending -= 1
+                waiting = False
+                self.in_flight += 1
+                try:
+                    return await handler(event, data)
+                finally:
+                    self.in_flight -= 1
+                    self.processed += 1
+        finally:
+            self._tasks.discard(task)
+            if waiting:
+                self.pending -= 1
+
+    async def drain(self, timeout: float) -> int:
+        """
+        Yangi updatelarni qabul qilishni to'xtatib, ishlanayotganlarini kutish.
+        Muddat tugaganda qolganlari bekor qilinadi. Bekor qilinganlar sonini qaytaradi.
+        """
+        self.closed = True
+        tasks = [t for t in self._tasks if t is not asyncio.current_task()]
+        if not tasks:
+            return 0
+
+        _, pending = await asyncio.wait(tasks, timeout=timeout)
+        for task in pending:
+            task.cancel()
+        if pending:
+            await asyncio.gather(*pending, return_exceptions=True)
+        return len(pending)
+
+
+class UserMiddleware(BaseMiddleware):
+    """
+    Har bir update uchun bir marta: userni ro'yxatdan o'tkazish,
+    faollikni belgilash va blokni tekshirish.
+    Natija handlerlarga `user` sifatida uzatiladi.
+    """
+
+    def __init__(self, admin_ids: List[int]):
+        self.admin_ids = admin_ids
+
+    async def __call__(
+            self,
+            handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+            event: Update,
+            data: Dict[str, Any]
+    ) -> Any:
+        tg_user = data.get('event_from_user')
+        if tg_user is None:
+            return await handler(event, data)
+
+        user = db.touch_user(tg_user.id, tg_user.username, tg_user.full_name)
+        data['user'] = user
+
+        if user and user.get('is_blocked') and tg_user.id not in self.admin_ids:
+            if event.callback_query:
+                await event.callback_query.answer("🚫 Siz bloklangansiz", show_alert=True)
+            return None
+
+        return await handler(event, data)
+
+
+class ButtonMiddleware(BaseMiddleware):
+    """
+    Reply tugma matnini bir marta aniqlash.
+    Natija handlerlarga `button` = (amal, argument) sifatida uzatiladi.
+    """
+
+    def __init__(self, registry: ButtonRegistry):
+        self.registry = registry
+
+    async def __call__(
+            self,
+            handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+            event: Message,
+            data: Dict[str, Any]
+    ) -> Any:
+        data['button'] = self.registry.resolve(event.text)
+        return await handler(event, data)
+
+
+class SubscriptionMiddleware(BaseMiddleware):
+    """
+    Majburiy obunani tekshirish.
+    Faqat `subscription` flagi bor handlerlar uchun ishlaydi;
+    flag qiymati matn bo'lsa, shu matn yuboriladi.
+    Deep-link (`start_payload`) bo'lsa, tekshirish tugmasiga qo'shiladi.
+    """
+
+    def __init__(
+            self,
+            check_sub: Callable[[int], Awaitable[tuple]],
+            get_channels: Callable[[], Awaitable[list]]
+    ):
+        self.check_sub = check_sub
+        self.get_channels = get_channels
+
+    async def __call__(
+            self,
+            handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+            event: TelegramObject,
+            data: Dict[str, Any]
+    ) -> Any:
+        flag = get_flag(data, 'subscription')
+        if not flag:
+            return await handler(event, data)
+
+        is_subscribed, unsubscribed = await self.check_sub(event.from_user.id)
+        if is_subscribed:
+            data['is_subscribed'] = True
+            return await handler(event, data)
+
+        text = flag if isinstance(flag, str) else SUB_REQUIRED_TEXT
+        markup = channels_sub(await self.get_channels(), data.get('start_payload', ''))
+
+        if isinstance(event, Message):
+            state = data.get('state')
+            if state:
+                await state.clear()
+            await event.answer(text, reply_markup=markup)
+        elif isinstance(event, CallbackQuery):
+            await event.answer()
+            # Inline rejimdagi xabarlarda event.message bo'lmaydi
+            await event.bot.send_message(event.from_user.id, text, reply_markup=markup)
+        return None
+
+
+class ThrottlingMiddleware(BaseMiddleware):
+    """
+    Har bir user uchun anti-flood.
+    Handler `throttle` flagi orqali limit sinfini tanlaydi (flag funksiya ham
+    bo'lishi mumkin), flag bo'lmasa `default` ishlatiladi.
+    """
+
+    def __init__(self, backend: StateBackend, limits: Dict[str, Tuple[float, int]]):
+        self.backend = backend
+        self.limiters = {
+            name: RateLimiter(backend, rate, burst, prefix=f'rl:{name}')
+            for name, (rate, burst) in limits.items()
+        }
+
+    async def __call__(
+            self,
+            handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+            event: TelegramObject,
+            data: Dict[str, Any]
+    ) -> Any:
+        name = get_flag(data, 'throttle', default='default')
+        if callable(name):
+            name = name(data)
+        limiter = self.limiters.get(name) or self.limiters['default']
+        user_id = event.from_user.id
+
+        if await limiter.hit(str(user_id)):
+            return await handler(event, data)
+
+        if isinstance(event, CallbackQuery):
+            await event.answer("⏳ Sekinroq! Biroz kuting...")
+        elif isinstance(event, Message):
+            # Ogohlantirish har bir limit oynasida faqat bir marta yuboriladi
+            if await self.backend.incr(f'rl:warned:{user_id}', ttl=limiter.ttl) == 1:
+                await event.answer("⏳ Juda tez! Biroz kutib, qaytadan urinib ko'ring.")
+        return None
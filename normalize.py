@@ -0,0 +1,36 @@
+import re
+import unicodedata
+
+
+# Kirill (o'zbek va rus) -> lotin. Apostroflar keyin olib tashlanadi, shuning uchun ў -> o, ғ -> g
+_CYRILLIC = {
+    'а': 'a', 'б': 'b', 'в': 'v', 'г': 'g', 'д': 'd', 'е': 'e', 'ё': 'yo', 'ж': 'j',
+    'з': 'z', 'и': 'i', 'й': 'y', 'к': 'k', 'л': 'l', 'м': 'm', 'н': 'n', 'о': 'o',
+    'п': 'p', 'р': 'r', 'с': 's', 'т': 't', 'у': 'u', 'ф': 'f', 'х': 'x', 'ц': 'ts',
+    'ч': 'ch', 'ш': 'sh', 'щ': 'sh', 'ъ': '', 'ы': 'i', 'ь': '', 'э': 'e', 'ю': 'yu',
+    'я': 'ya', 'ў': 'o', 'қ': 'q', 'ғ': 'g', 'ҳ': 'h',
+}
+_TRANSLIT = str.maketrans(_CYRILLIC)
+
+# o', oʻ, o‘, o’, o` ... - hammasi bir xil yoziladi (apostrofsiz)
+_APOSTROPHES = str.maketrans('', '', "'`´ʻʼʹ‘’′")
+
+_NON_WORD = re.compile(r'[\W_]+')
+
+
+def normalize(text: str) -> str:
+    """
+    Qidiruv kaliti: kichik harf, kirill -> lotin, apostrof va diakritikasiz,
+    faqat harf/raqamlar bitta bo'sh joy bilan.
+    """
+    if not text:
+        return ''
+    text = unicodedata.normalize('NFKC', text).casefold()
+    text = text.translate(_TRANSLIT).translate(_APOSTROPHES)
+    text = ''.join(c for c in unicodedata.normalize('NFKD', text) if not unicodedata.combining(c))
+    return _NON_WORD.sub(' ', text).strip()
+
+
+def normalize_code(code: str) -> str:
+    """Kino kodi kaliti: normalize + bo'sh joylarsiz, katta harf"""
+    return normalize(code).replace(' ', '').upper()
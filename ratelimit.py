@@ -0,0 +1,37 @@
+import asyncio
+import math
+
+from backend import StateBackend
+
+
+class RateLimiter:
+    """
+    Token bucket rate limiter.
+    Bucketlar backendda saqlanadi (token olish atomar - bir nechta korutina yoki
+    bot nusxasi bir vaqtda limitni chetlab o'ta olmaydi) va to'liq to'lgach
+    TTL bilan o'chib ketadi.
+    """
+
+    def __init__(self, backend: StateBackend, rate: float, burst: int, prefix: str = 'rl'):
+        self.backend = backend
+        self.rate = rate
+        self.burst = burst
+        self.prefix = prefix
+        # Bo'sh bucket to'liq to'lishi uchun vaqt - shundan keyin uni saqlash shart emas
+        self.ttl = math.ceil(burst / rate) + 1
+
+    async def hit(self, key: str) -> bool:
+        """Bitta token olish; ruxsat bo'lmasa False"""
+        return await self._take(key) == 0
+
+    async def wait(self, key: str):
+        """Token bo'shaguncha kutib, keyin olish (yuborishni bir tekis taqsimlash uchun)"""
+        while True:
+            delay = await self._take(key)
+            if not delay:
+                return
+            await asyncio.sleep(delay)
+
+    async def _take(self, key: str) -> float:
+        """Token olish; olinsa 0, aks holda keyingi token uchun kutish vaqti"""
+        return await self.backend.take_token(f'{self.prefix}:{key}', self.rate, self.burst, self.ttl)
@@ -0,0 +1,103 @@
+import heapq
+import math
+import sqlite3
+import time
+from collections import defaultdict
+from typing import Dict, Iterable, List, Set, Tuple
+
+
+# Juda ko'p kinoni belgilagan foydalanuvchilar o'xshashlikka deyarli ta'sir qilmaydi,
+# lekin hisoblashni kvadratik sekinlashtiradi
+MAX_USER_ITEMS = 500
+
+# Foydalanuvchi-kino og'irligi: sevimli = 1, reyting 4-5 = 1, reyting 3 = 0.5
+INTERACTIONS_SQL = '''
+    SELECT user_id, movie_code, 1.0, added_date FROM favorites
+    UNION ALL
+    SELECT user_id, movie_code,
+           CASE WHEN rating >= 4 THEN 1.0 ELSE 0.5 END, added_date
+    FROM ratings WHERE rating >= 3
+'''
+
+
+def item_similarity(interactions: Iterable[Tuple[int, str, float]], items: Set[str] = None,
+                    top_k: int = 10) -> Dict[str, List[Tuple[str, float]]]:
+    """
+    Kino-kino kosinus o'xshashligi (siyrak, lug'atlar orqali).
+    items berilsa - faqat shu kinolar uchun qatorlar hisoblanadi.
+    Natija: kod -> [(o'xshash kod, ball), ...] kamayish tartibida.
+    """
+    user_items: Dict[int, Dict[str, float]] = defaultdict(dict)
+    for user_id, code, weight in interactions:
+        current = user_items[user_id].get(code, 0.0)
+        user_items[user_id][code] = max(current, weight)
+
+    item_users: Dict[str, Dict[int, float]] = defaultdict(dict)
+    for user_id, row in user_items.items():
+        if len(row) > MAX_USER_ITEMS:
+            continue
+        for code, weight in row.items():
+            item_users[code][user_id] = weight
+
+    norms = {code: math.sqrt(sum(w * w for w in users.values())) for code, users in item_users.items()}
+
+    result = {}
+    for code in (items if items is not None else item_users.keys()):
+        users = item_users.get(code)
+        if not users:
+            result[code] = []
+            continue
+        scores: Dict[str, float] = defaultdict(float)
+        for user_id, weight in users.items():
+            for other, other_weight in user_items[user_id].items():
+                if other != code:
+                    scores[other] += weight * other_weight
+        top = heapq.nlargest(top_k, scores.items(), key=lambda item: item[1])
+        result[code] = [(other, score / (norms[code] * norms[other])) for other, score in top]
+    return result
+
+
+def rebuild_similar(db_file: str, since: int = 0, top_k: int = 10) -> Tuple[int, int]:
+    """
+    movie_similar jadvalini qayta qurish (alohida jarayonda ishga tushiriladi).
+    since=0 - to'liq; aks holda faqat shu vaqtdan keyin o'zgargan kinolar
+    va ular bilan birga uchraydigan kinolar qatorlari yangilanadi.
+    Natija: (qurilgan vaqt, yangilangan kinolar soni)
+    """
+    built_at = int(time.time())
+    conn = sqlite3.connect(db_file, timeout=30)
+    try:
+        rows = conn.execute(INTERACTIONS_SQL).fetchall()
+        interactions = [(user_id, code, weight) for user_id, code, weight, _ in rows]
+
+        items = None
+        if since:
+            dirty = {code for _, code, _, added in rows if (added or 0) > since}
+            if not dirty:
+                return built_at, 0
+            # O'xshashlik faqat kamida bittasi o'zgargan juftliklarda o'zgaradi
+            dirty_users = {user_id for user_id, code, _, _ in rows if code in dirty}
+            items = dirty | {code for user_id, code, _ in interactions if user_id in dirty_users}
+
+        similar = item_similarity(interactions, items, top_k)
+
+        if items is None:
+            conn.execute('DELETE FROM movie_similar')
+        else:
+            conn.executemany('DELETE FROM movie_similar WHERE movie_code = ?', ((code,) for code in items))
+        conn.executemany(
+            'INSERT INTO movie_similar (movie_code, rank, similar_code, score) VALUES (?, ?, ?, ?)',
+            ((code, rank, other, score)
+             for code, top in similar.items()
+             for rank, (other, score) in enumerate(top, 1))
+        )
+        conn.commit()
+        return built_at, len(similar)
+    finally:
+        conn.close()
+
+
+if __name__ == '__main__':
+    # Bot alohida jarayonda ishga tushiradi: python -m recommend <db> <since> <top_k>
+    import sys
+    print(*rebuild_similar(sys.argv[1], int(sys.argv[2]), int(sys.argv[3])))
@@ -0,0 +1,248 @@
+import math
+from bisect import bisect_left, insort
+from collections import defaultdict
+from typing import Dict, List, Optional, Set, Tuple
+
+from normalize import normalize, normalize_code
+
+
+def trigrams(text: str) -> Set[str]:
+    """Matn trigrammalari (har bir so'z chetiga bo'sh joy qo'shiladi)"""
+    grams = set()
+    for word in normalize(text).split():
+        padded = f'  {word} '
+        grams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return grams
+
+
+class TrigramIndex:
+    """
+    Kino nomlari bo'yicha xatoga chidamli qidiruv (xotirada).
+    Har bir trigramma -> shu trigramma bor kinolar. So'rov trigrammalarining
+    kamida `min_similarity` qismi nomda bo'lishi kerak; natijalar o'xshashlik
+    va mashhurlik bo'yicha saralanadi.
+    """
+
+    def __init__(self, min_similarity: float = 0.4, popularity_weight: float = 0.02,
+                 min_query_len: int = 3):
+        self.min_similarity = min_similarity
+        self.popularity_weight = popularity_weight
+        # Juda qisqa so'rov trigrammalari deyarli barcha nomlarda uchraydi
+        self.min_query_len = min_query_len
+        self._postings: Dict[str, Set[str]] = defaultdict(set)
+        self._docs: Dict[str, dict] = {}
+        self._grams: Dict[str, Set[str]] = {}
+
+    def __len__(self) -> int:
+        return len(self._docs)
+
+    def build(self, movies: List[dict]):
+        """Indeksni noldan qurish"""
+        self._postings.clear()
+        self._docs.clear()
+        self._grams.clear()
+        for movie in movies:
+            self.add(movie)
+
+    def add(self, movie: dict):
+        """Kino qo'shish yoki yangilash"""
+        code = movie['code']
+        if code in self._docs:
+            self.remove(code)
+        grams = trigrams(movie.get('title_uz') or '')
+        self._docs[code] = {
+            'code': code,
+            'title_uz': movie.get('title_uz') or '',
+            'views': movie.get('views') or 0,
+        }
+        self._grams[code] = grams
+        for gram in grams:
+            self._postings[gram].add(code)
+
+    def remove(self, code: str):
+        """Kinoni indeksdan olib tashlash"""
+        self._docs.pop(code, None)
+        for gram in self._grams.pop(code, ()):
+            posting = self._postings.get(gram)
+            if posting is not None:
+                posting.discard(code)
+                if not posting:
+                    del self._postings[gram]
+
+    def search(self, query: str, limit: int = 10) -> List[dict]:
+        """O'xshash nomli kinolar (eng mosi birinchi)"""
+        if len(normalize(query).replace(' ', '')) < self.min_query_len:
+            return []
+        q_grams = trigrams(query)
+        if not q_grams:
+            return []
+
+        # Nomzod kamida `need` ta umumiy trigrammaga ega bo'lishi kerak, demak u
+        # eng kam uchraydigan (n - need + 1) trigrammadan birida albatta bor
+        postings = sorted((self._postings.get(g, set()) for g in q_grams), key=len)
+        n = len(postings)
+        need = max(1, math.ceil(self.min_similarity * n))
+        candidates: Set[str] = set()
+        for posting in postings[:n - need + 1]:
+            candidates.update(posting)
+
+        results = []
+        for code in candidates:
+            common = sum(1 for posting in postings if code in posting)
+            if common < need:
+                continue
+            # So'rovning nomdagi ulushi va Jaccard o'rtachasi - uzun nomlar ham chiqadi,
+            # lekin to'liq mos kelgani yuqorida turadi
+            jaccard = common / (n + len(self._grams[code]) - common)
+            similarity = (common / n + jaccard) / 2
+            doc = self._docs[code]
+            score = similarity + self.popularity_weight * math.log1p(doc['views'])
+            results.append((score, code))
+
+        results.sort(reverse=True)
+        return [self._docs[code] for _, code in results[:limit]]
+
+    def get(self, code: str) -> Optional[dict]:
+        return self._docs.get(code)
+
+
+class PrefixIndex:
+    """
+    Kodlar va nomlar bo'yicha prefiks qidiruv (saralangan ro'yxat + bisect).
+    Kod topilmaganda "balki shuni nazarda tutgandirsiz" takliflari uchun.
+    """
+
+    def __init__(self):
+        self._codes: List[Tuple[str, str]] = []
+        self._titles: List[Tuple[str, str]] = []
+        self._docs: Dict[str, Tuple[str, List[str]]] = {}
+
+    def __len__(self) -> int:
+        return len(self._docs)
+
+    @staticmethod
+    def _keys(movie: dict) -> Tuple[str, List[str]]:
+        title = normalize(movie.get('title_uz') or '')
+        words = title.split()
+        # To'liq nom va har bir so'z (ikkinchi so'zdan boshlab yozsa ham topiladi)
+        keys = sorted({title, *words} - {''})
+        return normalize_code(movie['code']), keys
+
+    def build(self, movies: List[dict]):
+        """Indeksni noldan qurish"""
+        self._docs.clear()
+        codes, titles = [], []
+        for movie in movies:
+            code_key, title_keys = self._keys(movie)
+            self._docs[movie['code']] = (movie.get('title_uz') or '', [code_key] + title_keys)
+            codes.append((code_key, movie['code']))
+            titles.extend((key, movie['code']) for key in title_keys)
+        self._codes = sorted(codes)
+        self._titles = sorted(titles)
+
+    def add(self, movie: dict):
+        """Kino qo'shish yoki yangilash"""
+        code = movie['code']
+        if code in self._docs:
+            self.remove(code)
+        code_key, title_keys = self._keys(movie)
+        self._docs[code] = (movie.get('title_uz') or '', [code_key] + title_keys)
+        insort(self._codes, (code_key, code))
+        for key in title_keys:
+            insort(self._titles, (key, code))
+
+    def remove(self, code: str):
+        """Kinoni indeksdan olib tashlash"""
+        doc = self._docs.pop(code, None)
+        if doc is None:
+            return
+        code_key, *title_keys = doc[1]
+        self._discard(self._codes, (code_key, code))
+        for key in title_keys:
+            self._discard(self._titles, (key, code))
+
+    @staticmethod
+    def _discard(items: List[Tuple[str, str]], item: Tuple[str, str]):
+        i = bisect_left(items, item)
+        if i < len(items) and items[i] == item:
+            del items[i]
+
+    @staticmethod
+    def _scan(items: List[Tuple[str, str]], prefix: str, limit: int, found: Dict[str, None]):
+        i = bisect_left(items, (prefix,))
+        while i < len(items) and len(found) < limit and items[i][0].startswith(prefix):
+            found.setdefault(items[i][1])
+            i += 1
+
+    def suggest(self, query: str, limit: int = 5, min_prefix: int = 2) -> List[Tuple[str, str]]:
+        """
+        (kod, nom) takliflari. Prefiks bo'yicha hech narsa bo'lmasa, so'rov
+        oxiridan qisqartirib boriladi (K13 -> K1 -> K12, K10 ...).
+        """
+        code_query, title_query = normalize_code(query), normalize(query)
+        found: Dict[str, None] = {}
+        for size in range(max(len(code_query), len(title_query)), min_prefix - 1, -1):
+            if len(code_query) >= size:
+                self._scan(self._codes, code_query[:size], limit, found)
+            if len(title_query) >= size:
+                self._scan(self._titles, title_query[:size], limit, found)
+            if found:
+                break
+        return [(code, self._docs[code][0]) for code in found]
+
+
+class CodeFilter:
+    """
+    Mavjud kodlar to'plami (normallashtirilgan kod -> asl kodlar).
+    Noto'g'ri kodlar bazaga so'rovsiz rad etiladi, to'g'rilari esa darhol
+    kerakli jadvalga (kino yoki qismlar) yo'naltiriladi. Bir kalitga bir nechta
+    kod tushsa (K-12 va K12), get_movie kabi aniq mos kelgani tanlanadi.
+    """
+
+    def __init__(self):
+        self._movies: Dict[str, Set[str]] = defaultdict(set)
+        self._parts: Dict[str, Set[str]] = defaultdict(set)
+
+    def __len__(self) -> int:
+        return len(self._movies.keys() | self._parts.keys())
+
+    def build(self, movie_codes: List[str], part_codes: List[str]):
+        self._movies.clear()
+        self._parts.clear()
+        for code in movie_codes:
+            self.add_movie(code)
+        for code in part_codes:
+            self.add_parts(code)
+
+    def add_movie(self, code: str):
+        self._movies[normalize_code(code)].add(code)
+
+    def add_parts(self, code: str):
+        self._parts[normalize_code(code)].add(code)
+
+    @staticmethod
+    def _discard(index: Dict[str, Set[str]], key: str, code: str):
+        codes = index.get(key)
+        if codes is not None:
+            codes.discard(code)
+            if not codes:
+                del index[key]
+
+    def remove(self, code: str):
+        key = normalize_code(code)
+        self._discard(self._movies, key, code)
+        self._discard(self._parts, key, code)
+
+    @staticmethod
+    def _pick(index: Dict[str, Set[str]], key: str, code: str) -> Optional[str]:
+        codes = index.get(key)
+        if not codes:
+            return None
+        if code in codes:
+            return code
+        return min(codes)
+
+    def lookup(self, code: str) -> Tuple[Optional[str], Optional[str]]:
+        """(kino kodi, qismlar kodi) - yo'q bo'lsa None"""
+        key = normalize_code(code)
+        return self._pick(self._movies, key, code), self._pick(self._parts, key, code)
@@ -0,0 +1,116 @@
+import ssl
+import time
+from typing import Any, Dict, Optional
+
+import certifi
+from aiohttp import ClientSession, TCPConnector
+from aiohttp.hdrs import USER_AGENT
+from aiohttp.http import SERVER_SOFTWARE
+
+from aiogram import Bot, __version__ as aiogram_version
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.exceptions import TelegramNetworkError
+from aiogram.methods import (
+    AnswerCallbackQuery, CopyMessage, GetChat, GetChatMember, SendDocument,
+    SendMediaGroup, SendPhoto, SendVideo, TelegramMethod,
+)
+from aiogram.methods.base import TelegramType
+
+MEDIA_METHODS = (SendVideo, SendPhoto, SendDocument, SendMediaGroup, CopyMessage)
+FAST_METHODS = (GetChatMember, GetChat, AnswerCallbackQuery)
+
+
+class TunedAiohttpSession(AiohttpSession):
+    """
+    Bot API uchun sozlangan aiohttp sessiya:
+    connection pool, keep-alive, DNS kesh va so'rov turiga qarab timeout.
+    ClientSession va TCPConnector shu yerda quriladi (aiogram ichki sozlamalariga
+    tegmasdan), connectorga esa havola saqlanadi.
+    """
+
+    def __init__(
+            self,
+            pool_size: int = 100,
+            keepalive_timeout: float = 60,
+            dns_cache_ttl: int = 600,
+            timeout: float = 30,
+            media_timeout: float = 120,
+            fast_timeout: float = 10,
+            **kwargs: Any
+    ):
+        super().__init__(limit=pool_size, timeout=timeout, **kwargs)
+        self.pool_size = pool_size
+        self.keepalive_timeout = keepalive_timeout
+        self.dns_cache_ttl = dns_cache_ttl
+        self.media_timeout = media_timeout
+        self.fast_timeout = fast_timeout
+        self.connector: Optional[TCPConnector] = None
+        self._client: Optional[ClientSession] = None
+
+        self.active = 0
+        self.peak_active = 0
+        self.requests = 0
+        self.network_errors = 0
+        self.total_latency = 0.0
+
+    def _create_connector(self) -> TCPConnector:
+        return TCPConnector(
+            ssl=ssl.create_default_context(cafile=certifi.where()),
+            limit=self.pool_size,
+            # Barcha so'rovlar bitta hostga (api.telegram.org) boradi
+            limit_per_host=self.pool_size,
+            keepalive_timeout=self.keepalive_timeout,
+            ttl_dns_cache=self.dns_cache_ttl,
+            enable_cleanup_closed=True,
+        )
+
+    async def create_session(self) -> ClientSession:
+        if self._client is None or self._client.closed:
+            self.connector = self._create_connector()
+            self._client = ClientSession(
+                connector=self.connector,
+                headers={USER_AGENT: f"{SERVER_SOFTWARE} aiogram/{aiogram_version}"},
+            )
+        return self._client
+
+    async def close(self) -> None:
+        if self._client is not None and not self._client.closed:
+            await self._client.close()
+
+    def _timeout_for(self, method: TelegramMethod[Any]) -> float:
+        if isinstance(method, MEDIA_METHODS):
+            return self.media_timeout
+        if isinstance(method, FAST_METHODS):
+            return self.fast_timeout
+        return self.timeout
+
+    async def make_request(
+            self, bot: Bot, method: TelegramMethod[TelegramType], timeout: Optional[int] = None
+    ) -> TelegramType:
+        # getUpdates kabi o'z timeoutini beradigan so'rovlar o'zgartirilmaydi
+        if timeout is None:
+            timeout = self._timeout_for(method)
+
+        self.active += 1
+        self.peak_active = max(self.peak_active, self.active)
+        started = time.monotonic()
+        try:
+            return await super().make_request(bot, method, timeout=timeout)
+        except TelegramNetworkError:
+            self.network_errors += 1
+            raise
+        finally:
+            self.active -= 1
+            self.requests += 1
+            self.total_latency += time.monotonic() - started
+
+    def stats(self) -> Dict[str, Any]:
+        """Pool va so'rovlar ko'rsatkichlari"""
+        return {
+            'pool_size': self.connector.limit if self.connector is not None else self.pool_size,
+            'active': self.active,
+            'peak_active': self.peak_active,
+            'requests': self.requests,
+            'network_errors': self.network_errors,
+            'avg_latency_ms': int(self.total_latency / self.requests * 1000) if self.requests else 0,
+        }
@@ -0,0 +1,89 @@
+import json
+import time
+from typing import Any, Dict, Optional
+
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, DefaultKeyBuilder, StateType, StorageKey
+
+from backend import StateBackend
+from database import db
+
+
+class SQLiteStorage(BaseStorage):
+    """
+    FSM holatlarini bazada saqlash.
+    Yozuvlar darhol bazaga yoziladi (write-through), o'qish esa umumiy
+    backend keshidan. TTL dan uzoq turgan holatlar o'chiriladi.
+    """
+
+    def __init__(self, backend: StateBackend, ttl: int = 86400):
+        self.backend = backend
+        self.ttl = ttl
+        self.key_builder = DefaultKeyBuilder(with_destiny=True)
+
+    def _is_expired(self, record: Dict[str, Any], now: float) -> bool:
+        return record['updated_at'] < now - self.ttl
+
+    async def _load(self, key: str) -> Dict[str, Any]:
+        """Holatni keshdan yoki bazadan olish"""
+        now = time.time()
+        record = await self.backend.get_json(key)
+
+        if record is None:
+            row = db.get_fsm(key)
+            if row:
+                record = {
+                    'state': row['state'],
+                    'data': json.loads(row['data']) if row['data'] else {},
+                    'updated_at': row['updated_at'],
+                }
+            else:
+                # Bo'sh holatni ham keshlaymiz - har bir update da bazaga bormaslik uchun
+                record = {'state': None, 'data': {}, 'updated_at': now}
+
+            if self._is_expired(record, now):
+                db.delete_fsm(key)
+                record = {'state': None, 'data': {}, 'updated_at': now}
+
+            await self.backend.set_json(key, record, ttl=self._remaining(record, now))
+
+        return record
+
+    def _remaining(self, record: Dict[str, Any], now: float) -> int:
+        return max(1, int(record['updated_at'] + self.ttl - now))
+
+    async def _save(self, key: str, state: Optional[str], data: Dict[str, Any]):
+        """Holatni bazaga va keshga yozish"""
+        now = int(time.time())
+
+        if state is None and not data:
+            db.delete_fsm(key)
+        else:
+            db.save_fsm(key, state, json.dumps(data, ensure_ascii=False), now)
+
+        await self.backend.set_json(key, {'state': state, 'data': data, 'updated_at': now}, ttl=self.ttl)
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        state = state.state if isinstance(state, State) else state
+        record_key = self.key_builder.build(key)
+        record = await self._load(record_key)
+        await self._save(record_key, state, record['data'])
+
+    async def get_state(self, key: StorageKey) -> Optional[str]:
+        return (await self._load(self.key_builder.build(key)))['state']
+
+    async def set_data(self, key: StorageKey, data: Dict[str, Any]) -> None:
+        record_key = self.key_builder.build(key)
+        record = await self._load(record_key)
+        await self._save(record_key, record['state'], data.copy())
+
+    async def get_data(self, key: StorageKey) -> Dict[str, Any]:
+        return dict((await self._load(self.key_builder.build(key)))['data'])
+
+    async def evict_expired(self) -> int:
+        """Eskirgan holatlarni bazadan tozalash (keshda TTL o'zi ishlaydi)"""
+        return db.delete_expired_fsm(int(time.time() - self.ttl))
+
+    async def close(self) -> None:
+        # Backend umumiy - uni bot to'xtash jarayonining oxirida main yopadi
+        pass
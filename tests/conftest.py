@@ -0,0 +1,100 @@
+import asyncio
+import os
+import sys
+import time
+
+import pytest
+
+# Modullar loyiha ildizida (paketsiz) - testlar ham shu yerdan import qiladi
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from backend import TOKEN_BUCKET_LUA, MemoryBackend, RedisBackend, token_bucket  # noqa: E402
+
+
+class FakeRedis:
+    """
+    Testlar uchun minimal RESP server (GET/SET [EX] [NX]/DEL/INCRBY/EXPIRE/EVAL).
+    Lua yo'q: EVAL faqat token bucket skriptini uning Python varianti bilan bajaradi.
+    """
+
+    def __init__(self):
+        self.data = {}
+
+    def _alive(self, key):
+        item = self.data.get(key)
+        if item is not None and item[1] is not None and item[1] <= time.monotonic():
+            del self.data[key]
+            return None
+        return item
+
+    def command(self, name, *args):
+        if name == 'GET':
+            item = self._alive(args[0])
+            return item[0] if item else None
+        if name == 'SET':
+            key, value, opts = args[0], args[1], [a.upper() for a in args[2:]]
+            if 'NX' in opts and self._alive(key) is not None:
+                return None
+            expires = time.monotonic() + int(opts[opts.index('EX') + 1]) if 'EX' in opts else None
+            self.data[key] = (value, expires)
+            return 'OK'
+        if name == 'DEL':
+            return sum(self.data.pop(key, None) is not None for key in args)
+        if name == 'INCRBY':
+            item = self._alive(args[0])
+            value = int(item[0] if item else 0) + int(args[1])
+            self.data[args[0]] = (str(value), item[1] if item else None)
+            return value
+        if name == 'EXPIRE':
+            item = self._alive(args[0])
+            if item:
+                self.data[args[0]] = (item[0], time.monotonic() + int(args[1]))
+            return int(item is not None)
+        if name == 'EVAL':
+            assert args[0] == TOKEN_BUCKET_LUA
+            key, rate, burst, ttl = args[2], float(args[3]), int(args[4]), int(args[5])
+            item = self._alive(key)
+            value, delay = token_bucket(item[0] if item else None, time.time(), rate, burst)
+            self.data[key] = (value, time.monotonic() + ttl)
+            return repr(delay)
+        raise ValueError(name)
+
+    @staticmethod
+    def encode(reply) -> bytes:
+        if reply is None:
+            return b'$-1\r\n'
+        if isinstance(reply, int):
+            return f':{reply}\r\n'.encode()
+        if reply == 'OK':
+            return b'+OK\r\n'
+        data = reply.encode()
+        return b'$%d\r\n%s\r\n' % (len(data), data)
+
+    async def handle(self, reader, writer):
+        while line := await reader.readline():
+            args = []
+            for _ in range(int(line[1:])):
+                size = int((await reader.readline())[1:])
+                args.append((await reader.readexactly(size + 2))[:-2].decode())
+            writer.write(self.encode(self.command(args[0].upper(), *args[1:])))
+            await writer.drain()
+        writer.close()
+
+
+@pytest.fixture(params=['memory', 'redis'])
+def run(request):
+    """Testni ikkala backendda ishga tushirish"""
+    def runner(test):
+        async def main():
+            if request.param == 'memory':
+                backend = MemoryBackend()
+                return await test(backend)
+            server = await asyncio.start_server(FakeRedis().handle, '127.0.0.1', 0)
+            backend = RedisBackend(port=server.sockets[0].getsockname()[1])
+            try:
+                return await test(backend)
+            finally:
+                await backend.close()
+                server.close()
+        return asyncio.run(main())
+    return runner
@@ -0,0 +1,66 @@
+import asyncio
+
+from backend import MemoryBackend
+
+
+def test_set_get_delete(run):
+    async def test(backend):
+        assert await backend.get('a') is None
+        await backend.set('a', '1')
+        await backend.set('b', 'ikki')
+        assert await backend.get('a') == '1'
+        assert await backend.get('b') == 'ikki'
+        await backend.delete('a', 'b')
+        assert await backend.get('a') is None
+        assert await backend.get('b') is None
+    run(test)
+
+
+def test_json(run):
+    async def test(backend):
+        await backend.set_json('j', {'kod': 'K1', 'qismlar': [1, 2]})
+        assert await backend.get_json('j') == {'kod': 'K1', 'qismlar': [1, 2]}
+        assert await backend.get_json('yoq') is None
+    run(test)
+
+
+def test_incr(run):
+    async def test(backend):
+        assert await backend.incr('n') == 1
+        assert await backend.incr('n', 5) == 6
+        assert await backend.get('n') == '6'
+    run(test)
+
+
+def test_add_only_once(run):
+    async def test(backend):
+        assert await backend.add('once', ttl=60) is True
+        assert await backend.add('once', ttl=60) is False
+        await backend.delete('once')
+        assert await backend.add('once') is True
+    run(test)
+
+
+def test_ttl_expires(run):
+    async def test(backend):
+        await backend.set('s', 'v', ttl=1)
+        assert await backend.incr('c', ttl=1) == 1
+        assert await backend.add('a', ttl=1) is True
+        await asyncio.sleep(1.1)
+        assert await backend.get('s') is None
+        assert await backend.incr('c') == 1
+        assert await backend.add('a', ttl=1) is True
+    run(test)
+
+
+def test_memory_lru_limit():
+    async def test():
+        backend = MemoryBackend(max_keys=3)
+        for key in 'abcd':
+            await backend.set(key, key)
+        await backend.get('b')
+        await backend.set('e', 'e')
+        assert await backend.get('a') is None
+        assert await backend.get('c') is None
+        assert await backend.get('b') == 'b'
+    asyncio.run(test())
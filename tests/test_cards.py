@@ -0,0 +1,23 @@
+from cards import MovieCardRenderer, SIMILAR_HEADING
+
+
+MOVIE = {'code': 'K1', 'title_uz': 'Kino', 'description_uz': 'Tavsif', 'year': 2020,
+         'category': 'Drama', 'rating': 4.5, 'views': 10, 'downloads': 2}
+
+
+def test_similar_heading_only_with_buttons():
+    cards = MovieCardRenderer()
+    caption, kb = cards.render(MOVIE, 'kinobot', False, (('K2', 'Boshqa kino'),))
+    assert caption.endswith(SIMILAR_HEADING)
+    assert len(kb.inline_keyboard) == 4
+
+    inline = cards.inline_caption(MOVIE, 'kinobot')
+    assert SIMILAR_HEADING not in inline
+    assert inline == caption[:-len(SIMILAR_HEADING)]
+
+
+def test_no_similar():
+    cards = MovieCardRenderer()
+    caption, _ = cards.render(MOVIE, 'kinobot', False, ())
+    assert SIMILAR_HEADING not in caption
+    assert cards.inline_caption(MOVIE, 'kinobot') == caption
@@ -0,0 +1,41 @@
+from leaderboard import Leaderboards
+
+
+def movie(code, views, rating):
+    return {'code': code, 'views': views, 'downloads': 0, 'rating': rating,
+            'rating_count': 1, 'category': 'Drama'}
+
+
+def render(movies):
+    return ' '.join(f"{m['code']}:{m['views']}" for m in movies)
+
+
+def make():
+    boards = Leaderboards(size=2)
+    boards.load([movie('A', 1, 5.0), movie('B', 2, 4.0), movie('C', 3, 3.0)], ['Drama'])
+    return boards
+
+
+def test_views_order():
+    boards = make()
+    assert [m['code'] for m in boards.top('views')] == ['C', 'B']
+    boards.view('A')
+    boards.view('A')
+    boards.view('A')
+    assert [m['code'] for m in boards.top('views')] == ['A', 'C']
+
+
+def test_rating_text_shows_fresh_views():
+    boards = make()
+    assert boards.text('rating', '', render) == 'A:1 B:2'
+    boards.view('A')
+    assert boards.text('rating', '', render) == 'A:2 B:2'
+
+
+def test_rating_decrease_and_remove():
+    boards = make()
+    assert boards.text('rating', 'Drama', render) == 'A:1 B:2'
+    boards.rate('A', 2.0, 2)
+    assert boards.text('rating', 'Drama', render) == 'B:2 C:3'
+    boards.remove('B')
+    assert boards.text('rating', 'Drama', render) == 'C:3 A:1'
@@ -0,0 +1,39 @@
+import asyncio
+
+from backend import RedisBackend
+from conftest import FakeRedis
+from ratelimit import RateLimiter
+
+
+def test_concurrent_burst(run):
+    async def test(backend):
+        limiter = RateLimiter(backend, rate=0.01, burst=5)
+        results = await asyncio.gather(*(limiter.hit('u') for _ in range(6)))
+        assert results.count(True) == 5
+        assert await limiter.hit('boshqa') is True
+    run(test)
+
+
+def test_refill(run):
+    async def test(backend):
+        limiter = RateLimiter(backend, rate=20, burst=2)
+        assert [await limiter.hit('u') for _ in range(3)] == [True, True, False]
+        await asyncio.sleep(0.1)
+        assert await limiter.hit('u') is True
+    run(test)
+
+
+def test_shared_between_instances():
+    async def main():
+        server = await asyncio.start_server(FakeRedis().handle, '127.0.0.1', 0)
+        port = server.sockets[0].getsockname()[1]
+        backends = [RedisBackend(port=port), RedisBackend(port=port)]
+        limiters = [RateLimiter(backend, rate=0.01, burst=4) for backend in backends]
+        try:
+            results = await asyncio.gather(*(limiters[i % 2].hit('u') for i in range(6)))
+            assert results.count(True) == 4
+        finally:
+            for backend in backends:
+                await backend.close()
+            server.close()
+    asyncio.run(main())